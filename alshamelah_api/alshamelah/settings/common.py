@@ -60,6 +60,7 @@ INSTALLED_APPS = BASE_INSTALLED_APPS + [
     'easy_thumbnails',
 
     # Local
+    'apps.core',
     'apps.categories',
     'apps.authors',
     'apps.books',
@@ -116,9 +117,15 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 20
+    # the lists without a paginator of their own stay bare arrays, cut at MAX_PAGE_SIZE rows
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.CappedListPagination',
 }
+# the page size of the paginated list endpoints unless the view or the client asks for another one, no page (or
+# bare array) is larger than MAX_PAGE_SIZE
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 10))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+# most book pages returned by one read ahead request (/books/{id}/pages/)
+MAX_PAGE_WINDOW = int(os.environ.get("MAX_PAGE_WINDOW", 20))
 REST_REGISTRATION = {
     'REGISTER_VERIFICATION_ENABLED': True,
     'RESET_PASSWORD_VERIFICATION_ENABLED': True,
@@ -205,9 +212,50 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # keep the connection of a worker open between requests, checked before every request
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": bool(int(os.environ.get("SQL_CONN_HEALTH_CHECKS", 1))),
+        # required behind a transaction pooler (PgBouncer pool_mode=transaction), see docker-compose.prod.yml
+        "DISABLE_SERVER_SIDE_CURSORS": bool(int(os.environ.get("SQL_DISABLE_SERVER_SIDE_CURSORS", 0))),
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# CACHE_BACKEND: locmem (default, per process, no response cache), redis (shared between workers, set REDIS_URL) or
+# dummy (disabled)
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'alshamelah',
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get("REDIS_URL", "redis://localhost:6379/1"),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'IGNORE_EXCEPTIONS': True,
+        },
+    },
+    'dummy': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHES = {
+    'default': dict(CACHE_BACKENDS[CACHE_BACKEND], KEY_PREFIX='alshamelah'),
+}
+# the anonymous responses are only cached in a cache shared by all the workers, bumping a version in a locmem cache
+# would only invalidate the responses of the worker that made the change
+RESPONSE_CACHE_ENABLED = CACHE_BACKEND == 'redis'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 60 * 5))
+# run the background jobs inside the request instead of queueing them (development without a worker)
+JOB_QUEUE_EAGER = int(os.environ.get("JOB_QUEUE_EAGER", 0))
+# seconds after which a popular books board is refreshed on the job queue, the popular endpoints serve the last board
+# meanwhile (refresh_popular_books refreshes all of them)
+POPULAR_BOOKS_MAX_AGE = int(os.environ.get("POPULAR_BOOKS_MAX_AGE", 60 * 15))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -289,6 +337,8 @@ class TWILIO(object):
 
 
 FCM_API_KEY = 'AAAAX_Hhrso:APA91bHamsST7lCNdg-IQNQUiVPf9Le8oA0-9cuAYdDtg_LPXZjWlOnolVwVOfxWz8SSZUBzIlH31JnQ70Z1YrNlEBhaSXDHNR3sBIXN_gXFx6a6RVO4ePfjQNE18rscB-OAxLlgC7K_'
+# "fcm" pushes to firebase, "fake" only records the pushes (offline development)
+FCM_TRANSPORT = os.environ.get("FCM_TRANSPORT", "fcm")
 
 # Setup support for proxy headers
 USE_X_FORWARDED_HOST = True
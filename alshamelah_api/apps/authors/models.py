@@ -1,11 +1,13 @@
 from django.db import models
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from ..core.cache import ResponseCache
 from ..core.models import BaseModel
 
 
 class Author(BaseModel):
-    name = models.CharField(max_length=100, verbose_name=_(u'name'), null=False, blank=False)
+    name = models.CharField(max_length=100, verbose_name=_(u'name'), null=False, blank=False, db_index=True)
 
     class Meta:
         verbose_name_plural = "Authors"
@@ -13,3 +15,9 @@ class Author(BaseModel):
 
     def __str__(self):
         return self.name
+
+
+@receiver(models.signals.post_save, sender=Author)
+@receiver(models.signals.post_delete, sender=Author)
+def invalidate_authors_cache(sender, instance, **kwargs):
+    ResponseCache.invalidate('authors', 'books')
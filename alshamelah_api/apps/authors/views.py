@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 
+from ..core.cache import cache_anonymous_response
 from .models import Author
 from .permissions import CanManageAuthor
 from .serializers import AuthorSerializer
@@ -9,3 +10,11 @@ class AuthorViewSet(viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     permission_classes = (CanManageAuthor,)
+
+    @cache_anonymous_response('authors')
+    def list(self, request, *args, **kwargs):
+        return super(AuthorViewSet, self).list(request, *args, **kwargs)
+
+    @cache_anonymous_response('authors')
+    def retrieve(self, request, *args, **kwargs):
+        return super(AuthorViewSet, self).retrieve(request, *args, **kwargs)
@@ -4,6 +4,7 @@ from .forms import BookForm, PaperForm, BookChoiceField
 from .models import Book, Thesis, Paper, BookAudio, BookPDF
 from ..categories.models import SubCategory
 from ..core.admin import BaseModelAdmin
+from ..core.models import Job
 from ..points.services import PointsService
 from ..users.services import FCMService
 
@@ -23,12 +24,15 @@ class BookAdmin(BaseModelAdmin):
     readonly_fields = ('page_count', 'uploader',)
 
     def save_model(self, request, obj, form, change):
+        approved = obj.approved and not (change and Book.objects.filter(pk=obj.pk, approved=True).exists())
         if change:
             old = Book.objects.filter(pk=obj.pk).first()
             if not old.approved and obj.approved and old.uploader:
                 FCMService.notify_book_approved(old.uploader)
                 PointsService().book_approval_award(old.uploader, old.pk)
         super().save_model(request, obj, form, change)
+        if approved:
+            Job.objects.enqueue('books.bundle', book_id=obj.pk)
 
     def get_all_sub_categories(self):
         types = SubCategory.objects.all().order_by('name').only('id', 'name', 'category_id')
@@ -70,8 +74,10 @@ class PaperAdmin(BaseModelAdmin):
                 if not old.approved and obj.approved and old.uploader:
                     FCMService.notify_thesis_approved(old.uploader)
                     PointsService().thesis_approved_award(old.uploader, old.pk)
-
+        approved = obj.approved and not (change and Book.objects.get_all().filter(pk=obj.pk, approved=True).exists())
         super().save_model(request, obj, form, change)
+        if approved:
+            Job.objects.enqueue('books.bundle', book_id=obj.pk)
 
 
 @admin.register(BookPDF)
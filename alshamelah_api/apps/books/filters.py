@@ -1,12 +1,14 @@
 import coreapi
 import coreschema
 import django_filters
+from django.db.models import Exists, OuterRef
 from django.utils.encoding import force_str
 from django.utils.translation import ugettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 
-from .models import Book
+from .models import Book, BookPage
+from .search import ArabicSearch
 
 
 class BookFilter(django_filters.FilterSet):
@@ -14,7 +16,7 @@ class BookFilter(django_filters.FilterSet):
     sub_category = django_filters.NumberFilter()
     author = django_filters.NumberFilter()
     title = django_filters.CharFilter(lookup_expr='icontains')
-    content = django_filters.CharFilter(lookup_expr='icontains')
+    content = django_filters.CharFilter(method='filter_content')
     from_year = django_filters.NumberFilter(field_name='publish_date__year', lookup_expr='gte')
     to_year = django_filters.NumberFilter(field_name='publish_date__year', lookup_expr='lte')
 
@@ -22,6 +24,14 @@ class BookFilter(django_filters.FilterSet):
         model = Book
         fields = ['category', 'author', 'title', 'content']
 
+    def filter_content(self, queryset, name, value):
+        if not value:
+            return queryset
+        query = ArabicSearch.get_query(value)
+        if query is None:
+            return queryset.none()
+        return queryset.filter(Exists(BookPage.objects.filter(book_id=OuterRef('pk'), search_vector=query)))
+
 
 class BooksFilterBackend(DjangoFilterBackend):
     category_query_param = 'category'
@@ -221,8 +231,31 @@ BookPageParameters = [openapi.Parameter('tashkeel', openapi.IN_QUERY, descriptio
                       openapi.Parameter('page', openapi.IN_QUERY, description="Get page", required=False,
                                         type=openapi.TYPE_INTEGER, default=None), ]
 
+BookPageWindowParameters = [
+    openapi.Parameter('tashkeel', openapi.IN_QUERY, description="View with tashkeel", required=False,
+                      type=openapi.TYPE_BOOLEAN),
+    openapi.Parameter('from', openapi.IN_QUERY, description="First page of the window", required=False,
+                      type=openapi.TYPE_INTEGER, default=1),
+    openapi.Parameter('to', openapi.IN_QUERY, description="Last page of the window, at most MAX_PAGE_WINDOW pages "
+                                                          "after the first", required=False,
+                      type=openapi.TYPE_INTEGER, default=None), ]
+
+LibrarySearchParameters = [
+    openapi.Parameter('q', openapi.IN_QUERY, description="Search for words in all books", required=True,
+                      type=openapi.TYPE_STRING, default=None),
+    openapi.Parameter('tashkeel', openapi.IN_QUERY, description="Snippets with tashkeel", required=False,
+                      type=openapi.TYPE_BOOLEAN), ]
+
 BookPageSearchParameters = [
     openapi.Parameter('tashkeel', openapi.IN_QUERY, description="View with tashkeel", required=False,
                       type=openapi.TYPE_BOOLEAN),
     openapi.Parameter('word', openapi.IN_QUERY, description="Search for word in book", required=True,
                       type=openapi.TYPE_STRING, default=None), ]
+
+PopularBooksParameters = [
+    openapi.Parameter('period', openapi.IN_QUERY, description="Leaderboard period", required=False,
+                      type=openapi.TYPE_STRING, enum=['week', 'month', 'all'], default='month'), ]
+
+BookDownloadParameters = [
+    openapi.Parameter('bundle', openapi.IN_QUERY, description="Redirect to the offline bundle (zip)", required=False,
+                      type=openapi.TYPE_BOOLEAN), ]
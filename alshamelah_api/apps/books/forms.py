@@ -3,7 +3,7 @@ import json
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 
-from .models import Book, BookPDF
+from .models import Book, BookPDF, BookPage
 
 
 class BookForm(forms.ModelForm):
@@ -31,6 +31,7 @@ class BookForm(forms.ModelForm):
             self.fields['page_count'].widget.attrs['disabled'] = 'disabled'
         self.pdf_file = None
         self.file = None
+        self.pages = None
 
     def clean(self):
         file = self.cleaned_data.get('json_file', None)
@@ -42,6 +43,7 @@ class BookForm(forms.ModelForm):
                     raise forms.ValidationError(_('Invalid pages data'))
                 self.cleaned_data['content'] = pages
                 self.cleaned_data['page_count'] = len(pages)
+                self.pages = BookPage.objects.prepare(pages)
                 if 'description' not in self.cleaned_data['data'].keys() and self.cleaned_data['data']['meta'][
                     'betaka']:
                     self.cleaned_data['description'] = self.cleaned_data['data']['meta']['betaka']
@@ -64,6 +66,8 @@ class BookForm(forms.ModelForm):
                     saved.content = self.cleaned_data['content']
                     saved.page_count = len(self.cleaned_data['data']['pages'])
             saved.save()
+            if self.file and saved.content:
+                BookPage.objects.build(saved, prepared=self.pages)
             if self.pdf_file:
                 BookPDF.objects.create(url=self.pdf_file, approved=self.cleaned_data['approved'], book=saved)
         return saved
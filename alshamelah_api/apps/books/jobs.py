@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+from .models import ReadBook, ListenBook, ListenProgress, BookAudio, Book, PopularBook
+from .services import BookBundleService, BookDownloadService
+from ..core.cache import ResponseCache
+from ..core.jobs import job_handler
+from ..points.models import UserStatistics
+from ..users.models import User
+
+
+@job_handler('books.read')
+def record_reads(payloads):
+    """
+    Applies the page turns of the batch in order, the reading position and the statistics of every user and book are
+    written once
+    """
+    reads = OrderedDict()
+    for payload in payloads:
+        # a read ahead window is recorded as its pages read in order
+        reads.setdefault((payload['user_id'], payload['book_id']), []).extend(payload.get('pages', None) or
+                                                                              [payload['page']])
+    finished_users = set()
+    for (user_id, book_id), pages in reads.items():
+        reading, created = ReadBook.objects.get_or_create(book_id=book_id, user_id=user_id,
+                                                          defaults={'page': pages[0]})
+        turns = pages[1:] if created else pages
+        if turns:
+            for page in turns:
+                reading.finished = reading.page == page - 1
+                reading.page = page
+            reading.save()
+            if reading.finished:
+                finished_users.add(user_id)
+        UserStatistics.objects.read(user_id, book_id, *pages)
+    for user_id in finished_users:
+        UserStatistics.objects.update_finished_read(user_id)
+
+
+@job_handler('books.listen')
+def record_listens(payloads):
+    """
+    Applies the listening progress of the batch, the listening statistics of every user are moved once by the
+    summed changes of the listen rollups
+    """
+    listens = OrderedDict()
+    completed = OrderedDict()
+    for payload in payloads:
+        listen = listens.setdefault(payload['user_id'], {'book_ids': [], 'minutes': 0, 'books': 0})
+        if payload['book_id'] not in listen['book_ids']:
+            listen['book_ids'].append(payload['book_id'])
+        listen['minutes'] += payload.get('minutes', 0)
+        listen['books'] += payload.get('started', 0)
+        if payload.get('completed'):
+            completed[(payload['user_id'], payload['book_id'])] = True
+    for user_id, listen in listens.items():
+        UserStatistics.objects.listen(user_id, listen['book_ids'], minutes=listen['minutes'], books=listen['books'])
+    finished_users = set()
+    for user_id, book_id in completed.keys():
+        audio_ids = set(BookAudio.objects.filter(book_id=book_id, approved=True).values_list('id', flat=True))
+        listened = set(ListenProgress.objects.filter(listen__user_id=user_id, audio_id__in=audio_ids,
+                                                     progress__gte=100).values_list('audio_id', flat=True))
+        if audio_ids - listened:
+            continue
+        ListenBook.objects.filter(user_id=user_id, book_id=book_id).update(finished=True)
+        finished_users.add(user_id)
+    for user in User.objects.filter(pk__in=finished_users):
+        UserStatistics.objects.update_finished_listen(user)
+
+
+@job_handler('books.bundle')
+def build_bundles(payloads):
+    """
+    Builds the offline bundle of every book of the batch once, the books unapproved meanwhile are skipped
+    """
+    books = Book.objects.get_all().filter(pk__in=set(payload['book_id'] for payload in payloads), approved=True) \
+        .defer('content', 'data').select_related('author', 'category', 'sub_category')
+    for book in books:
+        BookBundleService(book).build()
+
+
+@job_handler('books.download')
+def build_downloads(payloads):
+    """
+    Builds the compressed download artifacts of the batch, a book changed since its download was requested is left to
+    its next download
+    """
+    books = Book.objects.get_all().filter(pk__in=set(payload['book_id'] for payload in payloads)) \
+        .defer('content', 'data').in_bulk()
+    for payload in payloads:
+        book = books.get(payload['book_id'], None)
+        if book is None:
+            continue
+        service = BookDownloadService(book, payload['metadata'])
+        if service.version == payload['version']:
+            service.build(payload['base_url'])
+
+
+@job_handler('books.popular')
+def refresh_popular_books(payloads):
+    """
+    Refreshes every popular books board of the batch once
+    """
+    for kind, period in OrderedDict.fromkeys((payload['kind'], payload['period']) for payload in payloads):
+        PopularBook.objects.refresh(kind, period)
+    ResponseCache.invalidate('books')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from pyarabic.araby import strip_tashkeel
+
+from ...models import Book, BookPage
+from ....core.benchmark import measure
+
+
+class Command(BaseCommand):
+    help = 'Compares the CPU time per request of stripping tashkeel on the fly against serving the stored pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, help='Book id (defaults to the book with the most pages)')
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        books = Book.objects.get_all().exclude(content__isnull=True)
+        book = books.filter(pk=options['book']).first() if options['book'] else \
+            books.exclude(page_count__isnull=True).order_by('-page_count').first()
+        if not book or not book.content:
+            raise CommandError('No book with content to benchmark')
+        iterations = max(options['iterations'], 1)
+        page = max(len(book.content) // 2, 1)
+
+        def on_the_fly_book():
+            content = Book.objects.get_all().only('content').get(pk=book.pk).content
+            return [dict(item, text=strip_tashkeel(item.get('text', None) or '')) for item in content]
+
+        def stored_book():
+            return [item.as_dict(with_tashkeel=False) for item in BookPage.objects.filter(book_id=book.pk)]
+
+        def on_the_fly_page():
+            content = Book.objects.get_all().only('content').get(pk=book.pk).content
+            return strip_tashkeel(content[page - 1].get('text', None) or '')
+
+        def stored_page():
+            return BookPage.objects.get_page(book.pk, page).get_text(with_tashkeel=False)
+
+        self.stdout.write('Book {book}: {pages} pages, {iterations} iterations'.format(
+            book=book.pk, pages=len(book.content), iterations=iterations))
+        for name, before, after in [('download without tashkeel', on_the_fly_book, stored_book),
+                                    ('view page without tashkeel', on_the_fly_page, stored_page)]:
+            before_time = measure(before, iterations)
+            after_time = measure(after, iterations)
+            self.stdout.write('{name}: {before:.2f} ms -> {after:.2f} ms CPU per request'.format(
+                name=name, before=before_time, after=after_time))
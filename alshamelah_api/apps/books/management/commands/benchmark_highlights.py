@@ -0,0 +1,80 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from pyarabic.araby import strip_tashkeel
+
+from ...models import BookPage, BookNote
+from ...tashkeel import TashkeelOffsets
+from ...util import ArabicUtilities
+from ....core.benchmark import measure
+
+
+class Command(BaseCommand):
+    help = 'Compares the CPU time of highlighting a page with hundreds of notes by inserting marks one note at a ' \
+           'time against rendering the sorted spans in one pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, help='Book whose page is highlighted (defaults to a generated page)')
+        parser.add_argument('--page', type=int, default=1)
+        parser.add_argument('--notes', default='10,100,500,1000', help='Numbers of notes on the page to compare')
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['book']:
+            book_page = BookPage.objects.get_page(options['book'], options['page'])
+            if not book_page or not book_page.text:
+                raise CommandError('The page has no text to highlight')
+            text = book_page.text
+        else:
+            text = ' '.join(['بِسْمِ اللَّهِ الرَّحْمَنِ الرَّحِيمِ'] * 200)
+        plain = strip_tashkeel(text)
+        offsets = TashkeelOffsets.from_text(text)
+        iterations = max(options['iterations'], 1)
+        self.stdout.write('Page of {length} characters ({plain} without tashkeel), {iterations} iterations'.format(
+            length=len(text), plain=len(plain), iterations=iterations))
+        for count in [int(count) for count in options['notes'].split(',') if count.strip()]:
+            notes = self.generate_notes(text, offsets, count, options['page'])
+            for name, with_tashkeel, page_text in [('with tashkeel', True, text), ('without tashkeel', False, plain)]:
+                before = measure(lambda: self.insert_marks(notes, text, options['page'], with_tashkeel), iterations)
+                after = measure(lambda: ArabicUtilities.get_highlighted_text(
+                    notes, page_text, options['page'], offsets if with_tashkeel else None), iterations)
+                self.stdout.write('{count} notes {name}: {before:.2f} ms -> {after:.2f} ms CPU per page'.format(
+                    count=count, name=name, before=before, after=after))
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    @staticmethod
+    def generate_notes(text, offsets, count, page):
+        """
+        Random notes and highlights on the page, some of them overlapping
+        """
+        notes = []
+        for _ in range(count):
+            tashkeel_start = random.randint(1, max(len(text) - 1, 1))
+            tashkeel_end = min(tashkeel_start + random.randint(1, 60), len(text))
+            notes.append(BookNote(page=page, start=offsets.to_plain(tashkeel_start),
+                                  end=offsets.to_plain(tashkeel_end), tashkeel_start=tashkeel_start,
+                                  tashkeel_end=tashkeel_end, note='note' if random.random() < 0.5 else None))
+        return notes
+
+    @staticmethod
+    def insert_marks(notes, text, page, with_tashkeel):
+        """
+        The previous highlighting, one slice and copy of the page per mark
+        """
+        added = []
+        if not with_tashkeel:
+            text = strip_tashkeel(text)
+        for note in notes:
+            if note.page != page or not note.end or note.start is None or note.start < 0:
+                continue
+            start, end = (note.tashkeel_start, note.tashkeel_end) if with_tashkeel else (note.start, note.end)
+            mark_start = ArabicUtilities.note_start_mark if note.note else ArabicUtilities.start_mark
+            start = start - 1 + sum([len(mark) for mark in added])
+            text = text[:start] + mark_start + text[start:]
+            added.append(mark_start)
+            end = end - 1 + sum([len(mark) for mark in added])
+            text = text[:end] + ArabicUtilities.end_mark + text[end:]
+            added.append(ArabicUtilities.end_mark)
+        return text.replace(ArabicUtilities.end_mark, ArabicUtilities.tag_end) \
+            .replace(ArabicUtilities.note_start_mark, ArabicUtilities.note_tag_start) \
+            .replace(ArabicUtilities.start_mark, ArabicUtilities.highlight_tag_start)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Book, BookPage
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per page storage (text with and without tashkeel) of books from their json content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, nargs='*', help='Only rebuild these book ids')
+        parser.add_argument('--missing', action='store_true',
+                            help='Only build the books without (complete) page rows')
+
+    def handle(self, *args, **options):
+        books = Book.objects.get_all().exclude(content__isnull=True).only('id', 'content')
+        if options['book']:
+            books = books.filter(pk__in=options['book'])
+        if options['missing']:
+            books = books.filter(pk__in=list(BookPage.objects.get_missing_books()))
+        count = 0
+        for book in books.iterator():
+            pages = BookPage.objects.build(book)
+            count += 1
+            self.stdout.write('{book}: {pages} pages'.format(book=book.id, pages=len(pages)))
+        self.stdout.write(self.style.SUCCESS('Rebuilt pages of {count} books'.format(count=count)))
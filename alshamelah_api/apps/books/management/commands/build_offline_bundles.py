@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Book
+from ...services import BookBundleService, BookDownloadService
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the offline bundles of the approved books, papers and theses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, nargs='*', help='Only build these book ids')
+        parser.add_argument('--prune', action='store_true',
+                            help='Also remove the outdated bundles and compressed downloads')
+        parser.add_argument('--max-age', type=float, default=24,
+                            help='Hours an outdated file is kept after it was written, downloads may still use it')
+
+    def handle(self, *args, **options):
+        books = Book.objects.get_all().filter(approved=True).defer('content', 'data') \
+            .select_related('author', 'category', 'sub_category')
+        if options['book']:
+            books = books.filter(pk__in=options['book'])
+        count = 0
+        removed = 0
+        for book in books.iterator():
+            bundle = BookBundleService(book)
+            path = bundle.build()
+            count += 1
+            self.stdout.write('{book}: {path}'.format(book=book.id, path=path))
+            if options['prune']:
+                max_age = options['max_age'] * 3600
+                removed += len(bundle.prune(max_age)) + len(BookDownloadService(book, None).prune(max_age))
+        self.stdout.write(self.style.SUCCESS('Built offline bundles of {count} books'.format(count=count)))
+        if options['prune']:
+            self.stdout.write(self.style.SUCCESS('Removed {removed} outdated files'.format(removed=removed)))
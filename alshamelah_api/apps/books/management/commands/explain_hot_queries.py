@@ -0,0 +1,57 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...models import ReadBook, DownloadBook, ListenBook, FavoriteBook, BookReview, BookMark, BookNote, PopularBook
+
+
+class Command(BaseCommand):
+    help = 'Captures the query plans (EXPLAIN ANALYZE on postgres) of the per user book lookups and the popularity ' \
+           'counts, run it before and after migrating the indexes to compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='User of the lookups (defaults to the latest reader)')
+        parser.add_argument('--book', type=int, help='Book of the lookups (defaults to the latest read book)')
+        parser.add_argument('--page', type=int, default=1, help='Page whose notes are looked up')
+        parser.add_argument('--output', help='File the plans are written to')
+
+    def handle(self, *args, **options):
+        user_id, book_id = options['user'], options['book']
+        if user_id is None or book_id is None:
+            reading = ReadBook.objects.order_by('-pk').values('user_id', 'book_id').first()
+            if not reading:
+                raise CommandError('No reads yet, give a --user and a --book')
+            user_id = reading['user_id'] if user_id is None else user_id
+            book_id = reading['book_id'] if book_id is None else book_id
+        analyze = connection.vendor == 'postgresql'
+        lines = []
+        for name, queryset in self.get_queries(user_id, book_id, options['page']):
+            plan = queryset.explain(analyze=True) if analyze else queryset.explain()
+            timing = re.search(r'Execution Time: ([\d.]+) ms', plan)
+            self.stdout.write('{name:20} {timing}'.format(
+                name=name, timing=timing.group(1) + ' ms' if timing else plan.splitlines()[0][:80]))
+            lines += ['-- ' + name, str(queryset.query), plan, '']
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write('\n'.join(lines))
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    @staticmethod
+    def get_queries(user_id, book_id, page):
+        """
+        The hot lookups as the views, serializers and jobs run them
+        """
+        lookup = {'user_id': user_id, 'book_id': book_id}
+        month = PopularBook.objects.get_period_start('month')
+        return [
+            ('read progress', ReadBook.objects.filter(**lookup).order_by('pk')[:1]),
+            ('download', DownloadBook.objects.filter(**lookup).order_by('pk')[:1]),
+            ('listen', ListenBook.objects.filter(**lookup).order_by('pk')[:1]),
+            ('favorite', FavoriteBook.objects.filter(**lookup).order_by('pk')[:1]),
+            ('user rating', BookReview.objects.filter(**lookup).order_by('pk')[:1]),
+            ('bookmark', BookMark.objects.filter(**lookup).order_by('pk')[:1]),
+            ('page notes', BookNote.objects.filter(page=page, **lookup)),
+            ('window notes', BookNote.objects.filter(page__gte=page, page__lte=page + 19, **lookup)),
+        ] + [('monthly ' + kind, PopularBook.objects.get_counts(kind, month)[:PopularBook.objects.board_size])
+             for kind in PopularBook.objects.kinds]
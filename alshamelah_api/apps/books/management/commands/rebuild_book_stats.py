@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import BookStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized book stats from the activity tables, or checks them for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, nargs='*', help='Only rebuild / check these book ids')
+        parser.add_argument('--check', action='store_true', help='Report the drifted stats without rebuilding')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = BookStats.objects.check_drift(options['book'])
+            for book_id, field, stored, actual in drift:
+                self.stdout.write('{book}: {field} is {stored}, expected {actual}'.format(
+                    book=book_id, field=field, stored=stored, actual=actual))
+            if drift:
+                raise CommandError('Found {count} drifted stats'.format(count=len(drift)))
+            self.stdout.write(self.style.SUCCESS('Book stats are up to date'))
+            return
+        stats = BookStats.objects.rebuild(options['book'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt stats of {count} books'.format(count=len(stats))))
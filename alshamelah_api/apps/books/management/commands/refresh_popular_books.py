@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from ...models import PopularBook
+from ....core.cache import ResponseCache
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the popular books leaderboards of the current week, month and all time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Delete the leaderboards of finished periods')
+
+    def handle(self, *args, **options):
+        for (kind, period), count in PopularBook.objects.refresh_all().items():
+            self.stdout.write('{kind} / {period}: {count} books'.format(kind=kind, period=period, count=count))
+        if options['prune']:
+            self.stdout.write('Pruned {count} rows'.format(count=PopularBook.objects.prune()))
+        ResponseCache.invalidate('books')
+        self.stdout.write(self.style.SUCCESS('Refreshed popular books'))
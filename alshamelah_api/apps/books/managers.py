@@ -1,4 +1,16 @@
-from django.db import models
+import datetime
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchRank
+from django.core.cache import cache
+from django.db import models, transaction, connection
+from django.db.models import F, Avg, Count, Sum, Max, Exists, OuterRef, Subquery, Prefetch, IntegerField, FloatField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from pyarabic.araby import strip_tashkeel
+
+from .search import ArabicSearch
+from .tashkeel import TashkeelOffsets
 
 
 class BookAudioManager(models.Manager):
@@ -13,7 +25,73 @@ class BookPDFManager(models.Manager):
             type='pdf')
 
 
-class BookManager(models.Manager):
+class BookQuerySet(models.QuerySet):
+    def with_list_stats(self, user=None):
+        """
+        Annotates the counters used by the book list serializers from the book stats table, so listing books costs a
+        constant number of queries
+        """
+        from .models import BookReview, FavoriteBook
+        queryset = self.select_related('category', 'sub_category', 'author').annotate(
+            avg_rate=F('stats__rating_avg'),
+            review_count=Coalesce(F('stats__review_count'), 0),
+            read_count=Coalesce(F('stats__read_count'), 0),
+            download_count=Coalesce(F('stats__download_count'), 0),
+            listen_count=Coalesce(F('stats__listen_count'), 0),
+            has_audio=Coalesce(F('stats__has_audio'), False),
+            pdf_url=F('stats__pdf_url'),
+        )
+        if user is not None and user.id:
+            queryset = queryset.annotate(
+                favorite_id=Subquery(FavoriteBook.objects.filter(book_id=OuterRef('pk'), user_id=user.id)
+                                     .order_by('pk').values('pk')[:1])
+            ).prefetch_related(Prefetch('reviews', queryset=BookReview.objects.filter(user_id=user.id).order_by('pk'),
+                                        to_attr='user_reviews'))
+        return queryset
+
+    # the activity model of every library section and the time of its latest activity, a reading or listening row
+    # is updated as the user goes on while a download or favorite happens once
+    library_sections = {
+        'reads': ('ReadBook', 'last_update_time'),
+        'listens': ('ListenBook', 'last_update_time'),
+        'downloads': ('DownloadBook', 'creation_time'),
+        'favorites': ('FavoriteBook', 'creation_time'),
+    }
+
+    def in_library(self, user, section):
+        """
+        The books of one section of the user library, once each and latest activity first
+        """
+        from django.apps import apps
+        model_name, time_field = self.library_sections[section]
+        activities = apps.get_model('books', model_name).objects.filter(user_id=user.id)
+        return self.filter(pk__in=activities.values('book_id')).annotate(
+            activity_time=Subquery(activities.filter(book_id=OuterRef('pk')).order_by('-' + time_field)
+                                   .values(time_field)[:1])
+        ).order_by(F('activity_time').desc(nulls_last=True), F('pk').desc())
+
+    def with_user_progress(self, user=None):
+        """
+        Annotates the reading position and the listening progress rollup of the user used by
+        UserBookListSerializer, in the same query as the books
+        """
+        from .models import ReadBook, ListenBook, BookMedia
+        if user is None or not user.id:
+            return self
+        return self.annotate(
+            read_page=Subquery(ReadBook.objects.filter(book_id=OuterRef('pk'), user_id=user.id)
+                               .order_by('-last_update_time').values('page')[:1]),
+            listen_progress_sum=Coalesce(Subquery(
+                ListenBook.objects.filter(book_id=OuterRef('pk'), user_id=user.id).order_by('pk')
+                .values('progress_sum')[:1], output_field=IntegerField()), 0),
+            audio_file_count=Coalesce(Subquery(
+                BookMedia.objects.filter(book_id=OuterRef('pk'), type='audio', approved=True)
+                .values('book_id').annotate(count=Count('pk')).values('count')[:1],
+                output_field=IntegerField()), 0),
+        )
+
+
+class BookManager(models.Manager.from_queryset(BookQuerySet)):
     def get_queryset(self):
         return super(BookManager, self).get_queryset().filter(
             type='book')
@@ -32,3 +110,309 @@ class ThesisManager(models.Manager):
     def get_queryset(self):
         return super(ThesisManager, self).get_queryset().filter(
             type='thesis')
+
+
+class BookPageManager(models.Manager):
+    def prepare(self, pages):
+        """
+        Builds the (unsaved) page rows of json pages, computing the text variants once at ingest
+        """
+        return [self.model(number=number,
+                           volume=self._to_int(page.get('vol', None)),
+                           source_page=self._to_int(page.get('page', None)),
+                           text=page.get('text', None) or '',
+                           text_no_tashkeel=strip_tashkeel(page.get('text', None) or ''),
+                           tashkeel_offsets=TashkeelOffsets.from_text(page.get('text', None)).to_bytes(),
+                           search_vector=ArabicSearch.get_vector(page.get('text', None)))
+                for number, page in enumerate(pages or [], start=1)]
+
+    def build(self, book, pages=None, prepared=None):
+        """
+        Rebuilds the page rows of the book from its json content, the given pages or already prepared rows
+        """
+        if prepared is None:
+            prepared = self.prepare(book.content if pages is None else pages)
+        from .models import Book
+        with transaction.atomic():
+            self.filter(book_id=book.id).delete()
+            for page in prepared:
+                page.book_id = book.id
+            Book.objects.get_all().filter(pk=book.id).update(download_version=None)
+            return self.bulk_create(prepared, batch_size=500)
+
+    def get_missing_books(self):
+        """
+        Ids of the books with content but without (complete) page rows
+        """
+        from .models import Book
+        incomplete = self.filter(models.Q(text_no_tashkeel='') & ~models.Q(text='') |
+                                 models.Q(tashkeel_offsets__isnull=True)).values('book_id')
+        return Book.objects.get_all().exclude(content__isnull=True).filter(
+            models.Q(book_pages__isnull=True) | models.Q(pk__in=incomplete)).values_list('pk', flat=True).distinct()
+
+    def get_page(self, book_id, number):
+        return self.filter(book_id=book_id, number=number).first()
+
+    def get_window(self, book_id, first, last, with_tashkeel=True):
+        """
+        The pages first to last of the book, loading only the text variant (and offsets) they are read with
+        """
+        deferred = ['search_vector', 'text_no_tashkeel'] if with_tashkeel else ['search_vector', 'text',
+                                                                               'tashkeel_offsets']
+        return self.filter(book_id=book_id, number__gte=first, number__lte=last).defer(*deferred).order_by('number')
+
+    def search(self, text, book_id=None):
+        """
+        Full text search over the normalized pages, ranked by relevance
+        """
+        query = ArabicSearch.get_query(text)
+        if query is None:
+            return self.none()
+        pages = self.filter(search_vector=query)
+        if book_id is not None:
+            pages = pages.filter(book_id=book_id)
+        return pages.annotate(rank=SearchRank(F('search_vector'), query))
+
+    @staticmethod
+    def _to_int(value):
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+
+class BookStatsManager(models.Manager):
+    counters = ['read_count', 'download_count', 'listen_count', 'review_count', 'rating_sum']
+    fields = counters + ['rating_avg', 'has_audio', 'pdf_url']
+
+    def get_source(self):
+        """
+        Book queryset annotated with the stats computed from the activity tables
+        """
+        from .models import Book, BookReview, ReadBook, DownloadBook, ListenBook, BookMedia
+        return Book.objects.get_all().order_by().annotate(
+            read_count=self._aggregate(ReadBook, Count('pk'), 0),
+            download_count=self._aggregate(DownloadBook, Count('pk'), 0),
+            listen_count=self._aggregate(ListenBook, Count('pk'), 0),
+            review_count=self._aggregate(BookReview, Count('pk'), 0),
+            rating_sum=self._aggregate(BookReview, Sum('rating'), 0),
+            rating_avg=self._aggregate(BookReview, Avg('rating'), output_field=FloatField()),
+            has_audio=Exists(BookMedia.objects.filter(book_id=OuterRef('pk'), approved=True, type='audio')),
+            pdf_url=Subquery(BookMedia.objects.filter(book_id=OuterRef('pk'), approved=True, type='pdf')
+                             .order_by('pk').values('url')[:1]),
+        ).values('pk', *self.fields)
+
+    def increment(self, book_id, field, delta=1):
+        if not self.filter(book_id=book_id).update(**{field: Greatest(F(field) + delta, 0)}) and delta > 0:
+            self.refresh(book_id)
+
+    def refresh(self, book_id):
+        stats = self.get_source().filter(pk=book_id).first()
+        if stats is None:
+            return None
+        stats.pop('pk')
+        return self.update_or_create(book_id=book_id, defaults=stats)[0]
+
+    def refresh_reviews(self, book_id, create=True):
+        from .models import BookReview
+        reviews = BookReview.objects.filter(book_id=book_id).aggregate(review_count=Count('pk'),
+                                                                       rating_sum=Sum('rating'),
+                                                                       rating_avg=Avg('rating'))
+        reviews['rating_sum'] = reviews['rating_sum'] or 0
+        if not self.filter(book_id=book_id).update(**reviews) and create:
+            self.refresh(book_id)
+
+    def refresh_media(self, book_id, create=True):
+        from .models import BookMedia
+        media = BookMedia.objects.filter(book_id=book_id, approved=True)
+        pdf = media.filter(type='pdf').order_by('pk').values_list('url', flat=True).first()
+        if not self.filter(book_id=book_id).update(has_audio=media.filter(type='audio').exists(), pdf_url=pdf) \
+                and create:
+            self.refresh(book_id)
+
+    def rebuild(self, book_ids=None):
+        """
+        Recomputes the stats of all books (or the given ones) from the activity tables
+        """
+        source = self.get_source()
+        if book_ids:
+            source = source.filter(pk__in=book_ids)
+        with transaction.atomic():
+            (self.filter(book_id__in=book_ids) if book_ids else self.all()).delete()
+            return self.bulk_create([self.model(book_id=stats.pop('pk'), **stats) for stats in source.iterator()],
+                                    batch_size=500)
+
+    def check_drift(self, book_ids=None):
+        """
+        Returns (book id, field, stored value, actual value) for every stored stat that differs from the activity tables
+        """
+        source = self.get_source()
+        if book_ids:
+            source = source.filter(pk__in=book_ids)
+        stored = {stats['book_id']: stats for stats in self.filter(book_id__in=source.values('pk'))
+            .values('book_id', *self.fields).iterator()}
+        drift = []
+        for actual in source.iterator():
+            stats = stored.get(actual['pk'], None)
+            for field in self.fields:
+                value = stats[field] if stats else None
+                if field == 'rating_avg' and value is not None and actual[field] is not None:
+                    if abs(value - actual[field]) < 0.001:
+                        continue
+                if value != actual[field]:
+                    drift.append((actual['pk'], field, value, actual[field]))
+        return drift
+
+    @staticmethod
+    def _aggregate(model, aggregate, default=None, output_field=None):
+        value = Subquery(model.objects.filter(book_id=OuterRef('pk')).order_by().values('book_id')
+                         .annotate(value=aggregate).values('value'), output_field=output_field or IntegerField())
+        return Coalesce(value, default) if default is not None else value
+
+
+class PopularBookManager(models.Manager):
+    board_size = 1000
+    # activity model name and book stats counter of each kind
+    kinds = {
+        'reads': ('ReadBook', 'read_count'),
+        'listens': ('ListenBook', 'listen_count'),
+        'downloads': ('DownloadBook', 'download_count'),
+    }
+    periods = ['week', 'month', 'all']
+    # period start of the all time boards, never null so the unique (kind, period, period_start, rank) holds for them
+    all_time_start = datetime.date(1970, 1, 1)
+
+    @classmethod
+    def get_period_start(cls, period, today=None):
+        today = today or timezone.now().date()
+        if period == 'week':
+            return today - datetime.timedelta(days=today.weekday())
+        if period == 'month':
+            return today.replace(day=1)
+        return cls.all_time_start
+
+    def get_board(self, kind, period, today=None):
+        return self.filter(kind=kind, period=period, period_start=self.get_period_start(period, today))
+
+    def get_books(self, kind, period, today=None):
+        """
+        Approved books of the leaderboard annotated with their rank. A missing or outdated board is refreshed on the job
+        queue, the last board built (of the previous period at the start of a period) is served until then
+        """
+        from .models import Book
+        start = self.get_period_start(period, today)
+        refreshed = self.get_board(kind, period, today).aggregate(time=Max('last_update_time'))['time']
+        if refreshed is None or refreshed < timezone.now() - datetime.timedelta(seconds=settings.POPULAR_BOOKS_MAX_AGE):
+            self.schedule_refresh(kind, period)
+        if refreshed is None:
+            start = self.filter(kind=kind, period=period, period_start__lt=start) \
+                .aggregate(start=Max('period_start'))['start']
+        books = Book.objects.filter(approved=True, popularity__kind=kind, popularity__period=period,
+                                    popularity__period_start=start)
+        return books.annotate(rank=F('popularity__rank'), activity_count=F('popularity__count')).order_by('rank')
+
+    def schedule_refresh(self, kind, period):
+        """
+        Enqueues the refresh of the board once per POPULAR_BOOKS_MAX_AGE, whatever the number of requests asking for it
+        """
+        from ..core.models import Job
+        if cache.add('popular-books-refresh:{kind}:{period}'.format(kind=kind, period=period), True,
+                     timeout=settings.POPULAR_BOOKS_MAX_AGE):
+            Job.objects.enqueue('books.popular', kind=kind, period=period)
+
+    def get_counts(self, kind, start=None):
+        """
+        (book_id, count) of the approved books by activity since the start, or all time, the most active first
+        """
+        from django.apps import apps
+        from .models import BookStats
+        model_name, counter = self.kinds[kind]
+        if start is None:
+            return BookStats.objects.filter(book__approved=True, book__type='book', **{counter + '__gt': 0}) \
+                .order_by('-' + counter, 'book_id').values_list('book_id', counter)
+        # a range on creation_time (not its date) so the (book, creation_time) index is used
+        since = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+        return apps.get_model('books', model_name).objects \
+            .filter(book__approved=True, book__type='book', creation_time__gte=since).order_by() \
+            .values('book_id').annotate(activity_count=Count('pk')) \
+            .order_by('-activity_count', 'book_id').values_list('book_id', 'activity_count')
+
+    def refresh(self, kind, period, today=None):
+        """
+        Brings the leaderboard of the current period up to date, finished periods are never recomputed. Only the ranks
+        whose book or count changed are written, the refreshes of a board are serialized
+        """
+        start = self.get_period_start(period, today)
+        counts = self.get_counts(kind, None if period == 'all' else start)
+        with transaction.atomic():
+            self.lock_board(kind, period)
+            board = self.get_board(kind, period, today)
+            current = {row.rank: row for row in board}
+            changed = []
+            created = []
+            ranks = list(enumerate(counts[:self.board_size], start=1))
+            for rank, (book_id, count) in ranks:
+                row = current.get(rank, None)
+                if row is None:
+                    created.append(self.model(book_id=book_id, kind=kind, period=period, period_start=start,
+                                              rank=rank, count=count))
+                elif (row.book_id, row.count) != (book_id, count):
+                    row.book_id, row.count = book_id, count
+                    changed.append(row)
+            board.filter(rank__gt=len(ranks)).delete()
+            self.bulk_update(changed, ['book', 'count'], batch_size=500)
+            self.bulk_create(created, batch_size=500)
+            # the time of the refresh, the age of the board
+            board.update(last_update_time=timezone.now())
+        return len(ranks)
+
+    @staticmethod
+    def lock_board(kind, period):
+        """
+        Holds a transaction level lock on the board until the transaction ends, sqlite already serializes its writers
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                               ['books_popularbook:{kind}:{period}'.format(kind=kind, period=period)])
+
+    def refresh_all(self, today=None):
+        return {(kind, period): self.refresh(kind, period, today) for kind in self.kinds for period in self.periods}
+
+    def prune(self, today=None):
+        """
+        Deletes the leaderboards of finished periods
+        """
+        deleted = 0
+        for period in self.periods:
+            if period != 'all':
+                start = self.get_period_start(period, today)
+                deleted += self.filter(period=period, period_start__lt=start).delete()[0]
+        return deleted
+
+
+class ListenProgressManager(models.Manager):
+    def record(self, listen, audio, progress):
+        """
+        Stores the progress of one audio file and moves the rollup of the listen (summed progress and minutes) by the
+        difference, returns the change of the listened minutes and whether the book started (1) or stopped (-1)
+        being listened
+        """
+        from .models import ListenBook
+        with transaction.atomic():
+            rollup = ListenBook.objects.select_for_update().values('progress_sum', 'minutes_listened') \
+                .get(pk=listen.pk)
+            file_progress, created = self.select_for_update().get_or_create(listen=listen, audio=audio,
+                                                                            defaults={'progress': progress})
+            change = (progress or 0) - (0 if created else file_progress.progress or 0)
+            if not created:
+                file_progress.progress = progress
+                file_progress.save(update_fields=['progress', 'last_update_time'])
+            if not change:
+                return file_progress, 0, 0
+            minutes = rollup['minutes_listened'] + change * float(audio.duration or 0) / 100
+            progress_sum = rollup['progress_sum'] + change
+            ListenBook.objects.filter(pk=listen.pk).update(progress_sum=progress_sum, minutes_listened=minutes,
+                                                           last_update_time=timezone.now())
+        started = (progress_sum > 0) - (rollup['progress_sum'] > 0)
+        return file_progress, int(minutes) - int(rollup['minutes_listened']), started
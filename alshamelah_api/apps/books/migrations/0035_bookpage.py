@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_pages(apps, schema_editor):
+    from pyarabic.araby import strip_tashkeel
+
+    def to_int(value):
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    book_model = apps.get_model("books", "Book")
+    page_model = apps.get_model("books", "BookPage")
+    for book in book_model.objects.exclude(content__isnull=True).only('id', 'content').iterator():
+        if not book.content:
+            continue
+        page_model.objects.bulk_create([page_model(book_id=book.id,
+                                                   number=number,
+                                                   volume=to_int(page.get('vol', None)),
+                                                   source_page=to_int(page.get('page', None)),
+                                                   text=page.get('text', None) or '',
+                                                   text_no_tashkeel=strip_tashkeel(page.get('text', None) or ''))
+                                        for number, page in enumerate(book.content, start=1)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0034_auto_20200716_0353'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_update_time', models.DateTimeField(auto_now=True, null=True)),
+                ('number', models.PositiveIntegerField(verbose_name='Page number')),
+                ('volume', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Volume')),
+                ('source_page', models.PositiveIntegerField(blank=True, null=True, verbose_name='Source page')),
+                ('text', models.TextField(blank=True, default='', verbose_name='Text')),
+                ('text_no_tashkeel', models.TextField(blank=True, default='', verbose_name='Text without tashkeel')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='book_pages', to='books.Book', verbose_name='Book')),
+            ],
+            options={
+                'ordering': ['book_id', 'number'],
+                'unique_together': {('book', 'number')},
+            },
+        ),
+        migrations.RunPython(build_pages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+import re
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Value, TextField
+
+# the normalization and stemming of ArabicSearch when the pages were first indexed, kept here so that replaying the
+# migration always builds the same vectors
+normalization_table = str.maketrans({
+    u'آ': u'ا',  # alef with madda
+    u'أ': u'ا',  # alef with hamza above
+    u'إ': u'ا',  # alef with hamza below
+    u'ٱ': u'ا',  # alef wasla
+    u'ؤ': u'و',  # waw with hamza
+    u'ئ': u'ي',  # yeh with hamza
+    u'ى': u'ي',  # alef maksura
+    u'ة': u'ه',  # teh marbuta
+    u'ـ': None,  # tatweel
+})
+article_prefixes = (u'وال', u'فال', u'بال', u'كال', u'لل', u'ال')
+unstemmed_words = (u'الله', u'اللهم')
+min_stem_length = 2
+word_pattern = re.compile(r'\w+', re.UNICODE)
+
+
+def stem(word):
+    if word in unstemmed_words:
+        return word
+    for prefix in article_prefixes:
+        if word.startswith(prefix) and len(word) - len(prefix) >= min_stem_length:
+            return word[len(prefix):]
+    return word
+
+
+def get_document(text):
+    from pyarabic.araby import strip_tashkeel
+
+    normalized = strip_tashkeel(text).translate(normalization_table) if text else ''
+    return ' '.join(stem(word) for word in word_pattern.findall(normalized))
+
+
+def build_search_vectors(apps, schema_editor):
+    page_model = apps.get_model("books", "BookPage")
+    book_ids = page_model.objects.values_list('book_id', flat=True).distinct()
+    for book_id in book_ids.iterator():
+        pages = list(page_model.objects.filter(book_id=book_id).only('id', 'text'))
+        for page in pages:
+            page.search_vector = SearchVector(Value(get_document(page.text), output_field=TextField()),
+                                              config='simple')
+        page_model.objects.bulk_update(pages, ['search_vector'], batch_size=200)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0035_bookpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bookpage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='books_bookpage_search_gin'),
+        ),
+        migrations.RunPython(build_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def build_stats(apps, schema_editor):
+    book_model = apps.get_model("books", "Book")
+    media_model = apps.get_model("books", "BookMedia")
+    stats_model = apps.get_model("books", "BookStats")
+
+    def aggregate(model_name, value, default=None):
+        subquery = Subquery(apps.get_model("books", model_name).objects.filter(book_id=OuterRef('pk')).order_by()
+                            .values('book_id').annotate(value=value).values('value'))
+        return Coalesce(subquery, default) if default is not None else subquery
+
+    books = book_model.objects.order_by().annotate(
+        stats_read_count=aggregate('ReadBook', Count('pk'), 0),
+        stats_download_count=aggregate('DownloadBook', Count('pk'), 0),
+        stats_listen_count=aggregate('ListenBook', Count('pk'), 0),
+        stats_review_count=aggregate('BookReview', Count('pk'), 0),
+        stats_rating_sum=aggregate('BookReview', Sum('rating'), 0),
+        stats_rating_avg=aggregate('BookReview', Avg('rating')),
+        stats_has_audio=Exists(media_model.objects.filter(book_id=OuterRef('pk'), approved=True, type='audio')),
+        stats_pdf_url=Subquery(media_model.objects.filter(book_id=OuterRef('pk'), approved=True, type='pdf')
+                               .order_by('pk').values('url')[:1]),
+    ).values('pk', 'stats_read_count', 'stats_download_count', 'stats_listen_count', 'stats_review_count',
+             'stats_rating_sum', 'stats_rating_avg', 'stats_has_audio', 'stats_pdf_url')
+    stats_model.objects.bulk_create([stats_model(book_id=book['pk'],
+                                                 read_count=book['stats_read_count'],
+                                                 download_count=book['stats_download_count'],
+                                                 listen_count=book['stats_listen_count'],
+                                                 review_count=book['stats_review_count'],
+                                                 rating_sum=book['stats_rating_sum'],
+                                                 rating_avg=book['stats_rating_avg'],
+                                                 has_audio=book['stats_has_audio'],
+                                                 pdf_url=book['stats_pdf_url'])
+                                     for book in books.iterator()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0036_bookpage_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_update_time', models.DateTimeField(auto_now=True, null=True)),
+                ('read_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Read Count')),
+                ('download_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Download Count')),
+                ('listen_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='Listen Count')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Review Count')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Rating Sum')),
+                ('rating_avg', models.FloatField(blank=True, db_index=True, null=True, verbose_name='Average Rating')),
+                ('has_audio', models.BooleanField(db_index=True, default=False, verbose_name='Has Audio')),
+                ('pdf_url', models.CharField(blank=True, max_length=100, null=True, verbose_name='PDF')),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='books.Book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name_plural': 'Book stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publish_date'], name='books_book_publish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['creation_time'], name='books_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['page_count'], name='books_book_pages_idx'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0037_bookstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularBook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_update_time', models.DateTimeField(auto_now=True, null=True)),
+                ('kind', models.CharField(choices=[('reads', 'Reads'), ('listens', 'Listens'), ('downloads', 'Downloads')], max_length=10, verbose_name='Kind')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('all', 'All Time')], max_length=10, verbose_name='Period')),
+                ('period_start', models.DateField(verbose_name='Period Start')),
+                ('rank', models.PositiveIntegerField(verbose_name='Rank')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='books.Book', verbose_name='Book')),
+            ],
+            options={
+                'ordering': ['kind', 'period', 'period_start', 'rank'],
+                'unique_together': {('kind', 'period', 'period_start', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_rollups(apps, schema_editor):
+    """
+    Keeps the furthest progress of every (listen, audio) and sums the progress and minutes of every listen
+    """
+    ListenBook = apps.get_model('books', 'ListenBook')
+    ListenProgress = apps.get_model('books', 'ListenProgress')
+    duplicates = ListenProgress.objects.values('listen_id', 'audio_id').annotate(count=Count('id')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        rows = list(ListenProgress.objects.filter(listen_id=duplicate['listen_id'], audio_id=duplicate['audio_id'])
+                    .order_by('-progress', '-last_update_time'))
+        ListenProgress.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+    for listen in ListenBook.objects.filter(file_progress__isnull=False).distinct().iterator():
+        progress_sum = 0
+        minutes = 0
+        for file_progress in ListenProgress.objects.filter(listen_id=listen.pk).select_related('audio'):
+            progress_sum += file_progress.progress or 0
+            if file_progress.audio is not None:
+                minutes += (file_progress.progress or 0) * float(file_progress.audio.duration or 0) / 100
+        ListenBook.objects.filter(pk=listen.pk).update(progress_sum=progress_sum, minutes_listened=minutes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0038_popularbook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listenbook',
+            name='minutes_listened',
+            field=models.FloatField(default=0, verbose_name='Minutes Listened'),
+        ),
+        migrations.AddField(
+            model_name='listenbook',
+            name='progress_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Progress Sum'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='listenprogress',
+            unique_together={('listen', 'audio')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+from array import array
+
+from django.db import migrations, models
+from pyarabic.araby import is_tashkeel
+
+
+def build_offsets(apps, schema_editor):
+    """
+    Stores the positions of the tashkeel marks of every page
+    """
+    BookPage = apps.get_model('books', 'BookPage')
+    pages = []
+    for page in BookPage.objects.filter(tashkeel_offsets__isnull=True).only('pk', 'text').iterator():
+        page.tashkeel_offsets = array('I', (index for index, char in enumerate(page.text or '')
+                                            if is_tashkeel(char))).tobytes()
+        pages.append(page)
+        if len(pages) >= 500:
+            BookPage.objects.bulk_update(pages, ['tashkeel_offsets'])
+            pages = []
+    BookPage.objects.bulk_update(pages, ['tashkeel_offsets'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0039_listen_progress_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='tashkeel_offsets',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Tashkeel offsets'),
+        ),
+        migrations.RunPython(build_offsets, migrations.RunPython.noop),
+    ]
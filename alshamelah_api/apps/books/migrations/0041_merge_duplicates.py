@@ -0,0 +1,104 @@
+from django.db import migrations
+from django.db.models import Count, Sum, Avg
+
+# the row of every (user, book) that is kept, the others are merged into it and deleted
+kept_rows = {
+    'ReadBook': ['-last_update_time', '-pk'],
+    'DownloadBook': ['creation_time', 'pk'],
+    'ListenBook': ['-progress_sum', '-last_update_time', '-pk'],
+    'FavoriteBook': ['creation_time', 'pk'],
+    'BookReview': ['-last_update_time', '-pk'],
+    'BookMark': ['-last_update_time', '-pk'],
+}
+# the book stats counter of the rows of every model
+counted_rows = {
+    'ReadBook': 'read_count',
+    'DownloadBook': 'download_count',
+    'ListenBook': 'listen_count',
+    'BookReview': 'review_count',
+}
+
+
+def merge_listens(apps, kept, duplicates):
+    """
+    Moves the file progress of the duplicate listens to the kept one (the furthest progress of every file) and
+    rebuilds its rollup
+    """
+    ListenProgress = apps.get_model('books', 'ListenProgress')
+    progress = {row.audio_id: row for row in ListenProgress.objects.filter(listen_id=kept)}
+    for row in ListenProgress.objects.filter(listen_id__in=duplicates).order_by('-progress'):
+        if row.audio_id not in progress:
+            row.listen_id = kept
+            row.save()
+            progress[row.audio_id] = row
+        elif (row.progress or 0) > (progress[row.audio_id].progress or 0):
+            progress[row.audio_id].progress = row.progress
+            progress[row.audio_id].save()
+    minutes = sum((row.progress or 0) * float(row.audio.duration or 0) / 100
+                  for row in ListenProgress.objects.filter(listen_id=kept, audio__isnull=False).select_related('audio'))
+    ListenBook = apps.get_model('books', 'ListenBook')
+    finished = ListenBook.objects.filter(pk__in=[kept] + duplicates, finished=True).exists()
+    ListenBook.objects.filter(pk=kept).update(progress_sum=sum(row.progress or 0 for row in progress.values()),
+                                              minutes_listened=minutes, finished=finished)
+
+
+def merge_reviews(apps, kept, duplicates):
+    """
+    Moves the likes of the duplicate reviews to the kept one, a user who liked both keeps a single like
+    """
+    BookReviewLike = apps.get_model('books', 'BookReviewLike')
+    users = set(BookReviewLike.objects.filter(review_id=kept).values_list('user_id', flat=True))
+    for like in BookReviewLike.objects.filter(review_id__in=duplicates).order_by('pk'):
+        if like.user_id not in users:
+            like.review_id = kept
+            like.save()
+            users.add(like.user_id)
+
+
+def refresh_stats(apps, book_ids):
+    """
+    Recounts the activity counters of the books (see BookStatsManager.get_source), the merged duplicates were counted
+    """
+    BookStats = apps.get_model('books', 'BookStats')
+    BookReview = apps.get_model('books', 'BookReview')
+    for book_id in book_ids:
+        counters = {field: apps.get_model('books', model_name).objects.filter(book_id=book_id).count()
+                    for model_name, field in counted_rows.items()}
+        reviews = BookReview.objects.filter(book_id=book_id).aggregate(rating_sum=Sum('rating'),
+                                                                       rating_avg=Avg('rating'))
+        BookStats.objects.filter(book_id=book_id).update(rating_sum=reviews['rating_sum'] or 0,
+                                                         rating_avg=reviews['rating_avg'], **counters)
+
+
+def remove_duplicates(apps, schema_editor):
+    book_ids = set()
+    for model_name, ordering in kept_rows.items():
+        model = apps.get_model('books', model_name)
+        duplicates = model.objects.order_by().values('user_id', 'book_id').annotate(count=Count('id')) \
+            .filter(count__gt=1)
+        for duplicate in duplicates:
+            pks = list(model.objects.filter(user_id=duplicate['user_id'], book_id=duplicate['book_id'])
+                       .order_by(*ordering).values_list('pk', flat=True))
+            if model_name == 'ListenBook':
+                merge_listens(apps, pks[0], pks[1:])
+            elif model_name == 'BookReview':
+                merge_reviews(apps, pks[0], pks[1:])
+            elif model_name == 'ReadBook' and model.objects.filter(pk__in=pks, finished=True).exists():
+                model.objects.filter(pk=pks[0]).update(finished=True)
+            model.objects.filter(pk__in=pks[1:]).delete()
+            if model_name in counted_rows:
+                book_ids.add(duplicate['book_id'])
+    refresh_stats(apps, sorted(book_ids))
+
+
+# the unique constraints are added by the next migration: the deletes leave deferred foreign key checks (of the
+# likes and the listen progress) pending until the commit, and PostgreSQL does not alter a table before they ran
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0040_page_tashkeel_offsets'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0041_merge_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='bookmark',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookreview',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='downloadbook',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='favoritebook',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='listenbook',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='readbook',
+            unique_together={('user', 'book')},
+        ),
+        migrations.AddIndex(
+            model_name='booknote',
+            index=models.Index(fields=['user', 'book', 'page'], name='books_note_user_book_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='downloadbook',
+            index=models.Index(fields=['book', 'creation_time'], name='books_download_book_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listenbook',
+            index=models.Index(fields=['book', 'creation_time'], name='books_listen_book_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readbook',
+            index=models.Index(fields=['book', 'creation_time'], name='books_read_book_time_idx'),
+        ),
+    ]
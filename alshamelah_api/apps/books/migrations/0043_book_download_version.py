@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0042_user_book_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='download_version',
+            field=models.CharField(blank=True, max_length=20, null=True, verbose_name='Download version'),
+        ),
+    ]
@@ -3,14 +3,20 @@ from datetime import datetime
 
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
 from django.dispatch import receiver
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from model_utils import Choices
 from mutagen.mp3 import MP3
 
-from .managers import BookAudioManager, BookPDFManager, PaperManager, ThesisManager, BookManager
+from .managers import BookAudioManager, BookPDFManager, PaperManager, ThesisManager, BookManager, BookPageManager, \
+    BookStatsManager, PopularBookManager, ListenProgressManager
+from .tashkeel import TashkeelOffsets
+from ..core.cache import ResponseCache
 from ..core.models import BaseModel
 
 
@@ -54,8 +60,18 @@ class Book(BaseModel):
     page_count = models.PositiveIntegerField(blank=True, null=True, verbose_name=_(u'Page Count'))
     description = models.CharField(max_length=2000, verbose_name=_(u'Description'), null=True, blank=False)
     type = models.CharField(max_length=10, choices=BOOK_TYPE_CHOICES, verbose_name=_(u'Type'))
+    # version of the download payload, reset whenever its metadata or pages change (see BookDownloadService)
+    download_version = models.CharField(max_length=20, verbose_name=_(u'Download version'), null=True, blank=True)
 
     # search_count = models.PositiveIntegerField(blank=True, null=True, verbose_name=_(u'Search Count'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['publish_date'], name='books_book_publish_idx'),
+            models.Index(fields=['creation_time'], name='books_book_created_idx'),
+            models.Index(fields=['page_count'], name='books_book_pages_idx'),
+        ]
+
     @property
     def image(self):
         return self.cover_image.url if self.cover_image else os.path.join(settings.MEDIA_URL, 'books',
@@ -91,6 +107,88 @@ class Book(BaseModel):
             self.type = 'book'
 
 
+class BookPage(BaseModel):
+    objects = BookPageManager()
+    book = models.ForeignKey(Book, related_name='book_pages', verbose_name=_(u'Book'), null=False,
+                             on_delete=models.CASCADE)
+    number = models.PositiveIntegerField(verbose_name=_(u'Page number'), null=False)
+    volume = models.PositiveSmallIntegerField(verbose_name=_(u'Volume'), null=True, blank=True)
+    source_page = models.PositiveIntegerField(verbose_name=_(u'Source page'), null=True, blank=True)
+    text = models.TextField(verbose_name=_(u'Text'), null=False, blank=True, default='')
+    text_no_tashkeel = models.TextField(verbose_name=_(u'Text without tashkeel'), null=False, blank=True, default='')
+    tashkeel_offsets = models.BinaryField(verbose_name=_(u'Tashkeel offsets'), null=True, blank=True)
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        ordering = ['book_id', 'number']
+        unique_together = [('book', 'number')]
+        indexes = [GinIndex(fields=['search_vector'], name='books_bookpage_search_gin')]
+
+    def get_text(self, with_tashkeel=True):
+        return self.text if with_tashkeel else self.text_no_tashkeel
+
+    @cached_property
+    def offsets(self):
+        if self.tashkeel_offsets is None:
+            return TashkeelOffsets.from_text(self.text)
+        return TashkeelOffsets.from_bytes(self.tashkeel_offsets)
+
+    def as_dict(self, with_tashkeel=True):
+        return {'text': self.get_text(with_tashkeel), 'vol': self.volume, 'page': self.source_page}
+
+    def __str__(self):
+        return str(self.book_id) + ':' + str(self.number)
+
+
+class BookStats(BaseModel):
+    objects = BookStatsManager()
+    book = models.OneToOneField(Book, related_name='stats', verbose_name=_(u'Book'), null=False,
+                                on_delete=models.CASCADE)
+    read_count = models.PositiveIntegerField(verbose_name=_(u'Read Count'), default=0, db_index=True)
+    download_count = models.PositiveIntegerField(verbose_name=_(u'Download Count'), default=0, db_index=True)
+    listen_count = models.PositiveIntegerField(verbose_name=_(u'Listen Count'), default=0, db_index=True)
+    review_count = models.PositiveIntegerField(verbose_name=_(u'Review Count'), default=0)
+    rating_sum = models.PositiveIntegerField(verbose_name=_(u'Rating Sum'), default=0)
+    rating_avg = models.FloatField(verbose_name=_(u'Average Rating'), null=True, blank=True, db_index=True)
+    has_audio = models.BooleanField(verbose_name=_(u'Has Audio'), default=False, db_index=True)
+    pdf_url = models.CharField(max_length=100, verbose_name=_(u'PDF'), null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Book stats'
+
+    def __str__(self):
+        return str(self.book_id)
+
+
+class PopularBook(BaseModel):
+    objects = PopularBookManager()
+    KIND_CHOICES = Choices(
+        ('reads', _(u'Reads')),
+        ('listens', _(u'Listens')),
+        ('downloads', _(u'Downloads')),
+    )
+    PERIOD_CHOICES = Choices(
+        ('week', _(u'Week')),
+        ('month', _(u'Month')),
+        ('all', _(u'All Time')),
+    )
+    book = models.ForeignKey(Book, related_name='popularity', verbose_name=_(u'Book'), null=False,
+                             on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name=_(u'Kind'))
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, verbose_name=_(u'Period'))
+    period_start = models.DateField(verbose_name=_(u'Period Start'))
+    rank = models.PositiveIntegerField(verbose_name=_(u'Rank'))
+    count = models.PositiveIntegerField(verbose_name=_(u'Count'), default=0)
+
+    class Meta:
+        ordering = ['kind', 'period', 'period_start', 'rank']
+        unique_together = [('kind', 'period', 'period_start', 'rank')]
+
+    def __str__(self):
+        return '{kind}/{period}#{rank}: {book}'.format(kind=self.kind, period=self.period, rank=self.rank,
+                                                      book=self.book_id)
+
+
 class Paper(Book):
     objects = PaperManager()
 
@@ -130,6 +228,9 @@ class BookReview(BaseModel):
     rating = models.PositiveSmallIntegerField(verbose_name=_(u'Rating'), choices=RATING_RANGE, null=True)
     comment = models.TextField(verbose_name=_(u'Comment'), null=True)
 
+    class Meta:
+        unique_together = ('user', 'book')
+
     def __str__(self):
         return self.comment if self.comment else ''
 
@@ -162,6 +263,9 @@ class BookNote(BaseModel):
 
     class Meta:
         ordering = ['-creation_time']
+        indexes = [
+            models.Index(fields=['user', 'book', 'page'], name='books_note_user_book_page_idx'),
+        ]
 
 
 class BookMark(BaseModel):
@@ -171,6 +275,9 @@ class BookMark(BaseModel):
                              on_delete=models.CASCADE)
     page = models.PositiveSmallIntegerField(verbose_name=_(u'Page'))
 
+    class Meta:
+        unique_together = ('user', 'book')
+
     def __str__(self):
         return self.page if self.page else ''
 
@@ -237,6 +344,9 @@ class FavoriteBook(BaseModel):
     book = models.ForeignKey(Book, related_name='favorite_books', verbose_name=_(u'Book'), null=False,
                              on_delete=models.CASCADE)
 
+    class Meta:
+        unique_together = ('user', 'book')
+
     def __str__(self):
         return (self.user.name if self.user and self.user.name else '') + ":" + str(self.book if self.book else '')
 
@@ -249,6 +359,13 @@ class ReadBook(BaseModel):
     page = models.PositiveSmallIntegerField(verbose_name=_('Page reached'), null=True, blank=False)
     finished = models.BooleanField(null=False, verbose_name=_('Finished'), default=False)
 
+    class Meta:
+        unique_together = ('user', 'book')
+        # the monthly and weekly popularity counts
+        indexes = [
+            models.Index(fields=['book', 'creation_time'], name='books_read_book_time_idx'),
+        ]
+
     def __str__(self):
         return (self.user.name if self.user and self.user.name else '') + ":" + str(self.book if self.book else '')
 
@@ -259,6 +376,12 @@ class DownloadBook(BaseModel):
     book = models.ForeignKey(Book, related_name='downloads', verbose_name=_(u'Book'), null=False,
                              on_delete=models.CASCADE)
 
+    class Meta:
+        unique_together = ('user', 'book')
+        indexes = [
+            models.Index(fields=['book', 'creation_time'], name='books_download_book_time_idx'),
+        ]
+
     def __str__(self):
         return (self.user.name if self.user and self.user.name else '') + ":" + str(self.book if self.book else '')
 
@@ -269,6 +392,15 @@ class ListenBook(BaseModel):
     book = models.ForeignKey(Book, related_name='listens', verbose_name=_(u'Book'), null=False,
                              on_delete=models.CASCADE)
     finished = models.BooleanField(verbose_name=_('Finished'), default=False, null=False)
+    # rollup of the file progress, kept by ListenProgress.objects.record
+    progress_sum = models.PositiveIntegerField(verbose_name=_('Progress Sum'), default=0)
+    minutes_listened = models.FloatField(verbose_name=_('Minutes Listened'), default=0)
+
+    class Meta:
+        unique_together = ('user', 'book')
+        indexes = [
+            models.Index(fields=['book', 'creation_time'], name='books_listen_book_time_idx'),
+        ]
 
     def __str__(self):
         return (self.user.name if self.user and self.user.name else '') + ":" + str(self.book if self.book else '')
@@ -282,6 +414,10 @@ class ListenProgress(BaseModel):
     progress = models.PositiveSmallIntegerField(verbose_name=_('Progress'), null=True, validators=[MinValueValidator(0),
                                                                                                    MaxValueValidator(
                                                                                                        100)])
+    objects = ListenProgressManager()
+
+    class Meta:
+        unique_together = ('listen', 'audio')
 
 
 class SearchBook(BaseModel):
@@ -326,6 +462,13 @@ class BookSuggestion(BaseModel):
         return (self.user.name if self.user and self.user.name else '') + ":" + self.title + ('(%s)' % self.author)
 
 
+book_stats_counters = {
+    ReadBook: 'read_count',
+    DownloadBook: 'download_count',
+    ListenBook: 'listen_count',
+}
+
+
 class MarkPosition(object):
 
     def __init__(self, start, end):
@@ -350,3 +493,87 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
         path = os.path.join(settings.MEDIA_ROOT, instance.path)
         if os.path.isdir(path):
             shutil.rmtree(path)
+
+
+@receiver(models.signals.pre_save, sender=Book)
+@receiver(models.signals.pre_save, sender=Paper)
+@receiver(models.signals.pre_save, sender=Thesis)
+def reset_download_version(sender, instance, **kwargs):
+    instance.download_version = None
+
+
+# the books whose download metadata shows the saved author or category
+download_version_relations = {'authors.Author': 'author_id', 'categories.Category': 'category_id',
+                              'categories.SubCategory': 'sub_category_id'}
+
+
+@receiver(models.signals.post_save, sender='authors.Author')
+@receiver(models.signals.post_save, sender='categories.Category')
+@receiver(models.signals.post_save, sender='categories.SubCategory')
+def reset_download_versions(sender, instance, **kwargs):
+    Book.objects.get_all().filter(**{download_version_relations[sender._meta.label]: instance.pk}) \
+        .update(download_version=None)
+
+
+@receiver(models.signals.post_save, sender=Book)
+@receiver(models.signals.post_save, sender=Paper)
+@receiver(models.signals.post_save, sender=Thesis)
+def create_book_stats(sender, instance, created, **kwargs):
+    if created:
+        BookStats.objects.get_or_create(book_id=instance.pk)
+
+
+@receiver(models.signals.post_save, sender=ReadBook)
+@receiver(models.signals.post_save, sender=DownloadBook)
+@receiver(models.signals.post_save, sender=ListenBook)
+def increment_book_stats(sender, instance, created, **kwargs):
+    if created:
+        BookStats.objects.increment(instance.book_id, book_stats_counters[sender])
+
+
+@receiver(models.signals.post_delete, sender=ReadBook)
+@receiver(models.signals.post_delete, sender=DownloadBook)
+@receiver(models.signals.post_delete, sender=ListenBook)
+def decrement_book_stats(sender, instance, **kwargs):
+    BookStats.objects.increment(instance.book_id, book_stats_counters[sender], -1)
+
+
+@receiver(models.signals.post_save, sender=BookReview)
+def update_book_stats_reviews(sender, instance, **kwargs):
+    BookStats.objects.refresh_reviews(instance.book_id)
+
+
+@receiver(models.signals.post_save, sender=BookMedia)
+@receiver(models.signals.post_save, sender=BookAudio)
+@receiver(models.signals.post_save, sender=BookPDF)
+def update_book_stats_media(sender, instance, **kwargs):
+    BookStats.objects.refresh_media(instance.book_id)
+
+
+# the stats row may already be gone when deleting a book, so deletions never recreate it
+@receiver(models.signals.post_delete, sender=BookReview)
+def delete_book_stats_reviews(sender, instance, **kwargs):
+    BookStats.objects.refresh_reviews(instance.book_id, create=False)
+
+
+@receiver(models.signals.post_delete, sender=BookMedia)
+@receiver(models.signals.post_delete, sender=BookAudio)
+@receiver(models.signals.post_delete, sender=BookPDF)
+def delete_book_stats_media(sender, instance, **kwargs):
+    BookStats.objects.refresh_media(instance.book_id, create=False)
+
+
+@receiver(models.signals.post_save, sender=Book)
+@receiver(models.signals.post_save, sender=Paper)
+@receiver(models.signals.post_save, sender=Thesis)
+@receiver(models.signals.post_save, sender=BookMedia)
+@receiver(models.signals.post_save, sender=BookAudio)
+@receiver(models.signals.post_save, sender=BookPDF)
+@receiver(models.signals.post_delete, sender=Book)
+@receiver(models.signals.post_delete, sender=Paper)
+@receiver(models.signals.post_delete, sender=Thesis)
+@receiver(models.signals.post_delete, sender=BookMedia)
+@receiver(models.signals.post_delete, sender=BookAudio)
+@receiver(models.signals.post_delete, sender=BookPDF)
+def invalidate_books_cache(sender, instance, **kwargs):
+    ResponseCache.invalidate('books')
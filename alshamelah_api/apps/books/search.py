@@ -0,0 +1,142 @@
+import re
+
+from django.contrib.postgres.search import SearchVector, SearchQuery
+from django.db.models import Value, TextField
+from pyarabic.araby import strip_tashkeel, is_tashkeel
+
+
+class ArabicSearch(object):
+    config = 'simple'
+    tatweel = u'ـ'
+    normalization_table = str.maketrans({
+        u'آ': u'ا',  # alef with madda
+        u'أ': u'ا',  # alef with hamza above
+        u'إ': u'ا',  # alef with hamza below
+        u'ٱ': u'ا',  # alef wasla
+        u'ؤ': u'و',  # waw with hamza
+        u'ئ': u'ي',  # yeh with hamza
+        u'ى': u'ي',  # alef maksura
+        u'ة': u'ه',  # teh marbuta
+        u'ـ': None,  # tatweel
+    })
+    # definite article with its attached conjunctions / prepositions, longest first
+    article_prefixes = (u'وال', u'فال', u'بال', u'كال', u'لل', u'ال')
+    min_stem_length = 2
+    unstemmed_words = (u'الله', u'اللهم')
+    word_pattern = re.compile(r'\w+', re.UNICODE)
+    snippet_width = 80
+    highlight_tag_start = '<span class=\'highlighted\' style=\'background-color:#E0E0E0\'>'
+    tag_end = '</span>'
+
+    @staticmethod
+    def normalize(text):
+        """
+        Strips tashkeel and tatweel and unifies alef, hamza and teh marbuta forms
+        """
+        if not text:
+            return ''
+        return strip_tashkeel(text).translate(ArabicSearch.normalization_table)
+
+    @staticmethod
+    def stem(word):
+        if word in ArabicSearch.unstemmed_words:
+            return word
+        for prefix in ArabicSearch.article_prefixes:
+            if word.startswith(prefix) and len(word) - len(prefix) >= ArabicSearch.min_stem_length:
+                return word[len(prefix):]
+        return word
+
+    @staticmethod
+    def get_terms(text):
+        return [ArabicSearch.stem(word) for word in ArabicSearch.word_pattern.findall(ArabicSearch.normalize(text))]
+
+    @staticmethod
+    def get_document(text):
+        return ' '.join(ArabicSearch.get_terms(text))
+
+    @staticmethod
+    def get_vector(text):
+        return SearchVector(Value(ArabicSearch.get_document(text), output_field=TextField()),
+                            config=ArabicSearch.config)
+
+    @staticmethod
+    def get_query(text):
+        """
+        Every word of the text must match (as a prefix) a word of the page
+        """
+        terms = ArabicSearch.get_terms(text)
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(term + ':*' for term in terms), config=ArabicSearch.config,
+                           search_type='raw')
+
+    @staticmethod
+    def find(text, terms):
+        """
+        Returns the merged (start, end) spans of text matching any of the normalized terms
+        """
+        if not text or not terms:
+            return []
+        normalized = []
+        positions = []
+        for index, char in enumerate(text):
+            if char == ArabicSearch.tatweel or is_tashkeel(char):
+                continue
+            normalized.append(char.translate(ArabicSearch.normalization_table))
+            positions.append(index)
+        normalized = ''.join(normalized)
+        spans = []
+        for term in terms:
+            start = normalized.find(term)
+            while start != -1:
+                end = positions[start + len(term) - 1] + 1
+                while end < len(text) and (is_tashkeel(text[end]) or text[end] == ArabicSearch.tatweel):
+                    end += 1
+                spans.append((positions[start], end))
+                start = normalized.find(term, start + len(term))
+        spans.sort()
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+
+    @staticmethod
+    def highlight(text, terms, spans=None, start=0, end=None):
+        if end is None:
+            end = len(text)
+        if spans is None:
+            spans = ArabicSearch.find(text, terms)
+        parts = []
+        position = start
+        for span_start, span_end in spans:
+            if span_end <= start or span_start >= end:
+                continue
+            span_start = max(span_start, start)
+            span_end = min(span_end, end)
+            parts.append(text[position:span_start])
+            parts.append(ArabicSearch.highlight_tag_start)
+            parts.append(text[span_start:span_end])
+            parts.append(ArabicSearch.tag_end)
+            position = span_end
+        parts.append(text[position:end])
+        return ''.join(parts)
+
+    @staticmethod
+    def get_snippet(text, terms, width=None):
+        """
+        Returns the highlighted part of the text around the first match
+        """
+        if not text:
+            return ''
+        if width is None:
+            width = ArabicSearch.snippet_width
+        spans = ArabicSearch.find(text, terms)
+        if not spans:
+            return text[:width * 2]
+        start = max(spans[0][0] - width, 0)
+        end = min(spans[0][1] + width, len(text))
+        snippet = ArabicSearch.highlight(text, terms, spans, start, end)
+        return ('...' if start > 0 else '') + snippet + ('...' if end < len(text) else '')
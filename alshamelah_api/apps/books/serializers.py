@@ -1,5 +1,6 @@
 import os
 
+from django.core.files.storage import default_storage
 from django.db.models import Avg
 from django.utils.translation import ugettext_lazy as _
 from munch import munchify
@@ -9,10 +10,12 @@ from rest_framework.utils import json
 
 from .models import Book, BookMark, BookAudio, BookPDF, BookNote, BookReview, \
     BookReviewLike, ReadBook, FavoriteBook, DownloadBook, ListenBook, BookSuggestion, SearchBook, ListenProgress, Paper, \
-    Thesis
+    Thesis, BookPage
+from .search import ArabicSearch
 from .util import ArabicUtilities
 from ..authors.serializers import AuthorSerializer
 from ..categories.serializers import CategorySerializer, SubCategorySerializer, CategoryForBookSerializer
+from ..core.models import Job
 from ..points.models import UserStatistics
 from ..users.serializers import UserProfileSerializer
 
@@ -67,31 +70,46 @@ class BookListSerializer(serializers.ModelSerializer):
     def request(self):
         return self.context.get('request')
 
+    # the counters below are read from the annotations of Book.objects.with_list_stats when available
     @staticmethod
     def get_average_rating(book):
+        if hasattr(book, 'avg_rate'):
+            return book.avg_rate
         return book.reviews.all().aggregate(Avg('rating')).get('rating__avg', 0.00)
 
     @staticmethod
     def get_reviews(book):
+        if hasattr(book, 'review_count'):
+            return book.review_count
         return book.reviews.count()
 
     @staticmethod
     def get_readers(book):
+        if hasattr(book, 'read_count'):
+            return book.read_count
         return book.readers.count()
 
     @staticmethod
     def get_downloads(book):
+        if hasattr(book, 'download_count'):
+            return book.download_count
         return book.downloads.count()
 
     @staticmethod
     def get_listens(book):
+        if hasattr(book, 'listen_count'):
+            return book.listen_count
         return book.listens.count()
 
     @staticmethod
     def does_have_audio(book):
+        if hasattr(book, 'has_audio'):
+            return book.has_audio
         return book.book_media.filter(approved=True, type='audio').exists()
 
     def get_pdf(self, book):
+        if hasattr(book, 'pdf_url'):
+            return self.request.build_absolute_uri(default_storage.url(book.pdf_url)) if book.pdf_url else None
         pdf = book.book_media.filter(approved=True, type='pdf').first()
         return self.request.build_absolute_uri(pdf.url.url) if pdf and pdf.url else None
 
@@ -111,13 +129,18 @@ class BookListSerializer(serializers.ModelSerializer):
     def get_favorite(self, book):
         if not self.request or not self.request.user.id or not hasattr(self.request.user, 'favorite_books'):
             return None
+        if hasattr(book, 'favorite_id'):
+            return book.favorite_id
         favorite = self.request.user.favorite_books.filter(book_id=book.id).first()
         return favorite.id if favorite else None
 
     def get_user_rating(self, book):
         if not self.request or not self.request.user.id or not hasattr(self.request.user, 'reviews'):
             return None
-        rating = self.request.user.reviews.filter(book_id=book.id).first()
+        if hasattr(book, 'user_reviews'):
+            rating = book.user_reviews[0] if book.user_reviews else None
+        else:
+            rating = self.request.user.reviews.filter(book_id=book.id).first()
         return {
             'id': rating.id,
             'rating': rating.rating,
@@ -133,28 +156,28 @@ class UserBookListSerializer(BookListSerializer):
         model = Book
         fields = BookListSerializer.Meta.fields + ['read_progress', 'listen_progress']
 
+    # the progress is read from the annotations of Book.objects.with_user_progress when available
+    def get_user_progress(self, book):
+        if not hasattr(book, 'read_page'):
+            progress = Book.objects.get_all().filter(pk=book.pk).with_user_progress(self.request.user) \
+                .values('read_page', 'listen_progress_sum', 'audio_file_count').first() or {}
+            book.read_page = progress.get('read_page')
+            book.listen_progress_sum = progress.get('listen_progress_sum', 0)
+            book.audio_file_count = progress.get('audio_file_count', 0)
+        return book
+
     def get_read_progress(self, book):
         if self.request is None or self.request.user.id is None:
             return None
-        read = book.readers.filter(user_id=self.request.user.id).first()
-        return round(read.page / book.page_count, 2) if read is not None and read.page is not None else 0
+        book = self.get_user_progress(book)
+        return round(book.read_page / book.page_count, 2) if book.read_page and book.page_count else 0
 
     def get_listen_progress(self, book):
         if self.request is None or self.request.user.id is None:
             return None
-        listen = book.listens.filter(user_id=self.request.user.id).first()
-        if not listen or not listen.file_progress.exists():
-            return 0
-        total = []
-        audio = list(book.book_media.filter(type='audio', approved=True))
-        for file in audio:
-            data = next(item for item in listen.file_progress.all() if item.audio_id == file.id)
-            if data:
-                total.append(data.progress)
-            else:
-                total.append(0)
-
-        return round((sum(total) / len(total)) / 100, 2) if total else 0
+        book = self.get_user_progress(book)
+        # files without progress count as not listened
+        return round(book.listen_progress_sum / book.audio_file_count / 100, 2) if book.audio_file_count else 0
 
 
 class UploadBookSerializer(serializers.ModelSerializer):
@@ -178,6 +201,7 @@ class UploadBookSerializer(serializers.ModelSerializer):
 
     def __init__(self, **kwargs):
         self.json_data = None
+        self.pages = None
         super().__init__(**kwargs)
 
     def validate_file(self, file):
@@ -185,6 +209,7 @@ class UploadBookSerializer(serializers.ModelSerializer):
             return file
         try:
             self.json_data = json.load(file)
+            self.pages = BookPage.objects.prepare(self.json_data['pages'])
         except:
             raise serializers.ValidationError(_('Bad json file'))
         return file
@@ -214,6 +239,8 @@ class UploadBookSerializer(serializers.ModelSerializer):
         if data.__contains__('pdf'):
             pdf = data.pop('pdf')
         book = Book.objects.create(**data)
+        if book.content:
+            BookPage.objects.build(book, prepared=self.pages)
         if pdf:
             BookPDF.objects.update_or_create(book_id=book.id, user=book.uploader, url=pdf)
         return book
@@ -352,25 +379,16 @@ class BookDetailSerializer(BookSerializer):
 
 
 class DownloadBookSerializer(serializers.ModelSerializer):
-    content_no_tashkeel = serializers.SerializerMethodField('get_no_tashkeel_content')
+    """
+    Metadata of the download payload, the content and content_no_tashkeel pages are streamed by BookDownloadService
+    """
     category = CategorySerializer()
     sub_category = SubCategorySerializer()
     author = AuthorSerializer()
 
     class Meta:
         model = Book
-        fields = ['title', 'category', 'sub_category', 'cover_image', 'content', 'author', 'page_count',
-                  'content_no_tashkeel']
-
-    @staticmethod
-    def get_no_tashkeel_content(book):
-        from pyarabic.araby import strip_tashkeel
-        if not book.content:
-            return None
-        content = list(book.content)
-        for page in content:
-            page['text'] = strip_tashkeel(page['text'])
-        return content
+        fields = ['title', 'category', 'sub_category', 'cover_image', 'author', 'page_count']
 
 
 class SubmitBookSerializer(serializers.ModelSerializer):
@@ -435,15 +453,20 @@ class BookNoteSerializer(NestedBookSerializer):
                         }
 
     def validate_page(self, page):
-        if len(self.context.get('book').pages) < page:
+        self.page_data = BookPage.objects.get_page(self.context.get('book').id, page)
+        if not self.page_data:
             raise serializers.ValidationError(_('Invalid page number'))
-        self.page_data = self.context.get('book').pages[page]['text']
         return page
 
-    def create(self, validated_data):
-        if validated_data['tashkeel_on']:
+    def set_positions(self, validated_data):
+        """
+        Stores the offsets of the note in the page text with and without tashkeel, from the ones it was made on
+        """
+        if validated_data.pop('tashkeel_on'):
             mark_position = ArabicUtilities.get_no_tashkeel_position(self.page_data, validated_data['start'],
                                                                      validated_data['end'])
+            if mark_position is None:
+                raise serializers.ValidationError(_('Invalid note position'))
             validated_data['tashkeel_start'] = validated_data['start']
             validated_data['tashkeel_end'] = validated_data['end']
             validated_data['start'] = mark_position.start
@@ -451,29 +474,19 @@ class BookNoteSerializer(NestedBookSerializer):
         else:
             mark_position = ArabicUtilities.get_tashkeel_position(self.page_data, validated_data['start'],
                                                                   validated_data['end'])
+            if mark_position is None:
+                raise serializers.ValidationError(_('Invalid note position'))
             validated_data['tashkeel_start'] = mark_position.start
             validated_data['tashkeel_end'] = mark_position.end
 
-        del validated_data['tashkeel_on']
+    def create(self, validated_data):
+        self.set_positions(validated_data)
         note = super(BookNoteSerializer, self).create(validated_data)
         UserStatistics.objects.update_notes_and_highlights(note.user)
         return note
 
     def update(self, instance, validated_data):
-        if validated_data['tashkeel_on']:
-            mark_position = ArabicUtilities.get_no_tashkeel_position(self.page_data, validated_data['start'],
-                                                                     validated_data['end'])
-            validated_data['tashkeel_start'] = validated_data['start']
-            validated_data['tashkeel_end'] = validated_data['end']
-            validated_data['start'] = mark_position.start
-            validated_data['end'] = mark_position.end
-        else:
-            mark_position = ArabicUtilities.get_tashkeel_position(self.page_data, validated_data['start'],
-                                                                  validated_data['end'])
-            validated_data['tashkeel_start'] = mark_position.start
-            validated_data['tashkeel_end'] = mark_position.end
-
-        del validated_data['tashkeel_on']
+        self.set_positions(validated_data)
         self.data.pop('tashkeel_on')
         note = super(BookNoteSerializer, self).update(instance, validated_data)
         UserStatistics.objects.update_notes_and_highlights(note.user)
@@ -629,24 +642,9 @@ class ListenProgressSerializer(serializers.ModelSerializer):
         progress = validated_data.get('progress', 0)
         if user and book and audio:
             listen, created = ListenBook.objects.get_or_create(user=user, book=book)
-            file_progress, created = ListenProgress.objects.update_or_create(
-                listen=listen,
-                audio=audio,
-                defaults={'progress': progress}
-            )
-            UserStatistics.objects.listen(user.id, book.id)
-            if progress == 100:
-                audio_files = book.book_media.filter(type='audio', approved=True)
-                listened = ListenProgress.objects.filter(listen__user_id=user.id)
-                finished = True
-                for file in audio_files:
-                    listened_file = listened.filter(audio_id=file.id).first()
-                    if not listened_file or listened_file.progress < 100:
-                        finished = False
-                if finished:
-                    listen.finished = True
-                    listen.save()
-                    UserStatistics.objects.update_finished_listen(user)
+            file_progress, minutes, started = ListenProgress.objects.record(listen, audio, progress)
+            Job.objects.enqueue('books.listen', user_id=user.id, book_id=book.id, completed=progress == 100,
+                                minutes=minutes, started=started)
             return file_progress
         return self.Meta.model.objects.none()
 
@@ -679,6 +677,29 @@ class UserBookNoteListSerializer(serializers.ModelSerializer):
         exclude = ['user', 'tashkeel_start', 'tashkeel_end']
 
 
+class BookPageSearchSerializer(serializers.ModelSerializer):
+    book = serializers.SerializerMethodField()
+    page = serializers.IntegerField(source='number')
+    rank = serializers.FloatField()
+    snippet = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookPage
+        fields = ['book', 'page', 'volume', 'source_page', 'rank', 'snippet']
+
+    @staticmethod
+    def get_book(page):
+        return {
+            'id': page.book_id,
+            'title': page.book.title,
+            'author': page.book.author.name if page.book.author else None
+        }
+
+    def get_snippet(self, page):
+        return ArabicSearch.get_snippet(page.get_text(self.context.get('tashkeel', True)),
+                                        self.context.get('terms', []))
+
+
 class BookSearchSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
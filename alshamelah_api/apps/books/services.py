@@ -0,0 +1,392 @@
+import gzip
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse, HttpResponse
+from django.utils.functional import cached_property
+from rest_framework import status
+from PIL import Image
+from rest_framework.utils import json
+
+from .models import Book, BookPage
+from .serializers import DownloadBookSerializer
+from ..core.models import Job
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def remove_outdated(directory, version, max_age):
+    """
+    Removes the files of the directory that are not of the version and were last written more than max_age seconds
+    ago, a client may still be downloading a file that was just replaced
+    """
+    if not os.path.isdir(directory):
+        return []
+    removed = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.startswith(version) and time.time() - os.path.getmtime(path) > max_age:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+class BookDownloadService(object):
+    """
+    Streams the download payload of a book (its metadata, content and content without tashkeel) page by page, from a
+    prebuilt compressed artifact when the client accepts one
+    """
+    content_type = 'application/json; charset=utf-8'
+    chunk_size = 64 * 1024
+    page_batch = 100
+    directory = 'download'
+    extensions = {'br': '.json.br', 'gzip': '.json.gz'}
+    range_pattern = re.compile(r'^bytes=(\d*)-(\d*)$')
+    # seconds before a missing artifact is enqueued again, in case its build failed
+    build_timeout = 60 * 10
+
+    def __init__(self, book, metadata):
+        self.book = book
+        self.metadata = metadata
+
+    @cached_property
+    def version(self):
+        """
+        The version stored on the book, computed once after the book, its pages, author or category changed
+        """
+        if not self.book.download_version:
+            self.book.download_version = self.get_version()
+            Book.objects.get_all().filter(pk=self.book.id).update(download_version=self.book.download_version)
+        return self.book.download_version
+
+    def get_version(self):
+        """
+        Changes whenever the metadata or any page of the book changes. The metadata is serialized again without the
+        request, so its file urls are relative and the version is the same whatever host the book is downloaded from
+        """
+        pages = BookPage.objects.filter(book_id=self.book.id).aggregate(count=Count('pk'),
+                                                                        updated=Max('last_update_time'))
+        key = json.dumps([DownloadBookSerializer(self.book).data, pages['count'], pages['updated']], sort_keys=True,
+                         default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    @cached_property
+    def has_pages(self):
+        return BookPage.objects.filter(book_id=self.book.id).exists()
+
+    def get_etag(self, encoding=None):
+        return '"{version}{encoding}"'.format(version=self.version, encoding='-' + encoding if encoding else '')
+
+    def iter_json(self):
+        """
+        Yields the json payload in chunks, one batch of pages at a time
+        """
+        metadata = json.dumps(self.metadata, ensure_ascii=False)
+        if not self.has_pages:
+            yield (metadata[:-1] + (', ' if self.metadata else '') +
+                   '"content": null, "content_no_tashkeel": null}').encode('utf-8')
+            return
+        yield (metadata[:-1] + (', ' if self.metadata else '') + '"content": [').encode('utf-8')
+        yield from self.iter_pages(with_tashkeel=True)
+        yield '], "content_no_tashkeel": ['.encode('utf-8')
+        yield from self.iter_pages(with_tashkeel=False)
+        yield ']}'.encode('utf-8')
+
+    def iter_pages(self, with_tashkeel=True):
+        pages = BookPage.objects.filter(book_id=self.book.id).order_by('number') \
+            .only('book_id', 'number', 'volume', 'source_page', 'text' if with_tashkeel else 'text_no_tashkeel')
+        batch = []
+        separator = ''
+        for page in pages.iterator(chunk_size=self.page_batch):
+            batch.append(json.dumps(page.as_dict(with_tashkeel), ensure_ascii=False))
+            if len(batch) == self.page_batch:
+                yield (separator + ','.join(batch)).encode('utf-8')
+                batch = []
+                separator = ','
+        if batch:
+            yield (separator + ','.join(batch)).encode('utf-8')
+
+    def get_directory(self):
+        return os.path.join(settings.MEDIA_ROOT, self.book.path, self.directory)
+
+    def get_artifact_path(self, encoding, base_url):
+        # the payload holds the absolute urls of the metadata, one artifact per host they were built for
+        host = hashlib.sha1(base_url.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.get_directory(), '{version}-{host}{extension}'.format(
+            version=self.version, host=host, extension=self.extensions[encoding]))
+
+    def get_encodings(self):
+        return ['br', 'gzip'] if brotli else ['gzip']
+
+    def build(self, base_url):
+        """
+        Writes the missing compressed artifacts of the current version for the host, the outdated ones are left to
+        prune
+        """
+        os.makedirs(self.get_directory(), exist_ok=True)
+        paths = []
+        for encoding in self.get_encodings():
+            path = self.get_artifact_path(encoding, base_url)
+            if not os.path.exists(path):
+                self.write_artifact(path, encoding)
+            paths.append(path)
+        return paths
+
+    def prune(self, max_age):
+        """
+        Removes the artifacts of the outdated versions (and the leftovers of failed builds) older than max_age seconds
+        """
+        return remove_outdated(self.get_directory(), self.version, max_age)
+
+    def write_artifact(self, path, encoding):
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                if encoding == 'gzip':
+                    # no timestamp in the header so that a version always has the same bytes
+                    with gzip.GzipFile(fileobj=output, mode='wb', mtime=0) as compressed:
+                        for chunk in self.iter_json():
+                            compressed.write(chunk)
+                else:
+                    compressor = brotli.Compressor()
+                    for chunk in self.iter_json():
+                        output.write(compressor.process(chunk))
+                    output.write(compressor.finish())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_encoding(self, request):
+        accepted = [value.split(';')[0].strip() for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')]
+        for encoding in self.get_encodings():
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def get_response(self, request):
+        encoding = self.get_encoding(request)
+        base_url = request.build_absolute_uri('/')
+        path = self.get_artifact_path(encoding, base_url) if encoding else None
+        if path is not None and not os.path.exists(path):
+            # streamed uncompressed until the job queue built the artifact
+            self.schedule_build(base_url)
+            encoding = None
+        etag = self.get_etag(encoding)
+        if etag in [value.strip() for value in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            return self.set_headers(HttpResponse(status=status.HTTP_304_NOT_MODIFIED), etag)
+        if encoding is None:
+            return self.set_headers(StreamingHttpResponse(self.iter_json(), content_type=self.content_type), etag)
+        size = os.path.getsize(path)
+        start, end = self.get_range(request, size, etag)
+        if start is None and end is not None:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = 'bytes */{size}'.format(size=size)
+            return self.set_headers(response, etag)
+        if start is None:
+            start, end = 0, size - 1
+            response = StreamingHttpResponse(self.iter_file(path, start, end), content_type=self.content_type)
+        else:
+            response = StreamingHttpResponse(self.iter_file(path, start, end), content_type=self.content_type,
+                                             status=status.HTTP_206_PARTIAL_CONTENT)
+            response['Content-Range'] = 'bytes {start}-{end}/{size}'.format(start=start, end=end, size=size)
+        response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(end - start + 1)
+        return self.set_headers(response, etag)
+
+    def schedule_build(self, base_url):
+        """
+        Enqueues the build of the artifacts once per version and host, the payload is streamed uncompressed until then
+        """
+        key = 'book-download-build:{book}:{version}:{url}'.format(book=self.book.id, version=self.version, url=base_url)
+        if cache.add(key, True, timeout=self.build_timeout):
+            Job.objects.enqueue('books.download', book_id=self.book.id, version=self.version, base_url=base_url,
+                                metadata=self.metadata)
+
+    def get_range(self, request, size, etag):
+        """
+        Returns the (start, end) of a single satisfiable byte range, (None, None) to send the whole file and
+        (None, size) when the range can not be satisfied
+        """
+        match = self.range_pattern.match(request.META.get('HTTP_RANGE', '').strip())
+        if not match or request.META.get('HTTP_IF_RANGE', etag) != etag:
+            return None, None
+        first, last = match.groups()
+        if not first and not last:
+            return None, None
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start > end or start >= size:
+            return None, size
+        return start, end
+
+    def iter_file(self, path, start, end):
+        with open(path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    @staticmethod
+    def set_headers(response, etag):
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = 'no-cache'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+
+class BookBundleService(object):
+    """
+    Builds the versioned offline bundle of a book under its media directory: a zip holding the metadata, the content
+    with and without tashkeel, a page offset index into both and the cover thumbnail
+    """
+    directory = 'offline'
+    extension = '.zip'
+    thumbnail_size = (300, 450)
+    page_batch = 100
+    # seconds before a missing bundle is enqueued again, in case its build failed
+    build_timeout = 60 * 10
+
+    def __init__(self, book):
+        self.book = book
+
+    def get_metadata(self):
+        book = self.book
+        return {
+            'id': book.id,
+            'type': book.type,
+            'title': book.title,
+            'description': book.description,
+            'publish_date': book.publish_date.isoformat() if book.publish_date else None,
+            'page_count': book.page_count,
+            'author': {'id': book.author.id, 'name': book.author.name} if book.author else None,
+            'category': {'id': book.category.id, 'name': book.category.name} if book.category else None,
+            'sub_category': {'id': book.sub_category.id, 'name': book.sub_category.name}
+            if book.sub_category else None,
+            'cover_image': book.cover_image.name if book.cover_image else None,
+        }
+
+    @cached_property
+    def version(self):
+        pages = BookPage.objects.filter(book_id=self.book.id).aggregate(count=Count('pk'),
+                                                                        updated=Max('last_update_time'))
+        key = json.dumps([self.get_metadata(), pages['count'], pages['updated']], sort_keys=True, default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    def get_name(self):
+        return os.path.join(self.book.path, self.directory, self.version + self.extension)
+
+    def get_path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.get_name())
+
+    def get_url(self):
+        return default_storage.url(self.get_name())
+
+    def exists(self):
+        return os.path.exists(self.get_path())
+
+    def build(self):
+        """
+        Writes the bundle of the current version if missing, the outdated ones are left to prune
+        """
+        path = self.get_path()
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(path):
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            os.close(handle)
+            try:
+                self.write(temp_path)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return path
+
+    def schedule_build(self):
+        """
+        Enqueues the build of the bundle of an approved book once per version
+        """
+        key = 'book-bundle-build:{book}:{version}'.format(book=self.book.id, version=self.version)
+        if self.book.approved and cache.add(key, True, timeout=self.build_timeout):
+            Job.objects.enqueue('books.bundle', book_id=self.book.id)
+
+    def prune(self, max_age):
+        """
+        Removes the bundles of the outdated versions (and the leftovers of failed builds) older than max_age seconds,
+        a client may still be redirected to the previous bundle
+        """
+        return remove_outdated(os.path.dirname(self.get_path()), self.version, max_age)
+
+    def write(self, path):
+        metadata = dict(self.get_metadata(), version=self.version)
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+            index = {}
+            for name, with_tashkeel in [('content.json', True), ('content_no_tashkeel.json', False)]:
+                with bundle.open(name, 'w') as output:
+                    self.write_pages(output, with_tashkeel, index)
+            metadata['pages'] = len(index)
+            bundle.writestr('index.json', json.dumps(
+                {'fields': ['number', 'vol', 'page', 'offset', 'length', 'no_tashkeel_offset',
+                            'no_tashkeel_length'],
+                 'pages': [index[number] for number in sorted(index)]}))
+            cover = self.get_thumbnail()
+            if cover:
+                metadata['cover_image'] = 'cover.jpg'
+                bundle.writestr('cover.jpg', cover)
+            bundle.writestr('metadata.json', json.dumps(metadata, ensure_ascii=False).encode('utf-8'))
+
+    def write_pages(self, output, with_tashkeel, index):
+        """
+        Writes the pages as a json list, recording the byte offset and length of every page
+        """
+        pages = BookPage.objects.filter(book_id=self.book.id).order_by('number') \
+            .only('book_id', 'number', 'volume', 'source_page', 'text' if with_tashkeel else 'text_no_tashkeel')
+        output.write(b'[')
+        position = 1
+        for page in pages.iterator(chunk_size=self.page_batch):
+            data = json.dumps(page.as_dict(with_tashkeel), ensure_ascii=False).encode('utf-8')
+            if position > 1:
+                output.write(b',')
+                position += 1
+            output.write(data)
+            if with_tashkeel:
+                index[page.number] = [page.number, page.volume, page.source_page, position, len(data), None, None]
+            elif page.number in index:
+                index[page.number][5:] = [position, len(data)]
+            position += len(data)
+        output.write(b']')
+
+    def get_thumbnail(self):
+        if not self.book.cover_image:
+            return None
+        try:
+            with self.book.cover_image.open('rb') as cover:
+                image = Image.open(cover)
+                image.thumbnail(self.thumbnail_size)
+                output = io.BytesIO()
+                image.convert('RGB').save(output, format='JPEG', quality=85)
+                return output.getvalue()
+        except (IOError, OSError, ValueError):
+            return None
@@ -0,0 +1,53 @@
+from array import array
+from bisect import bisect_left
+
+from pyarabic.araby import is_tashkeel
+
+
+class TashkeelOffsets(object):
+    """
+    Converts the offsets of a page text with tashkeel to the offsets of the same text without it and back, from the
+    sorted positions of the tashkeel marks in the text. Built once when the page is stored, both conversions are
+    binary searches over the positions
+    """
+    typecode = 'I'
+
+    def __init__(self, positions=None):
+        self.positions = positions if positions is not None else array(self.typecode)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(array(cls.typecode, (index for index, char in enumerate(text or '') if is_tashkeel(char))))
+
+    @classmethod
+    def from_bytes(cls, data):
+        positions = array(cls.typecode)
+        positions.frombytes(bytes(data or b''))
+        return cls(positions)
+
+    def to_bytes(self):
+        return self.positions.tobytes()
+
+    def to_plain(self, offset):
+        """
+        Offset without tashkeel of the character at the offset with tashkeel, a mark maps to the letter after it
+        """
+        return offset - bisect_left(self.positions, offset)
+
+    def to_tashkeel(self, offset):
+        """
+        Offset with tashkeel of the letter at the offset without tashkeel
+        """
+        # a mark at positions[i] follows positions[i] - i letters and that count never decreases, so the marks before
+        # the letter are the ones following at most offset letters
+        low, high = 0, len(self.positions)
+        while low < high:
+            middle = (low + high) // 2
+            if self.positions[middle] - middle <= offset:
+                low = middle + 1
+            else:
+                high = middle
+        return offset + low
+
+    def __len__(self):
+        return len(self.positions)
@@ -0,0 +1,176 @@
+import datetime
+import gzip
+import json
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .models import Book, BookNote, BookPage, ReadBook, PopularBook
+from ..categories.models import Category
+from ..core.factories import create_user
+from ..core.jobs import JobWorker
+from ..core.models import Job
+
+
+@override_settings(DEFAULT_PAGE_SIZE=4, MAX_PAGE_SIZE=6)
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.category = Category.objects.create(name='category')
+        self.books = [Book.objects.create(title='book %d' % i, approved=True, category=self.category, page_count=10)
+                      for i in range(15)]
+        for book in self.books[:8]:
+            ReadBook.objects.create(user=self.user, book=book, page=1)
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_page_size_is_capped(self):
+        for url in ['/api/v1/books/', '/api/v1/categories/%d/books/' % self.category.id, '/api/v1/user/reads/']:
+            self.assertEqual(len(self.get(url)['results']), 4)
+            self.assertEqual(len(self.get(url + '?page_size=1000')['results']), 6)
+            self.assertEqual(len(self.get(url + '?offset=0&limit=1000')['results']), 6)
+            self.assertEqual(len(self.get(url + '?cursor=&page_size=1000')['results']), 6)
+
+    def test_next_cursor_walks_every_row_once(self):
+        url = '/api/v1/categories/%d/books/?cursor=&page_size=6' % self.category.id
+        seen = []
+        while url:
+            data = self.get(url)
+            seen.extend(book['id'] for book in data['results'])
+            url = data['next']
+        self.assertEqual(sorted(seen), sorted(book.id for book in self.books))
+
+    def test_user_books_sections_link_to_the_next_page(self):
+        data = self.get('/api/v1/user/books/')
+        self.assertEqual(len(data['reads']), 4)
+        self.assertIsNotNone(data['next']['reads'])
+        self.assertIsNone(data['next']['listens'])
+
+    def test_reads_are_ordered_by_the_latest_reading(self):
+        reading = ReadBook.objects.get(user=self.user, book=self.books[0])
+        reading.page = 2
+        reading.save()
+
+        ids = [book['id'] for book in self.get('/api/v1/user/reads/')['results']]
+        self.assertEqual(ids, [self.books[0].id] + [book.id for book in reversed(self.books[5:8])])
+
+    def test_book_lists_stay_arrays_capped_at_the_maximum(self):
+        for page in range(8):
+            BookNote.objects.create(user=self.user, book=self.books[0], note='note', page=page, start=0, end=1,
+                                    tashkeel_start=0, tashkeel_end=1)
+        self.assertEqual(len(self.get('/api/v1/books/%d/notes/?page_size=1000' % self.books[0].id)), 6)
+        self.assertIsInstance(self.get('/api/v1/books/%d/marks/' % self.books[0].id), list)
+        self.assertIsInstance(self.get('/api/v1/books/%d/reviews/' % self.books[0].id), list)
+
+
+@override_settings(JOB_QUEUE_EAGER=0)
+class PopularBookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [create_user('reader%d' % i) for i in range(3)]
+        self.books = [Book.objects.create(title='book %d' % i, approved=True, type='book') for i in range(3)]
+        self.read(self.books[0], 2)
+        self.read(self.books[1], 1)
+
+    def read(self, book, readers):
+        for user in self.users[:readers]:
+            ReadBook.objects.get_or_create(user=user, book=book, defaults={'page': 1})
+
+    def get_board(self):
+        return [(book.pk, book.rank, book.activity_count) for book in PopularBook.objects.get_books('reads', 'week')]
+
+    def test_missing_board_is_refreshed_on_the_job_queue(self):
+        self.assertEqual(self.get_board(), [])
+        self.assertEqual(self.get_board(), [])
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')),
+                         [('books.popular', {'kind': 'reads', 'period': 'week'})])
+
+        JobWorker().run_batch()
+
+        self.assertEqual(self.get_board(), [(self.books[0].pk, 1, 2), (self.books[1].pk, 2, 1)])
+
+    def test_previous_board_is_served_until_the_new_one_is_built(self):
+        last_week = timezone.now().date() - datetime.timedelta(days=7)
+        PopularBook.objects.refresh('reads', 'week', today=last_week)
+
+        self.assertEqual(self.get_board(), [(self.books[0].pk, 1, 2), (self.books[1].pk, 2, 1)])
+        self.assertTrue(Job.objects.filter(name='books.popular').exists())
+
+    def test_refresh_writes_only_the_changed_ranks(self):
+        PopularBook.objects.refresh('reads', 'week')
+        first = PopularBook.objects.get(kind='reads', period='week', rank=1)
+        self.read(self.books[1], 3)
+        self.read(self.books[2], 1)
+
+        self.assertEqual(PopularBook.objects.refresh('reads', 'week'), 3)
+
+        self.assertEqual(self.get_board(), [(self.books[1].pk, 1, 3), (self.books[0].pk, 2, 2),
+                                            (self.books[2].pk, 3, 1)])
+        self.assertEqual(PopularBook.objects.get(kind='reads', period='week', rank=1).pk, first.pk)
+        self.assertEqual(Job.objects.count(), 0)
+
+
+@override_settings(JOB_QUEUE_EAGER=0)
+class BookDownloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.book = Book.objects.create(title='book', approved=True, page_count=2)
+        prepared = BookPage.objects.prepare([{'text': 'first page'}, {'text': 'second page'}])
+        for page in prepared:
+            page.search_vector = None
+        BookPage.objects.build(self.book, prepared=prepared)
+
+    def download(self, **headers):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get('/api/v1/books/%d/download/' % self.book.id, HTTP_ACCEPT_ENCODING='gzip',
+                                       **headers)
+            content = b''.join(response.streaming_content) if response.status_code == 200 else b''
+        return response, content
+
+    def test_missing_artifact_is_streamed_and_built_on_the_job_queue(self):
+        response, content = self.download()
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual([page['text'] for page in json.loads(content.decode('utf-8'))['content']],
+                         ['first page', 'second page'])
+        self.download()
+        self.assertEqual(Job.objects.filter(name='books.download').count(), 1)
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            JobWorker().run_batch()
+        compressed, compressed_content = self.download()
+
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed_content), content)
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=compressed['ETag'])[0].status_code, 304)
+
+    def test_missing_bundle_is_streamed_and_built_on_the_job_queue(self):
+        response, content = self.download(QUERY_STRING='bundle=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(content.decode('utf-8'))['title'], 'book')
+        self.assertEqual(list(Job.objects.filter(name='books.bundle').values_list('payload', flat=True)),
+                         [{'book_id': self.book.id}])
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            JobWorker().run_batch()
+
+        self.assertEqual(self.download(QUERY_STRING='bundle=true')[0].status_code, 302)
+
+    def test_version_is_stored_until_the_book_changes(self):
+        response, _ = self.download()
+        self.book.refresh_from_db()
+        self.assertEqual(response['ETag'], '"{version}"'.format(version=self.book.download_version))
+
+        self.book.title = 'renamed'
+        self.book.save()
+        self.assertIsNone(Book.objects.get(pk=self.book.pk).download_version)
+        self.assertNotEqual(self.download()[0]['ETag'], response['ETag'])
@@ -1,5 +1,3 @@
-from pyarabic.araby import strip_tashkeel, is_tashkeel
-
 from .models import MarkPosition
 
 
@@ -15,57 +13,97 @@ class ArabicUtilities(object):
 
     @staticmethod
     def get_tashkeel_position(page, start, end):
-        if not page or start is None or start < 0 or not end:
+        """
+        Converts the offsets in the page text without tashkeel to the offsets in the text with tashkeel
+        """
+        if not page or start is None or start < 0 or not end or start > end or end > len(page.text_no_tashkeel):
             return None
-        tashkeel_start = None
-        tashkeel_end = None
-        counter = -1
-        index = 0
-        for char in page:
-            if not is_tashkeel(char):
-                counter += 1
-                if counter == start:
-                    tashkeel_start = index
-            if counter == end:
-                tashkeel_end = index
-                break
-            index += 1
-        return MarkPosition(tashkeel_start, tashkeel_end)
+        return MarkPosition(page.offsets.to_tashkeel(start), page.offsets.to_tashkeel(end))
 
     @staticmethod
     def get_no_tashkeel_position(page, start, end):
-        if not page or start is None or start < 0 or not end:
+        """
+        Converts the offsets in the page text with tashkeel to the offsets in the text without tashkeel
+        """
+        if not page or start is None or start < 0 or not end or start > end or end > len(page.text):
             return None
-        marked = page[:end] + ArabicUtilities.end_mark + page[end:]
-        no_tashkeel = strip_tashkeel(marked[:start] + ArabicUtilities.start_mark + marked[start:])
-        return MarkPosition(no_tashkeel.index(ArabicUtilities.start_mark),
-                            no_tashkeel.index(ArabicUtilities.end_mark) - len(ArabicUtilities.start_mark))
+        return MarkPosition(page.offsets.to_plain(start), page.offsets.to_plain(end))
+
+    @staticmethod
+    def get_highlight_spans(notes, page_no, offsets=None):
+        """
+        Returns the (start, end, is_note) spans of the notes on the page, as slice positions in the page text without
+        tashkeel or, given the offsets of the page, in the text with tashkeel
+        """
+        spans = []
+        for note in notes:
+            if note.page != page_no or not note.end or note.start is None or note.start < 0:
+                continue
+            # the offsets are one based
+            start, end = note.start - 1, note.end - 1
+            if offsets is not None:
+                # a letter and its marks are highlighted together
+                start, end = offsets.to_tashkeel(max(start, 0)), offsets.to_tashkeel(max(end, 0))
+            spans.append((start, end, bool(note.note)))
+        return spans
 
     @staticmethod
-    def get_highlighted_text(comments, page, page_no, with_tashkeel=False):
-        if not comments or not page:
-            return page
-        added = []
-        if not with_tashkeel:
-            page = strip_tashkeel(page)
-        for comment in comments:
-            if comment.page != page_no or not comment.end or comment.start is None or comment.start < 0:
+    def render_highlights(text, spans):
+        """
+        Wraps the (start, end, is_note) spans of the text in highlight tags in one pass. Overlapping spans of the same
+        kind are merged, a note and a highlight overlapping are nested (the inner one is closed and reopened when the
+        outer one ends first), so the tags are always well formed whatever order the notes were created in
+        """
+        if not text or not spans:
+            return text
+        length = len(text)
+        merged = {}
+        for start, end, is_note in sorted((max(start, 0), min(end, length), is_note) for start, end, is_note in spans):
+            if start >= end:
                 continue
-            start = comment.start
-            end = comment.end
-            mark_start = ArabicUtilities.start_mark
-            if with_tashkeel:
-                start = comment.tashkeel_start
-                end = comment.tashkeel_end
-            if comment.note:
-                mark_start = ArabicUtilities.note_start_mark
-            start = start - 1 + sum([len(mark) for mark in added])
-            page = page[:start] + mark_start + page[start:]
-            added.append(mark_start)
-            end = end - 1 + sum([len(mark) for mark in added])
-            page = page[:end] + ArabicUtilities.end_mark + page[end:]
-            added.append(ArabicUtilities.end_mark)
+            intervals = merged.setdefault(is_note, [])
+            if intervals and start <= intervals[-1][1]:
+                intervals[-1][1] = max(intervals[-1][1], end)
+            else:
+                intervals.append([start, end])
+        starts = {}
+        for is_note, intervals in merged.items():
+            for start, end in intervals:
+                starts.setdefault(start, []).append((end, is_note))
+        boundaries = sorted(set(starts).union(end for intervals in merged.values() for start, end in intervals))
+
+        tag_start = {True: ArabicUtilities.note_tag_start, False: ArabicUtilities.highlight_tag_start}
+        parts = []
+        # the open (end, is_note) spans, innermost last. The merged spans of one kind never overlap, so it holds one
+        # span per kind at most
+        opened = []
+        position = 0
+        for boundary in boundaries:
+            parts.append(text[position:boundary])
+            position = boundary
+            if any(end == boundary for end, is_note in opened):
+                reopen = []
+                while any(end == boundary for end, is_note in opened):
+                    end, is_note = opened.pop()
+                    parts.append(ArabicUtilities.tag_end)
+                    if end != boundary:
+                        reopen.append((end, is_note))
+                for span in reversed(reopen):
+                    opened.append(span)
+                    parts.append(tag_start[span[1]])
+            # the longest span starting here is the outermost
+            for span in sorted(starts.get(boundary, []), reverse=True):
+                opened.append(span)
+                parts.append(tag_start[span[1]])
+        parts.append(text[position:])
+        return ''.join(parts)
 
-        return page.replace(ArabicUtilities.end_mark, ArabicUtilities.tag_end) \
-            .replace(ArabicUtilities.note_start_mark, ArabicUtilities.note_tag_start) \
-            .replace(ArabicUtilities.start_mark, ArabicUtilities.highlight_tag_start)
+    @staticmethod
+    def get_highlighted_text(notes, text, page_no, offsets=None):
+        """
+        Highlights the notes of the page in its text without tashkeel, or in its text with tashkeel given the offsets
+        of the page
+        """
+        if not notes or not text:
+            return text
+        return ArabicUtilities.render_highlights(text, ArabicUtilities.get_highlight_spans(notes, page_no, offsets))
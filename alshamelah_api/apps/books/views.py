@@ -2,24 +2,28 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-import datetime
+from collections import OrderedDict
 
-from django.db.models import Avg, F, Count, Q
+from django.conf import settings
+from django.db.models import F, Prefetch
+from django.http import HttpResponseRedirect
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from drf_yasg.utils import swagger_auto_schema
-from pyarabic.araby import strip_tashkeel
-from rest_framework import viewsets, status, views, mixins
+from rest_framework import viewsets, status, views, mixins, generics
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import MultiPartParser, JSONParser, FormParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_extensions.mixins import NestedViewSetMixin
 from rolepermissions.checkers import has_permission
 
-from .filters import BookFilter, BooksFilterBackend, BookParameters, BookPageParameters, BookPageSearchParameters
+from .filters import BookFilter, BooksFilterBackend, BookParameters, BookPageParameters, BookPageSearchParameters, \
+    LibrarySearchParameters, PopularBooksParameters, BookDownloadParameters, BookPageWindowParameters
 from .models import Book, BookMark, BookNote, BookAudio, BookPDF, BookReview, BookReviewLike, \
-    ReadBook, FavoriteBook, BookSuggestion, DownloadBook, ListenBook, SearchBook, Paper, Thesis
+    FavoriteBook, BookSuggestion, DownloadBook, ListenBook, SearchBook, Paper, Thesis, BookPage, PopularBook
 from .permissions import CanManageBook, CanSubmitBook, CanManageBookMark, CanManageBookAudio, \
     CanManageBookComment, CanManageBookPdf, CanManageBookReview, CanManageUserData
 from .serializers import BookSerializer, BookMarkSerializer, BookPDFSerializer, BookAudioSerializer, \
@@ -28,94 +32,83 @@ from .serializers import BookSerializer, BookMarkSerializer, BookPDFSerializer,
     BookSuggestionSerializer, DownloadBookSerializer, BookSearchSerializer, BookSearchListSerializer, \
     ListenProgressSerializer, UserBookListSerializer, UploadPaperSerializer, PaperListSerializer, SubmitPaperSerializer, \
     UploadThesisSerializer, SubmitThesisSerializer, ThesisListSerializer, UserReviewSerializer, \
-    UserReviewListSerializer, UserBookNoteListSerializer
+    UserReviewListSerializer, UserBookNoteListSerializer, BookPageSearchSerializer
+from .search import ArabicSearch
+from .services import BookDownloadService, BookBundleService
 from .util import ArabicUtilities
 from ..chatrooms.models import Seminar, Discussion, ChatRoom
 from ..chatrooms.serializers import SeminarListSerializer, DiscussionListSerializer, ChatRoomListSerializer
-from ..core.pagination import CustomLimitOffsetPagination, CustomPageNumberPagination
-from ..points.models import UserStatistics
+from ..core.cache import cache_anonymous_response, ResponseCache
+from ..core.pagination import CustomLimitOffsetPagination, CustomPageNumberPagination, KeysetCursorPagination
+from ..core.models import Job
 from ..points.services import PointsService
 from ..users.roles import AppPermissions
 from ..users.services import FCMService
 
 
 class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.filter(approved=True).prefetch_related('category', 'reviews')
+    queryset = Book.objects.filter(approved=True).defer('content', 'data').prefetch_related('category', 'reviews')
     permission_classes = (CanManageBook,)
     filterset_class = BookFilter
     filter_backends = (BooksFilterBackend,)
     parser_classes = [MultiPartParser]
+    search_limit = 50
+    sort_fields = {
+        'add_date': 'creation_time',
+        'author': 'author__name',
+        'pages': 'page_count',
+        'downloads': 'stats__download_count',
+        'reads': 'stats__read_count',
+        'rate': 'stats__rating_avg',
+        'has_audio': 'stats__has_audio',
+    }
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
             return CustomPageNumberPagination
 
     def get_queryset(self):
-        if self.action == 'list':
-            return Book.objects.filter(approved=True).prefetch_related('category', 'reviews', 'downloads',
-                                                                       'listens', 'book_media', 'readers')
-        return self.queryset
+        queryset = Book.objects.all() if self.request.user.is_superuser else Book.objects.filter(approved=True)
+        if self.action == 'details':
+            return queryset.prefetch_related('category', 'reviews')
+        queryset = queryset.defer('content', 'data')
+        if self.action in ['list', 'retrieve']:
+            return queryset.with_list_stats(self.request.user)
+        if self.action in ['view', 'pages']:
+            return queryset
+        return queryset.prefetch_related('category', 'reviews')
 
     def filter_queryset(self, queryset):
-        ordering = self.request.query_params.get('sort', 'author')
-        if self.request.user.is_superuser:
-            queryset = Book.objects.all().prefetch_related('category', 'reviews')
+        sort = self.request.query_params.get('sort', 'author')
         queryset = super(BookViewSet, self).filter_queryset(queryset)
         if self.request.query_params.get('has_audio', None) is not None:
-            has_audio = self.request.query_params.get('has_audio') != 'true'
-            queryset = queryset.filter(book_media__isnull=False, book_media__type='audio',
-                                       book_media__approved=True).prefetch_related(
-                'book_media') if not has_audio else queryset.annotate(
-                audio_count=Count('book_media', filter=Q(book_media__type='audio') & Q(
-                    book_media__approved=True))).filter(audio_count=0)
-        if ordering == 'rate':
-            return queryset.annotate(avg_rate=Avg('reviews__rating')).order_by(F('avg_rate').asc(nulls_last=False))
-        if ordering == '-rate':
-            return queryset.annotate(avg_rate=Avg('reviews__rating')).order_by(F('avg_rate').desc(nulls_last=True))
-        if ordering == 'add_date':
-            ordering = 'creation_time'
-        if ordering == '-add_date':
-            ordering = '-creation_time'
-        if ordering in ['pages', '-pages']:
-            ordering = ordering.replace('pages', 'page') + '_count'
-        if ordering == 'downloads':
-            return queryset.annotate(download_count=Count('downloads')).order_by(
-                F('download_count').asc(nulls_last=False))
-        if ordering == '-downloads':
-            return queryset.annotate(download_count=Count('downloads')).order_by(
-                F('download_count').desc(nulls_last=True))
-        if ordering == 'reads':
-            return queryset.annotate(read_count=Count('readers')).order_by(F('read_count').asc(nulls_last=False))
-        if ordering == '-reads':
-            return queryset.annotate(read_count=Count('readers')).order_by(F('read_count').desc(nulls_last=True))
-        # if ordering == 'searches':
-        #     return queryset.annotate(search_count=Count('searches')).order_by(F('search_count').asc(nulls_last=False))
-        # if ordering == '-searches':
-        #     return queryset.annotate(search_count=Count('searches')).order_by(F('search_count').desc(nulls_last=True))
-        if ordering == 'has_audio':
-            return queryset.annotate(has_audio=Count('book_media', filter=Q(book_media__type='audio') & Q(
-                book_media__approved=True))).order_by(F('has_audio').asc(nulls_last=True))
-        if ordering == '-has_audio':
-            return queryset.annotate(has_audio=Count('book_media', filter=Q(book_media__type='audio') & Q(
-                book_media__approved=True))).order_by(F('has_audio').desc(nulls_last=True))
-
-        return queryset.order_by(ordering)
-
-    def dispatch(self, request, *args, **kwargs):
-        book_id = kwargs.get('pk', None)
-        if book_id:
-            self.book = get_object_or_404(Book, pk=book_id)
-        return super(BookViewSet, self).dispatch(request, *args, **kwargs)
+            queryset = queryset.filter(stats__has_audio=self.request.query_params.get('has_audio') == 'true')
+        descending = sort.startswith('-')
+        field = self.sort_fields.get(sort.lstrip('-'), sort.lstrip('-'))
+        # the pk breaks ties so that every sort is a total order the cursor pagination can resume from
+        if descending:
+            return queryset.order_by(F(field).desc(nulls_last=True), F('pk').desc())
+        return queryset.order_by(F(field).asc(nulls_last=True), F('pk').asc())
+
+    @cached_property
+    def book(self):
+        return get_object_or_404(Book.objects.defer('content', 'data'), pk=self.kwargs.get('pk', None))
+
+    def get_object(self):
+        self.book = super(BookViewSet, self).get_object()
+        return self.book
 
     def get_serializer_context(self):
         """
         Extra context provided to the serializer class.
         """
         context = super(BookViewSet, self).get_serializer_context()
-        if hasattr(self, 'book'):
+        if self.kwargs.get('pk', None):
             context.update(
                 book=self.book
             )
@@ -138,11 +131,12 @@ class BookViewSet(viewsets.ModelViewSet):
             return ListenProgressSerializer
         return BookSerializer
 
+    @cache_anonymous_response('books')
     def list(self, request, *args, **kwargs):
         request.encoding = 'utf-8'
         if request.user.id and request.query_params.keys():
             keys = list(request.query_params.keys())
-            non_filter_keys = ['sort', 'page', 'page_size']
+            non_filter_keys = ['sort', 'page', 'page_size', 'cursor', 'count']
             for key in non_filter_keys:
                 if key in keys:
                     keys.remove(key)
@@ -158,15 +152,7 @@ class BookViewSet(viewsets.ModelViewSet):
             Get book details without content for view
         """
         request.encoding = 'utf-8'
-        # Client can control the page using this query parameter.
         book = self.get_object()
-        tashkeel = request.query_params.get('tashkeel', None) != 'false'
-        if not tashkeel:
-            content = list(book.content)
-            for page in content:
-                page['text'] = strip_tashkeel(page['text'])
-            book.content = content
-
         serializer = self.get_serializer(book)
 
         return Response(serializer.data)
@@ -192,27 +178,52 @@ class BookViewSet(viewsets.ModelViewSet):
         tashkeel = request.query_params.get('tashkeel', None) != 'false'
         page = request.query_params.get('page', "1")
         if page: page = int(page)
-        if not page or not book.pages or not type(book.pages) != 'str' or page > len(book.pages):
+        book_page = BookPage.objects.get_page(book.id, page) if page else None
+        if not book_page:
             return Response(_('Page not found'), status=status.HTTP_400_BAD_REQUEST)
-        data = book.pages[page - 1]['text']
-        if request.user.id is None or not book.book_notes.exists():
-            if not tashkeel and data:
-                data = strip_tashkeel(data)
-        else:
+        data = book_page.get_text(tashkeel)
+        if request.user.id is not None and book.book_notes.exists():
             data = ArabicUtilities.get_highlighted_text(book.book_notes.filter(user_id=request.user.id, page=page),
-                                                        data, page, tashkeel)
+                                                        data, page, book_page.offsets if tashkeel else None)
+        if has_permission(request.user, AppPermissions.edit_user_data):
+            Job.objects.enqueue('books.read', user_id=request.user.id, book_id=pk, page=page)
+
+        return Response(data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(manual_parameters=BookPageWindowParameters)
+    @action(detail=True, methods=['get'], permission_classes=[])
+    def pages(self, request, pk=None):
+        """
+            Pages from-to of the book with the highlights of the user, for reading ahead
+        """
+        book = self.get_object()
+        tashkeel = request.query_params.get('tashkeel', None) != 'false'
+        try:
+            first = int(request.query_params.get('from', 1))
+            last = int(request.query_params.get('to', first))
+        except ValueError:
+            return Response(_('Invalid page range'), status=status.HTTP_400_BAD_REQUEST)
+        if first < 1 or last < first:
+            return Response(_('Invalid page range'), status=status.HTTP_400_BAD_REQUEST)
+        last = min(last, first + settings.MAX_PAGE_WINDOW - 1)
+        book_pages = list(BookPage.objects.get_window(book.id, first, last, tashkeel))
+        if not book_pages:
+            return Response(_('Page not found'), status=status.HTTP_400_BAD_REQUEST)
+        notes = {}
+        if request.user.id is not None:
+            for note in BookNote.objects.filter(user_id=request.user.id, book_id=book.id,
+                                                page__gte=first, page__lte=book_pages[-1].number):
+                notes.setdefault(note.page, []).append(note)
+        data = []
+        for book_page in book_pages:
+            text = book_page.get_text(tashkeel)
+            if book_page.number in notes:
+                text = ArabicUtilities.get_highlighted_text(notes[book_page.number], text, book_page.number,
+                                                            book_page.offsets if tashkeel else None)
+            data.append(dict(book_page.as_dict(tashkeel), number=book_page.number, text=text))
         if has_permission(request.user, AppPermissions.edit_user_data):
-            reading = ReadBook.objects.filter(book_id=pk, user_id=request.user.id).first()
-            if reading:
-                finished = reading.page == page - 1
-                reading.finished = finished
-                reading.page = page
-                reading.save()
-                if finished:
-                    UserStatistics.objects.update_finished_read(request.user.id)
-            else:
-                ReadBook.objects.create(book_id=pk, user_id=request.user.id, page=page)
-            UserStatistics.objects.read(request.user.id, pk, page)
+            Job.objects.enqueue('books.read', user_id=request.user.id, book_id=book.id, page=book_pages[-1].number,
+                                pages=[book_page.number for book_page in book_pages])
 
         return Response(data, status=status.HTTP_200_OK)
 
@@ -222,16 +233,32 @@ class BookViewSet(viewsets.ModelViewSet):
         book = self.get_object()
         tashkeel = request.query_params.get('tashkeel', None) != 'false'
         word = request.query_params.get('word', None)
-        data = list(
-            [{'page': index, 'text':
-                (strip_tashkeel(page['text']) if tashkeel else page['text'])
-                    .replace(word, '{tag_start}{word}{tag_end}'.format(word=word,
-                                                                       tag_start=ArabicUtilities.highlight_tag_start,
-                                                                       tag_end=ArabicUtilities.tag_end))}
-             for index, page in
-             enumerate(book.pages) if word in page['text']])
+        terms = ArabicSearch.get_terms(word)
+        pages = BookPage.objects.search(word, book_id=book.id).defer('search_vector').order_by('number')
+        data = list([{'page': page.number - 1, 'text': ArabicSearch.highlight(page.get_text(tashkeel), terms)}
+                     for page in pages])
         return Response(data, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(manual_parameters=LibrarySearchParameters)
+    @action(detail=False, methods=['get'], url_path='search', url_name='library-search', permission_classes=[])
+    def library_search(self, request, *args, **kwargs):
+        """
+            Search the content of all books, returns the matching pages ranked by relevance
+        """
+        tashkeel = request.query_params.get('tashkeel', None) != 'false'
+        text = request.query_params.get('q', None)
+        pages = BookPage.objects.search(text).filter(book__approved=True, book__type='book') \
+            .select_related('book', 'book__author') \
+            .defer('search_vector', 'text_no_tashkeel' if tashkeel else 'text', 'book__content', 'book__data') \
+            .order_by('-rank', 'book_id', 'number')
+        context = self.get_serializer_context()
+        context.update(terms=ArabicSearch.get_terms(text), tashkeel=tashkeel)
+        page = self.paginate_queryset(pages)
+        serializer = BookPageSearchSerializer(instance=page if page is not None else pages[:self.search_limit],
+                                              many=True, context=context)
+        return Response(serializer.data,
+                        status=status.HTTP_200_OK) if page is None else self.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['put'], permission_classes=[CanSubmitBook], parser_classes=[JSONParser, FormParser])
     def submit(self, request, pk=None):
         self.partial_update(request, {'pk': pk, })
@@ -239,14 +266,29 @@ class BookViewSet(viewsets.ModelViewSet):
         if book:
             FCMService.notify_book_approved(book.uploader)
             PointsService().book_approval_award(book.uploader, book.pk)
+            if book.approved:
+                Job.objects.enqueue('books.bundle', book_id=book.pk)
+            ResponseCache.invalidate('books')
         return Response(status=status.HTTP_202_ACCEPTED)
 
+    @swagger_auto_schema(manual_parameters=BookDownloadParameters)
     @action(detail=True, methods=['get'], permission_classes=[])
     def download(self, request, pk=None):
-        serializer = self.get_serializer(self.get_object())
+        """
+            Streams the book with its content (with and without tashkeel), supports ETag and byte ranges,
+            or redirects to its static offline bundle
+        """
+        book = self.get_object()
+        serializer = self.get_serializer(book)
         if has_permission(request.user, AppPermissions.edit_user_data) and serializer.data:
             DownloadBook.objects.update_or_create(book_id=pk, user_id=request.user.id)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if request.query_params.get('bundle', None) == 'true':
+            bundle = BookBundleService(book)
+            if bundle.exists():
+                return HttpResponseRedirect(request.build_absolute_uri(bundle.get_url()))
+            # streamed until the job queue built the bundle
+            bundle.schedule_build()
+        return BookDownloadService(book, serializer.data).get_response(request)
 
     @action(detail=True, methods=['get'], permission_classes=[])
     def listen(self, request, pk=None):
@@ -295,6 +337,9 @@ class PaperViewSet(viewsets.ModelViewSet):
         if book:
             FCMService.notify_paper_approved(book.uploader)
             PointsService().paper_approval_award(book.uploader, book.pk)
+            if book.approved:
+                Job.objects.enqueue('books.bundle', book_id=book.pk)
+            ResponseCache.invalidate('books')
         return Response(status=status.HTTP_202_ACCEPTED)
 
 
@@ -324,6 +369,9 @@ class ThesisViewSet(viewsets.ModelViewSet):
         if book:
             FCMService.notify_thesis_approved(book.uploader)
             PointsService().thesis_approved_award(book.uploader, book.pk)
+            if book.approved:
+                Job.objects.enqueue('books.bundle', book_id=book.pk)
+            ResponseCache.invalidate('books')
         return Response(status=status.HTTP_202_ACCEPTED)
 
 
@@ -398,17 +446,22 @@ class BookReviewViewSet(NestedBookViewSet):
         return self.queryset.filter(book_id=self.book.id)
 
 
-class CategoryBooksView(views.APIView):
-    def get_object(self, queryset=None):
-        return self.queryset.none()
-
+class CategoryBooksView(generics.ListAPIView):
     queryset = Book.objects.filter(approved=True)
+    serializer_class = BookListSerializer
 
-    def get(self, *args, **kwargs):
-        data = self.queryset.filter(category_id=kwargs.pop('category_id'))
-        serializer = BookListSerializer(instance=data, many=True)
-        return Response(serializer.data,
-                        status=status.HTTP_200_OK)
+    @property
+    def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
+        if 'offset' in self.request.query_params:
+            return CustomLimitOffsetPagination
+        else:
+            return CustomPageNumberPagination
+
+    def get_queryset(self):
+        return self.queryset.filter(category_id=self.kwargs.get('category_id')).defer('content', 'data') \
+            .with_list_stats(self.request.user).order_by('-creation_time', '-pk')
 
 
 category_books_view = CategoryBooksView.as_view()
@@ -456,84 +509,76 @@ class SuggestionsViewSet(viewsets.ModelViewSet):
         return BookSuggestion.objects.filter(user_id=self.request.user.id)
 
 
-class UserBooksView(views.APIView):
-    def get_object(self, queryset=None):
-        return self.queryset.none()
-
+class UserLibraryView(generics.ListAPIView):
+    """
+    One section of the user library, latest activity first
+    """
     queryset = Book.objects
+    serializer_class = UserBookListSerializer
     permission_classes = [CanManageUserData]
+    sections = ['reads', 'listens', 'downloads', 'favorites']
+    section = None
 
-    def get(self, *args, **kwargs):
-        reads_serializer = UserBookListSerializer(instance=self.queryset.filter(readers__user_id=self.request.user.id),
-                                                  many=True, context={'request': self.request})
-        listens_serializer = UserBookListSerializer(
-            instance=self.queryset.filter(listens__user_id=self.request.user.id),
-            many=True, context={'request': self.request})
-        downloads_serializer = UserBookListSerializer(
-            instance=self.queryset.filter(downloads__user_id=self.request.user.id),
-            many=True, context={'request': self.request})
-        favorites_serializer = UserBookListSerializer(
-            instance=self.queryset.filter(favorite_books__user_id=self.request.user.id),
-            many=True, context={'request': self.request})
+    @property
+    def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
+        if 'offset' in self.request.query_params:
+            return CustomLimitOffsetPagination
+        else:
+            return CustomPageNumberPagination
 
-        return Response({
-            'reads': reads_serializer.data,
-            'listens': listens_serializer.data,
-            'downloads': downloads_serializer.data,
-            'favorites': favorites_serializer.data
-        },
-            status=status.HTTP_200_OK)
+    def get_section(self, section):
+        return self.queryset.in_library(self.request.user, section).defer('content', 'data') \
+            .with_list_stats(self.request.user).with_user_progress(self.request.user)
 
+    def get_queryset(self):
+        return self.get_section(self.section)
 
-user_books_view = UserBooksView.as_view()
 
+class UserBooksView(UserLibraryView):
+    """
+    The first page of every section of the user library with the cursor link to the rest of it, or one section
+    (`section=reads|listens|downloads|favorites`) by cursor
+    """
+    pagination_class = KeysetCursorPagination
 
-class UserReadsView(views.APIView):
-    def get_object(self, queryset=None):
-        return self.queryset.none()
+    def get(self, request, *args, **kwargs):
+        section = request.query_params.get('section', None)
+        if section in self.sections:
+            self.section = section
+            return self.list(request, *args, **kwargs)
+        data = OrderedDict()
+        links = OrderedDict()
+        for section in self.sections:
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(self.get_section(section), request, view=self)
+            data[section] = self.get_serializer(page, many=True).data
+            link = paginator.get_next_link()
+            links[section] = replace_query_param(link, 'section', section) if link else None
+        data['next'] = links
+        return Response(data, status=status.HTTP_200_OK)
 
-    queryset = Book.objects
-    permission_classes = [CanManageUserData]
 
-    def get(self, *args, **kwargs):
-        data = self.queryset.filter(readers__user_id=self.request.user.id)
-        serializer = UserBookListSerializer(instance=data, many=True, context={'request': self.request})
-        return Response(serializer.data,
-                        status=status.HTTP_200_OK)
+user_books_view = UserBooksView.as_view()
 
 
-user_reads_view = UserReadsView.as_view()
+class UserReadsView(UserLibraryView):
+    section = 'reads'
 
 
-class UserDownloadsView(views.APIView):
-    def get_object(self, queryset=None):
-        return self.queryset.none()
+user_reads_view = UserReadsView.as_view()
 
-    queryset = Book.objects
-    permission_classes = [CanManageUserData]
 
-    def get(self, *args, **kwargs):
-        data = self.queryset.filter(downloads__user_id=self.request.user.id)
-        serializer = UserBookListSerializer(instance=data, many=True, context={'request': self.request})
-        return Response(serializer.data,
-                        status=status.HTTP_200_OK)
+class UserDownloadsView(UserLibraryView):
+    section = 'downloads'
 
 
 user_downloads_view = UserDownloadsView.as_view()
 
 
-class UserListens(views.APIView):
-    def get_object(self, queryset=None):
-        return self.queryset.none()
-
-    queryset = Book.objects
-    permission_classes = [CanManageUserData]
-
-    def get(self, *args, **kwargs):
-        data = self.queryset.filter(listens__user_id=self.request.user.id)
-        serializer = UserBookListSerializer(instance=data, many=True, context={'request': self.request})
-        return Response(serializer.data,
-                        status=status.HTTP_200_OK)
+class UserListens(UserLibraryView):
+    section = 'listens'
 
 
 user_listens_view = UserListens.as_view()
@@ -571,34 +616,25 @@ class SortsListens(mixins.ListModelMixin, viewsets.GenericViewSet):
 
 class PopularBooksView(views.APIView):
     permission_classes = (AllowAny,)
+    top_count = 10
 
-    def get_queryset(self):
-        return Book.objects.filter(approved=True)
+    def get_popular(self, kind):
+        return PopularBook.objects.get_books(kind, 'month').defer('content', 'data').with_list_stats(
+            self.request.user)[:self.top_count]
 
+    @cache_anonymous_response('books')
     def get(self, request, *args, **kwargs):
-        year = datetime.datetime.now().year
-        month = datetime.datetime.now().month
-        reads_serializer = BookListSerializer(
-            instance=self.get_queryset().filter(readers__isnull=False).annotate(
-                readers_count=Count('readers',
-                                    filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-                F('readers_count').desc(nulls_last=True))[:10],
-            many=True, context={'request': self.request})
-        listens_serializer = BookListSerializer(
-            instance=self.get_queryset().filter(listens__isnull=False).annotate(
-                listens_count=Count('listens',
-                                    filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-                F('listens_count').desc(nulls_last=True))[:10],
-            many=True, context={'request': self.request})
-        downloads_serializer = BookListSerializer(
-            instance=self.get_queryset().filter(downloads__isnull=False).annotate(
-                downloads_count=Count('downloads',
-                                      filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-                F('downloads_count').desc(nulls_last=True))[:10],
-            many=True, context={'request': self.request})
+        reads_serializer = BookListSerializer(instance=self.get_popular('reads'), many=True,
+                                              context={'request': self.request})
+        listens_serializer = BookListSerializer(instance=self.get_popular('listens'), many=True,
+                                                context={'request': self.request})
+        downloads_serializer = BookListSerializer(instance=self.get_popular('downloads'), many=True,
+                                                  context={'request': self.request})
 
-        recent_serializer = BookListSerializer(instance=self.get_queryset().order_by(F('creation_time').desc())[:10],
-                                               many=True, context={'request': self.request})
+        recent_serializer = BookListSerializer(
+            instance=Book.objects.filter(approved=True).defer('content', 'data').with_list_stats(
+                self.request.user).order_by(F('creation_time').desc())[:self.top_count],
+            many=True, context={'request': self.request})
 
         return Response({
             'reads': reads_serializer.data,
@@ -612,66 +648,53 @@ class PopularBooksView(views.APIView):
 class PopularBooksViewSet(viewsets.GenericViewSet):
     permission_classes = (AllowAny,)
     serializer_class = BookListSerializer
+    ranked_actions = ['reads', 'listens', 'downloads']
 
     @property
     def pagination_class(self):
+        if self.action in self.ranked_actions or 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
             return CustomPageNumberPagination
 
     def get_queryset(self):
-        return Book.objects.filter(approved=True)
+        return Book.objects.filter(approved=True).defer('content', 'data').with_list_stats(self.request.user)
+
+    def get_popular(self, kind):
+        period = self.request.query_params.get('period', 'month')
+        if period not in PopularBook.objects.periods:
+            period = 'month'
+        query = PopularBook.objects.get_books(kind, period).defer('content', 'data').with_list_stats(
+            self.request.user)
+        page = self.paginate_queryset(query)
+        serializer = BookListSerializer(instance=page if page is not None else query, many=True,
+                                        context={'request': self.request})
 
+        return Response(serializer.data,
+                        status=status.HTTP_200_OK) if page is None else self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(manual_parameters=PopularBooksParameters)
     @action(['get'], detail=False)
+    @cache_anonymous_response('books')
     def reads(self, request, *args, **kwargs):
-        year = datetime.datetime.now().year
-        month = datetime.datetime.now().month
-        query = self.get_queryset().filter(readers__isnull=False).annotate(
-            readers_count=Count('readers',
-                                filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-            F('readers_count').desc(nulls_last=True))
-        page = self.paginate_queryset(query)
-        reads_serializer = BookListSerializer(instance=page if page is not None else query, many=True,
-                                              context={'request': self.request})
-
-        return Response(reads_serializer.data,
-                        status=status.HTTP_200_OK) if page is None else self.get_paginated_response(
-            reads_serializer.data)
+        return self.get_popular('reads')
 
+    @swagger_auto_schema(manual_parameters=PopularBooksParameters)
     @action(['get'], detail=False)
+    @cache_anonymous_response('books')
     def listens(self, request, *args, **kwargs):
-        year = datetime.datetime.now().year
-        month = datetime.datetime.now().month
-        query = self.get_queryset().filter(listens__isnull=False).annotate(
-            listens_count=Count('listens',
-                                filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-            F('listens_count').desc(nulls_last=True))
-        page = self.paginate_queryset(query)
-        listens_serializer = BookListSerializer(instance=page if page is not None else query, many=True,
-                                                context={'request': self.request})
-
-        return Response(listens_serializer.data,
-                        status=status.HTTP_200_OK) if page is None else self.get_paginated_response(
-            listens_serializer.data)
+        return self.get_popular('listens')
 
+    @swagger_auto_schema(manual_parameters=PopularBooksParameters)
     @action(['get'], detail=False)
+    @cache_anonymous_response('books')
     def downloads(self, request, *args, **kwargs):
-        year = datetime.datetime.now().year
-        month = datetime.datetime.now().month
-        query = self.get_queryset().filter(downloads__isnull=False).annotate(
-            downloads_count=Count('downloads',
-                                  filter=Q(creation_time__year=year) & Q(creation_time__month=month))).order_by(
-            F('downloads_count').desc(nulls_last=True))
-        page = self.paginate_queryset(query)
-        downloads_serializer = BookListSerializer(instance=page if page is not None else query, many=True,
-                                                  context={'request': self.request})
-
-        return Response(downloads_serializer.data,
-                        status=status.HTTP_200_OK) if page is None else self.get_paginated_response(
-            downloads_serializer.data)
+        return self.get_popular('downloads')
 
     @action(['get'], detail=False)
+    @cache_anonymous_response('books')
     def recent(self, request, *args, **kwargs):
         query = self.get_queryset().order_by(F('creation_time').desc())
         page = self.paginate_queryset(query)
@@ -688,6 +711,8 @@ class SearchesViewSet(mixins.ListModelMixin, mixins.DestroyModelMixin, viewsets.
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
@@ -707,13 +732,16 @@ class UserBookNotesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
             return CustomPageNumberPagination
 
     def get_queryset(self):
-        return BookNote.objects.filter(user_id=self.request.user.id)
+        return BookNote.objects.filter(user_id=self.request.user.id).prefetch_related(
+            Prefetch('book', queryset=Book.objects.get_all().defer('content', 'data').with_list_stats(self.request.user)))
 
     def get_serializer_class(self):
         return UserBookNoteListSerializer
@@ -730,7 +758,8 @@ class UserReviewsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
             return CustomPageNumberPagination
 
     def get_queryset(self):
-        return BookReview.objects.filter(user_id=self.request.user.id)
+        return BookReview.objects.filter(user_id=self.request.user.id).prefetch_related(
+            Prefetch('book', queryset=Book.objects.get_all().defer('content', 'data').with_list_stats(self.request.user)))
 
     def get_serializer_class(self):
         return UserReviewSerializer
@@ -739,6 +768,7 @@ class UserReviewsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 class ActivitiesBooksView(views.APIView):
     permission_classes = (AllowAny,)
 
+    @cache_anonymous_response('books', 'chatrooms')
     def get(self, request, *args, **kwargs):
         seminars_serializer = SeminarListSerializer(
             instance=Seminar.objects.order_by(
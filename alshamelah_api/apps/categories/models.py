@@ -1,8 +1,10 @@
 import os
 
 from django.db import models
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from ..core.cache import ResponseCache
 from ..core.models import BaseModel
 
 
@@ -86,3 +88,11 @@ class SubCategory(BaseModel):
                 kwargs.pop('force_insert')
 
         super(SubCategory, self).save(*args, **kwargs)
+
+
+@receiver(models.signals.post_save, sender=Category)
+@receiver(models.signals.post_save, sender=SubCategory)
+@receiver(models.signals.post_delete, sender=Category)
+@receiver(models.signals.post_delete, sender=SubCategory)
+def invalidate_categories_cache(sender, instance, **kwargs):
+    ResponseCache.invalidate('categories', 'books')
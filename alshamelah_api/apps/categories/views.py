@@ -1,6 +1,7 @@
 from rest_framework import viewsets
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
+from ..core.cache import cache_anonymous_response
 from .models import Category, SubCategory
 from .serializers import CategorySerializer, SubCategorySerializer
 
@@ -9,6 +10,14 @@ class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    @cache_anonymous_response('categories')
+    def list(self, request, *args, **kwargs):
+        return super(CategoryViewSet, self).list(request, *args, **kwargs)
+
+    @cache_anonymous_response('categories')
+    def retrieve(self, request, *args, **kwargs):
+        return super(CategoryViewSet, self).retrieve(request, *args, **kwargs)
+
 
 class SubCategoryViewSet(NestedViewSetMixin, viewsets.ModelViewSet):
     queryset = SubCategory.objects.all()
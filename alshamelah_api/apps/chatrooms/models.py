@@ -1,10 +1,12 @@
 import os
 
 from django.db import models
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from model_utils import Choices
 
 from .managers import SeminarManager, DiscussionManager, DiscussionRegistrationManager, SeminarRegistrationManager
+from ..core.cache import ResponseCache
 from ..core.models import BaseModel
 
 
@@ -147,3 +149,17 @@ class ArchivedSeminarRegistration(SeminarRegistration):
     class Meta:
         verbose_name_plural = "Archived Seminar Registrations"
         proxy = True
+
+
+@receiver(models.signals.post_save, sender=ChatRoom)
+@receiver(models.signals.post_save, sender=Seminar)
+@receiver(models.signals.post_save, sender=ArchivedSeminar)
+@receiver(models.signals.post_save, sender=Discussion)
+@receiver(models.signals.post_save, sender=ArchivedDiscussion)
+@receiver(models.signals.post_delete, sender=ChatRoom)
+@receiver(models.signals.post_delete, sender=Seminar)
+@receiver(models.signals.post_delete, sender=ArchivedSeminar)
+@receiver(models.signals.post_delete, sender=Discussion)
+@receiver(models.signals.post_delete, sender=ArchivedDiscussion)
+def invalidate_chatrooms_cache(sender, instance, **kwargs):
+    ResponseCache.invalidate('chatrooms')
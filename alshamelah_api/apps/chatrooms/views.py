@@ -15,7 +15,7 @@ from .serializers import SeminarSerializer, SeminarListSerializer, \
     DiscussionSerializer, DiscussionListSerializer, DiscussionRegistrationSerializer, \
     SeminarRegistrationSerializer
 from ..books.permissions import CanManageUserData
-from ..core.pagination import CustomPageNumberPagination, CustomLimitOffsetPagination
+from ..core.pagination import CustomPageNumberPagination, CustomLimitOffsetPagination, KeysetCursorPagination
 
 
 class ChatRoomFilter(django_filters.FilterSet):
@@ -77,6 +77,8 @@ class SeminarsViewSet(viewsets.ModelViewSet):
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
@@ -98,6 +100,8 @@ class SeminarRegistrationViewSet(mixins.DestroyModelMixin, mixins.CreateModelMix
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
@@ -128,6 +132,8 @@ class DiscussionsViewSet(viewsets.ModelViewSet):
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
@@ -149,6 +155,8 @@ class DiscussionsRegistrationViewSet(mixins.DestroyModelMixin, mixins.CreateMode
 
     @property
     def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
         if 'offset' in self.request.query_params:
             return CustomLimitOffsetPagination
         else:
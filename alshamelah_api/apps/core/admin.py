@@ -1,6 +1,22 @@
 from django.conf import settings
 from django.contrib import admin
+from django.utils.translation import ugettext_lazy as _
+
+from .models import Job
 
 
 class BaseModelAdmin(admin.ModelAdmin):
     list_per_page = settings.ADMIN_LIST_PAGE_SIZE
+
+
+@admin.register(Job)
+class JobAdmin(BaseModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'creation_time')
+    list_filter = ('status', 'name')
+    readonly_fields = ('name', 'payload', 'attempts', 'error', 'creation_time')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        queryset.update(status='pending', attempts=0, run_after=None)
+
+    requeue.short_description = _('Requeue the selected jobs')
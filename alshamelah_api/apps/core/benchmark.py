@@ -0,0 +1,87 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+
+def fetch(url, headers=None, timeout=30):
+    """
+    Returns the seconds the request took and its status, None when it did not complete
+    """
+    started = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers or {}), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except HTTPError as error:
+        status = error.code
+    except (URLError, OSError):
+        status = None
+    return time.perf_counter() - started, status
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def measure(function, iterations):
+    """
+    Returns the CPU time (in ms) of one call of the function, averaged over the iterations
+    """
+    start = time.process_time()
+    for _ in range(iterations):
+        function()
+    return (time.process_time() - start) * 1000 / iterations
+
+
+def run_load(urls, concurrency, headers=None, timeout=30):
+    """
+    Requests the urls with `concurrency` clients and returns the throughput and latency (in ms) of the run
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda url: fetch(url, headers, timeout), urls))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency * 1000 for latency, status in results)
+    return {
+        'count': len(results),
+        'errors': sum(1 for latency, status in results if status is None or status >= 400),
+        'elapsed': elapsed,
+        'rate': len(results) / elapsed if elapsed else 0,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else 0,
+    }
+
+
+class ConnectionSampler(threading.Thread):
+    """
+    Counts the server connections to the database (other than its own) while a load runs, postgres only
+    """
+    interval = 0.2
+
+    def __init__(self):
+        super(ConnectionSampler, self).__init__(daemon=True)
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        from django.db import connection
+        if connection.vendor != 'postgresql':
+            return
+        try:
+            while not self.stopped.is_set():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT count(*) - 1 FROM pg_stat_activity WHERE datname = current_database()')
+                    self.samples.append(cursor.fetchone()[0])
+                self.stopped.wait(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,88 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils import json
+
+
+class ResponseCache(object):
+    """
+    Caches the responses of anonymous catalogue reads, every cached response is keyed by the versions of the
+    resource families it was built from so bumping a family version invalidates all of them at once
+    """
+    key_prefix = 'response'
+    version_prefix = 'response-version'
+
+    @staticmethod
+    def get_version_key(family):
+        return '{prefix}:{family}'.format(prefix=ResponseCache.version_prefix, family=family)
+
+    @staticmethod
+    def get_versions(families):
+        keys = [ResponseCache.get_version_key(family) for family in families]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # start from the clock so an evicted version never revives older responses
+                cache.add(key, int(time.time() * 1000), timeout=None)
+                versions[key] = cache.get(key, 0)
+        return [versions[key] for key in keys]
+
+    @staticmethod
+    def invalidate(*families):
+        def bump():
+            for family in families:
+                key = ResponseCache.get_version_key(family)
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, int(time.time() * 1000), timeout=None)
+
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def get_key(request, families):
+        versions = ResponseCache.get_versions(families)
+        # the responses hold absolute urls, so the scheme and the host are part of the key
+        path = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return '{prefix}:{families}:{language}:{path}'.format(
+            prefix=ResponseCache.key_prefix,
+            families='.'.join('{0}{1}'.format(family, version) for family, version in zip(families, versions)),
+            language=getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE),
+            path=path)
+
+    @staticmethod
+    def is_cacheable(request):
+        return settings.RESPONSE_CACHE_ENABLED and request.method == 'GET' and not request.user.is_authenticated
+
+
+def cache_anonymous_response(*families, timeout=None):
+    """
+    Serves the decorated view handler from the cache for anonymous users
+    """
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if not ResponseCache.is_cacheable(request):
+                return handler(view, request, *args, **kwargs)
+            key = ResponseCache.get_key(request, families)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, status=status.HTTP_200_OK)
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                # cache plain json data, serializer output may hold lazy urls bound to the request
+                cache.set(key, json.loads(JSONRenderer().render(response.data)),
+                          timeout=timeout if timeout is not None else settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,14 @@
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """
+    Closes the persistent connections (CONN_MAX_AGE) that stopped working, e.g. after a restart of the database or
+    the pooler, so the next query opens a new one instead of failing. Only the connections with CONN_HEALTH_CHECKS
+    are checked.
+    """
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if not connection.in_atomic_block and not connection.is_usable():
+            connection.close()
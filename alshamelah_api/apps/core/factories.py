@@ -0,0 +1,13 @@
+from rolepermissions.roles import assign_role
+
+from ..users.models import User
+
+
+def create_user(username='reader', **fields):
+    """
+    Creates an active user with the user role, the tests of every app share it
+    """
+    fields.setdefault('email', username + '@example.com')
+    user = User.objects.create(username=username, is_active=True, **fields)
+    assign_role(user, 'user')
+    return user
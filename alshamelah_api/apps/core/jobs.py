@@ -0,0 +1,77 @@
+import traceback
+from collections import OrderedDict
+
+from django.db import transaction
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+handlers = {}
+
+
+def job_handler(name):
+    """
+    Registers the function applying the payloads of a batch of jobs of the given name, the apps register their
+    handlers in their jobs module
+    """
+
+    def decorator(function):
+        handlers[name] = function
+        return function
+
+    return decorator
+
+
+class JobWorker(object):
+    """
+    Claims the pending jobs in batches and hands the payloads of every job name to its handler at once. A failing
+    handler rolls back and its jobs are run again one at a time, so only the failing ones are retried with an
+    exponential backoff
+    """
+
+    def __init__(self, batch_size=100, max_attempts=5, backoff=30):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        JobWorker.discover()
+
+    @staticmethod
+    def discover():
+        autodiscover_modules('jobs')
+
+    @staticmethod
+    def run(name, payloads):
+        JobWorker.discover()
+        if name not in handlers:
+            raise KeyError('No handler registered for the job {name}'.format(name=name))
+        with transaction.atomic():
+            return handlers[name](payloads)
+
+    def run_batch(self):
+        """
+        Runs one batch, returns the number of jobs handled
+        """
+        jobs = Job.objects.claim(self.batch_size)
+        groups = OrderedDict()
+        for job in jobs:
+            groups.setdefault(job.name, []).append(job)
+        for name, group in groups.items():
+            if not self.run_jobs(name, group, retry=len(group) == 1):
+                # one bad payload (e.g. of a deleted book) rolled back the whole group
+                for job in group:
+                    self.run_jobs(name, [job])
+        return len(jobs)
+
+    def run_jobs(self, name, jobs, retry=True):
+        """
+        Runs the jobs in one transaction, returns whether they succeeded. Failed jobs are scheduled again unless retry
+        is off
+        """
+        try:
+            JobWorker.run(name, [job.payload for job in jobs])
+        except Exception:
+            if retry:
+                Job.objects.retry(jobs, traceback.format_exc(), self.max_attempts, self.backoff)
+            return False
+        Job.objects.complete(jobs)
+        return True
@@ -0,0 +1,91 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmark import run_load
+
+
+class Command(BaseCommand):
+    help = 'Starts gunicorn with every worker class in turn and compares the throughput and latency of the book ' \
+           'endpoints'
+    endpoints = [
+        ('books', '/books/?page={page}'),
+        ('book page', '/books/{book}/view/?page={page}'),
+        ('popular', '/books/popular/'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='sync,gthread,gevent', help='Worker classes to compare')
+        parser.add_argument('--book', type=int, required=True, help='Book whose pages are read')
+        parser.add_argument('--pages', type=int, default=50, help='Pages (and list pages) read at random')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients')
+        parser.add_argument('--workers', type=int, help='Worker processes, by default from the cpu count')
+        parser.add_argument('--port', type=int, default=8099, help='Port gunicorn listens on during the run')
+        parser.add_argument('--token', help='JWT of the user, anonymous reads are served from the response cache')
+        parser.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring every endpoint')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': 'Bearer ' + options['token']} if options['token'] else {}
+        base_url = 'http://127.0.0.1:{port}/api/v1'.format(port=options['port'])
+        rows = []
+        for mode in [mode.strip() for mode in options['modes'].split(',') if mode.strip()]:
+            try:
+                server = self.start_server(mode, options)
+            except CommandError as error:
+                # e.g. gevent is not installed
+                self.stderr.write(str(error))
+                continue
+            try:
+                for name, path in self.endpoints:
+                    urls = [base_url + path.format(book=options['book'], page=random.randint(1, options['pages']))
+                            for _ in range(options['warmup'] + options['requests'])]
+                    run_load(urls[:options['warmup']], options['concurrency'], headers)
+                    result = run_load(urls[options['warmup']:], options['concurrency'], headers)
+                    rows.append((mode, name, result))
+                    self.stdout.write('{mode:8} {name:10} {rate:8.1f}/s p50 {p50:7.1f}ms p99 {p99:7.1f}ms '
+                                      '{errors} errors'.format(mode=mode, name=name, **result))
+            finally:
+                server.terminate()
+                server.wait()
+        self.stdout.write('')
+        self.stdout.write('{0:8} {1:10} {2:>10} {3:>10} {4:>10} {5:>7}'.format(
+            'mode', 'endpoint', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+        for mode, name, result in rows:
+            self.stdout.write('{mode:8} {name:10} {rate:10.1f} {p50:10.1f} {p99:10.1f} {errors:7}'.format(
+                mode=mode, name=name, **result))
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def start_server(self, mode, options):
+        """
+        Runs gunicorn with the project configuration and the worker class, once it accepts connections
+        """
+        environment = dict(os.environ, GUNICORN_WORKER_CLASS=mode,
+                           GUNICORN_BIND='127.0.0.1:{port}'.format(port=options['port']))
+        if options['workers']:
+            environment['GUNICORN_WORKERS'] = str(options['workers'])
+        if mode == 'gevent':
+            environment['SQL_CONN_MAX_AGE'] = '0'
+        # gunicorn 19 has no __main__ module to run with -m
+        server = subprocess.Popen([sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+                                   'alshamelah.wsgi:application', '-c', 'gunicorn.conf.py'],
+                                  cwd=settings.BASE_DIR, env=environment,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited with {code} in {mode} mode, skipped'.format(
+                    code=server.returncode, mode=mode))
+            try:
+                socket.create_connection(('127.0.0.1', options['port']), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn did not start in {mode} mode, skipped'.format(mode=mode))
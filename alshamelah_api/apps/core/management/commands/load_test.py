@@ -0,0 +1,49 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...benchmark import run_load, ConnectionSampler
+
+
+class Command(BaseCommand):
+    help = 'Reads book pages concurrently from a running server and reports the latency and the database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000/api/v1', help='Base url of the api')
+        parser.add_argument('--book', type=int, help='Book whose pages are read')
+        parser.add_argument('--pages', default='1-50', help='Range of pages read at random (first-last)')
+        parser.add_argument('--path', action='append', default=[],
+                            help='Path read instead of the book pages, {page} is replaced by a random page')
+        parser.add_argument('--requests', type=int, default=1000, help='Total number of requests')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients')
+        parser.add_argument('--token', help='JWT of the user the pages are read as')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request fails')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or (['/books/{book}/view/?page={{page}}'.format(book=options['book'])]
+                                    if options['book'] else [])
+        if not paths:
+            raise CommandError('Give a --book or at least one --path')
+        try:
+            first, last = [int(page) for page in options['pages'].split('-')]
+        except ValueError:
+            raise CommandError('--pages must look like 1-50')
+        headers = {'Authorization': 'Bearer ' + options['token']} if options['token'] else {}
+        urls = [options['url'].rstrip('/') + random.choice(paths).replace('{page}', str(random.randint(first, last)))
+                for _ in range(options['requests'])]
+
+        sampler = ConnectionSampler()
+        sampler.start()
+        result = run_load(urls, options['concurrency'], headers, options['timeout'])
+        sampler.stop()
+
+        self.stdout.write('{count} requests, {concurrency} concurrent, {errors} errors in {elapsed:.1f}s '
+                          '({rate:.1f} requests/s)'.format(concurrency=options['concurrency'], **result))
+        self.stdout.write('latency ms: p50 {p50:.1f}, p90 {p90:.1f}, p99 {p99:.1f}, max {max:.1f}'.format(**result))
+        if sampler.samples:
+            self.stdout.write('database connections: peak {peak}, average {average:.1f}'.format(
+                peak=max(sampler.samples), average=sum(sampler.samples) / len(sampler.samples)))
+        else:
+            self.stdout.write('database connections: not sampled ({vendor})'.format(vendor=connection.vendor))
+        self.stdout.write(self.style.SUCCESS('Done'))
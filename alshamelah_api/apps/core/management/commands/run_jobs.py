@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...db import check_connections
+from ...jobs import JobWorker
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued background jobs in batches, runs until stopped unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Jobs claimed per batch')
+        parser.add_argument('--sleep', type=float, default=1, help='Seconds to wait when nothing is pending')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before a job is marked failed')
+        parser.add_argument('--backoff', type=int, default=30, help='Seconds before the first retry, doubled after')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is pending')
+
+    def handle(self, *args, **options):
+        worker = JobWorker(batch_size=options['batch'], max_attempts=options['max_attempts'],
+                           backoff=options['backoff'])
+        total = 0
+        try:
+            while True:
+                # the worker outlives CONN_MAX_AGE like a request would
+                close_old_connections()
+                check_connections()
+                count = worker.run_batch()
+                total += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Handled {count} jobs'.format(count=total)))
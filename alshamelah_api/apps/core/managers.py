@@ -0,0 +1,54 @@
+import datetime
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+
+class JobManager(models.Manager):
+    """
+    Jobs are inserted in the transaction of the request that creates them and claimed in batches by the workers
+    """
+    lease = 300
+    max_backoff = 3600
+
+    def enqueue(self, name, **payload):
+        if settings.JOB_QUEUE_EAGER:
+            from .jobs import JobWorker
+            return JobWorker.run(name, [payload])
+        return self.create(name=name, payload=payload)
+
+    def claim(self, batch_size):
+        """
+        Locks a batch of the due pending jobs for the lease period and returns them in insertion order, other workers
+        skip the locked and leased rows
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            pks = list(self.get_queryset().select_for_update(skip_locked=True)
+                       .filter(status='pending')
+                       .filter(models.Q(run_after__isnull=True) | models.Q(run_after__lte=now))
+                       .order_by('id').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return []
+            self.get_queryset().filter(pk__in=pks).update(
+                run_after=now + datetime.timedelta(seconds=self.lease), attempts=models.F('attempts') + 1)
+        return list(self.get_queryset().filter(pk__in=pks).order_by('id'))
+
+    def complete(self, jobs):
+        self.get_queryset().filter(pk__in=[job.pk for job in jobs]).delete()
+
+    def retry(self, jobs, error, max_attempts, backoff):
+        """
+        Schedules the jobs again with an exponential backoff, the ones out of attempts are marked failed
+        """
+        now = timezone.now()
+        for job in jobs:
+            if job.attempts >= max_attempts:
+                job.status = 'failed'
+                job.run_after = None
+            else:
+                job.run_after = now + datetime.timedelta(
+                    seconds=min(backoff * 2 ** (job.attempts - 1), self.max_backoff))
+            job.error = error
+        self.bulk_update(jobs, ['status', 'run_after', 'error'])
@@ -0,0 +1,31 @@
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('last_update_time', models.DateTimeField(auto_now=True, null=True)),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(null=True, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('run_after', models.DateTimeField(blank=True, null=True, verbose_name='Run After')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(status='pending'), fields=['run_after'], name='core_job_pending_idx'),
+        ),
+    ]
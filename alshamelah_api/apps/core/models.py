@@ -1,4 +1,11 @@
+from django.contrib.postgres.fields import JSONField
+from django.core.signals import request_started
 from django.db import models
+from django.dispatch import receiver
+from django.utils.translation import ugettext_lazy as _
+from model_utils import Choices
+
+from .db import check_connections
 
 
 class BaseModel(models.Model):
@@ -7,3 +14,31 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class Job(BaseModel):
+    from .managers import JobManager
+    objects = JobManager()
+    STATUS_CHOICES = Choices(
+        ('pending', _(u'Pending')),
+        ('failed', _(u'Failed')),
+    )
+    name = models.CharField(max_length=100, verbose_name=_(u'Name'))
+    payload = JSONField(null=True, verbose_name=_(u'Payload'))
+    status = models.CharField(choices=STATUS_CHOICES, max_length=10, default='pending', verbose_name=_(u'Status'))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_(u'Attempts'))
+    run_after = models.DateTimeField(null=True, blank=True, verbose_name=_(u'Run After'))
+    error = models.TextField(null=True, blank=True, verbose_name=_(u'Error'))
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after'], name='core_job_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return '{name} #{id}'.format(name=self.name, id=self.id)
+
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    check_connections()
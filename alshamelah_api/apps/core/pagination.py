@@ -1,21 +1,58 @@
+import base64
+import binascii
+import datetime
 from collections import OrderedDict
 
-from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, QuerySet
+from django.db.models.expressions import OrderBy
+from django.utils.encoding import force_str
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination, PageNumberPagination, BasePagination, \
+    _positive_int
 from rest_framework.response import Response
+from rest_framework.utils import json
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_page_sizes(view):
+    """
+    Returns the (default, maximum) page size of the view, a view can lower both (`page_size` and `max_page_size`)
+    but never go over MAX_PAGE_SIZE, so a list is never returned unpaginated
+    """
+    maximum = min(getattr(view, 'max_page_size', None) or settings.MAX_PAGE_SIZE, settings.MAX_PAGE_SIZE)
+    default = min(getattr(view, 'page_size', None) or settings.DEFAULT_PAGE_SIZE, maximum)
+    return default, maximum
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
-    max_page_size = 10
 
     def paginate_queryset(self, queryset, request, view=None):
-        if view is not None:
-            self.page_size = getattr(view, 'page_size', None)
+        self.page_size, self.max_page_size = get_page_sizes(view)
         return super(CustomPageNumberPagination, self).paginate_queryset(
             queryset, request, view
         )
 
 
+class CappedListPagination(BasePagination):
+    """
+    Returns the first rows of the list as a bare array, at most the maximum page size of the view. The default of
+    the lists whose clients expect an array, the other views paginate with the classes below
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if isinstance(queryset, QuerySet) and not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return list(queryset[:get_page_sizes(view)[1]])
+
+    def get_paginated_response(self, data):
+        return Response(data)
+
+
 class CustomLimitOffsetPagination(LimitOffsetPagination):
     """
     A limit/offset based style with custom count and result name. For example:
@@ -25,15 +62,14 @@ class CustomLimitOffsetPagination(LimitOffsetPagination):
     http://api.example.org/accounts/?offset=400&limit=100&count=total
     http://api.example.org/accounts/?offset=400&limit=100&count=total&result=rows
     """
-    default_limit = 10
     limit_query_param = 'limit'
     offset_query_param = 'offset'
-    max_limit = 200
     template = 'rest_framework/pagination/numbers.html'
     result_name = 'results'
     count_name = 'count'
 
     def paginate_queryset(self, queryset, request, view=None):
+        self.default_limit, self.max_limit = get_page_sizes(view)
         if 'count' in request.query_params:
             self.count_name = request.query_params['count']
 
@@ -49,3 +85,186 @@ class CustomLimitOffsetPagination(LimitOffsetPagination):
             ('previous', self.get_previous_link()),
             (self.result_name, data)
         ]))
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keeps the microseconds of times, a truncated sort value would repeat or skip rows
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorEncoder, self).default(o)
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination following the ordering of the queryset (or the default ordering of its model) with the pk as
+    the tie breaker, the opaque cursor holds the sort values of the last row so a page costs the same at any depth.
+    The count is only computed when asked for. For example:
+
+    http://api.example.org/books/?sort=-reads&cursor=
+    http://api.example.org/books/?sort=-reads&cursor=eyJvIjogWy...&page_size=20&count=true
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = _('The pagination cursor value, empty for the first page')
+    page_size_query_param = 'page_size'
+    page_size_query_description = _('Number of results to return per page')
+    count_query_param = 'count'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size, self.max_page_size = get_page_sizes(view)
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*[self.get_order_by(name, descending, nulls_last)
+                                       for name, descending, nulls_last in self.ordering])
+        self.count = queryset.count() if request.query_params.get(self.count_query_param) == 'true' else None
+        values = self.decode_cursor(request)
+        if values is not None:
+            queryset = queryset.filter(self.get_after_filter(values))
+        queryset = queryset.annotate(**{self.get_cursor_name(index): F(name)
+                                        for index, (name, descending, nulls_last) in enumerate(self.ordering)})
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        """
+        Returns the (name, descending, nulls last) keys of the queryset ordering ending with the pk
+        """
+        query = queryset.query
+        order_by = list(query.order_by) or (list(query.get_meta().ordering) if query.default_ordering else [])
+        ordering = []
+        for item in order_by:
+            if isinstance(item, OrderBy) and isinstance(item.expression, F):
+                # nulls are larger than any value unless the ordering says otherwise
+                nulls_last = item.nulls_last or (not item.nulls_first and not item.descending)
+                ordering.extend(self.expand(queryset, item.expression.name, item.descending, nulls_last))
+            elif isinstance(item, str) and item != '?':
+                descending = item.startswith('-')
+                ordering.extend(self.expand(queryset, item.lstrip('-'), descending, not descending))
+            else:
+                raise ImproperlyConfigured('Can not paginate over the ordering {item} with a cursor'.format(item=item))
+        if not any(name in ['pk', 'id'] for name, descending, nulls_last in ordering):
+            descending = ordering[-1][1] if ordering else True
+            ordering.append(('pk', descending, not descending))
+        return ordering
+
+    @staticmethod
+    def expand(queryset, name, descending, nulls_last):
+        """
+        A relation is ordered by the default ordering of its model (or its pk) like the ORM does
+        """
+        model = queryset.model
+        field = None
+        for part in name.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return [(name, descending, nulls_last)]
+            model = field.related_model if field.is_relation else None
+            if model is None:
+                break
+        if field is None or not field.is_relation or field.related_model is None:
+            return [(name, descending, nulls_last)]
+        ordering = []
+        for related in field.related_model._meta.ordering or ['pk']:
+            related_descending = related.startswith('-') != descending
+            ordering.append((name + '__' + related.lstrip('-'), related_descending, not related_descending))
+        return ordering
+
+    @staticmethod
+    def get_order_by(name, descending, nulls_last):
+        if descending:
+            return F(name).desc(nulls_last=True) if nulls_last else F(name).desc(nulls_first=True)
+        return F(name).asc(nulls_last=True) if nulls_last else F(name).asc(nulls_first=True)
+
+    def get_after_filter(self, values):
+        """
+        Rows after the cursor: equal on the leading keys and after it on the next one, for every key
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nulls_last), value in zip(self.ordering, values):
+            if value is None:
+                after = Q(pk__in=[]) if nulls_last else Q(**{name + '__isnull': False})
+                same = Q(**{name + '__isnull': True})
+            else:
+                after = Q(**{name + ('__lt' if descending else '__gt'): value})
+                if nulls_last:
+                    after |= Q(**{name + '__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    @staticmethod
+    def get_cursor_name(index):
+        return '_cursor_{index}'.format(index=index)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, dict) or cursor.get('o') != [name for name, descending, nulls_last in self.ordering] \
+                or not isinstance(cursor.get('v'), list) or len(cursor['v']) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor['v']
+
+    def encode_cursor(self, row):
+        cursor = {'o': [name for name, descending, nulls_last in self.ordering],
+                  'v': [getattr(row, self.get_cursor_name(index)) for index in range(len(self.ordering))]}
+        return base64.urlsafe_b64encode(json.dumps(cursor, cls=CursorEncoder).encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_schema_fields(self, view):
+        import coreapi
+        import coreschema
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='Cursor', description=force_str(self.cursor_query_description))
+            ),
+            coreapi.Field(
+                name=self.page_size_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Integer(title='Page size', description=force_str(self.page_size_query_description))
+            ),
+            coreapi.Field(
+                name=self.count_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.Boolean(title='Count', description=force_str(_('Include the total count')))
+            ),
+        ]
@@ -0,0 +1,104 @@
+from django.test import TestCase, override_settings
+from django.urls import get_resolver, URLResolver
+from rest_framework.generics import GenericAPIView
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .jobs import JobWorker, job_handler
+from .models import Job
+from ..categories.models import Category
+from ..users.models import User
+
+
+@job_handler('tests.create_users')
+def create_users(payloads):
+    for payload in payloads:
+        if payload.get('fail'):
+            raise ValueError('bad payload')
+        User.objects.create(username=payload['username'], email=payload['username'] + '@example.com')
+
+
+class JobWorkerTests(TestCase):
+    def test_a_failing_payload_does_not_fail_the_others(self):
+        for username in ['first', 'second']:
+            Job.objects.enqueue('tests.create_users', username=username)
+        bad = Job.objects.enqueue('tests.create_users', username='bad', fail=True)
+        Job.objects.enqueue('tests.create_users', username='third')
+
+        self.assertEqual(JobWorker(max_attempts=2).run_batch(), 4)
+
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['first', 'second', 'third'])
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [bad.pk])
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, 'pending')
+        self.assertIsNotNone(bad.run_after)
+        self.assertIn('bad payload', bad.error)
+
+    def test_a_payload_out_of_attempts_is_failed(self):
+        bad = Job.objects.enqueue('tests.create_users', username='bad', fail=True)
+        Job.objects.enqueue('tests.create_users', username='first')
+        worker = JobWorker(max_attempts=1)
+
+        worker.run_batch()
+
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, 'failed')
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['first'])
+
+
+# the list routes returning a bare array (their clients expect one), they are cut at MAX_PAGE_SIZE rows instead
+bare_array_routes = {
+    'authors-list', 'categories-list', 'sub_categories-list', 'payments-list', 'user_points-list', 'user_notes-list',
+    # the lists of one book
+    'book_marks-list', 'book_notes-list', 'book_reviews-list', 'book_audio-list', 'book_pdf-list',
+}
+
+
+def get_list_routes(patterns=None):
+    """
+    Yields the (name, view class, viewset actions) of every list route of the api
+    """
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from get_list_routes(pattern.url_patterns)
+            continue
+        view = getattr(pattern.callback, 'cls', None)
+        actions = getattr(pattern.callback, 'actions', None)
+        if view is None or not issubclass(view, GenericAPIView):
+            continue
+        if (actions or {}).get('get') == 'list' or actions is None and hasattr(view, 'list'):
+            yield pattern.name, view, actions
+
+
+@override_settings(DEFAULT_PAGE_SIZE=2, MAX_PAGE_SIZE=3)
+class ListRouteTests(TestCase):
+    queries = ['', 'page_size=1000', 'page=1&page_size=1000', 'offset=0&limit=1000', 'cursor=&page_size=1000']
+
+    def setUp(self):
+        for index in range(5):
+            Category.objects.create(name='category %d' % index)
+
+    def paginate(self, view_class, actions, query):
+        view = view_class()
+        view.request = Request(APIRequestFactory().get('/?' + query))
+        view.args, view.kwargs, view.format_kwarg = (), {}, None
+        if actions is not None:
+            view.action = actions['get']
+        paginator = view.paginator
+        self.assertIsNotNone(paginator)
+        page = paginator.paginate_queryset(Category.objects.all(), view.request, view=view)
+        return page, paginator.get_paginated_response([]).data
+
+    def test_every_list_route_is_bounded(self):
+        routes = {}
+        for name, view_class, actions in get_list_routes():
+            routes[name] = view_class
+            for query in self.queries:
+                page, data = self.paginate(view_class, actions, query)
+                self.assertLessEqual(len(page), 3, (name, query))
+                if name in bare_array_routes:
+                    self.assertIsInstance(data, list, name)
+                else:
+                    self.assertIn('results', data, name)
+        self.assertTrue({'books-list', 'category_books', 'user_reads', 'user_books'} < set(routes))
+        self.assertTrue(bare_array_routes < set(routes))
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...models import UserStatistics
+from ....users.models import DailyLogin
+
+
+class Command(BaseCommand):
+    help = 'Computes the current and longest login streak of every user from the daily login history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', default=[], help='Only backfill these users')
+
+    def handle(self, *args, **options):
+        logins = DailyLogin.objects.filter(creation_time__isnull=False).order_by('user_id', 'creation_time')
+        if options['user']:
+            logins = logins.filter(user_id__in=options['user'])
+        count = 0
+        user_id = None
+        streak = longest = 0
+        last = None
+        for login_user_id, creation_time in logins.values_list('user_id', 'creation_time').iterator():
+            if login_user_id != user_id:
+                if user_id is not None:
+                    self.save(user_id, streak, longest, last)
+                    count += 1
+                user_id, streak, longest, last = login_user_id, 0, 0, None
+            day = timezone.localtime(creation_time).date()
+            if day == last:
+                continue
+            streak = streak + 1 if last is not None and day == last + timedelta(days=1) else 1
+            longest = max(longest, streak)
+            last = day
+        if user_id is not None:
+            self.save(user_id, streak, longest, last)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('Backfilled the login streaks of {count} users'.format(count=count)))
+
+    @staticmethod
+    def save(user_id, streak, longest, last):
+        UserStatistics.objects.change(user_id, maximums={'max_consecutive_login_days': longest},
+                                      values={'current_streak': streak, 'last_login_date': last})
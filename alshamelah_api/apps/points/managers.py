@@ -1,549 +1,386 @@
-from datetime import datetime
+import time
+from datetime import timedelta
 
-from django.db import models, connection
-from django.db.models import Sum, F, FloatField
+from django.core.cache import cache
+from django.db import models, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
 
-from .models import Achievement, UserAchievement
-from ..books.models import ListenBook
 from ..users.models import User
 
 
-class UserStatisticsManager(models.Manager):
+class AchievementManager(models.Manager):
+    """
+    Keeps the achievement thresholds in process memory, every process reloads them once an achievement is changed
+    (or after the timeout when the cache is not shared between processes)
+    """
+    version_key = 'achievement-thresholds-version'
+    timeout = 300
+
+    def __init__(self):
+        super(AchievementManager, self).__init__()
+        self._thresholds = None
+        self._version = None
+        self._loaded = 0
+
+    def get_thresholds(self):
+        """
+        Returns the achievements by type, the first created one wins when a type is configured twice
+        """
+        version = cache.get(self.version_key)
+        if self._thresholds is None or version != self._version or time.time() - self._loaded > self.timeout:
+            thresholds = {}
+            for achievement in self.get_queryset().order_by('creation_time'):
+                thresholds.setdefault(achievement.type, achievement)
+            self._thresholds = thresholds
+            self._version = version
+            self._loaded = time.time()
+        return self._thresholds
+
+    def clear_thresholds(self):
+        self._thresholds = None
+        cache.set(self.version_key, time.time(), timeout=None)
+
+
+class UserAchievementManager(models.Manager):
+
+    def upsert(self, achievements):
+        """
+        Inserts or updates the (user, achievement) rows in a single statement
+        """
+        if not achievements:
+            return
+        now = timezone.now()
+        table = self.model._meta.db_table
+        values = []
+        for achievement in achievements:
+            values.extend([now, now, achievement.user_id, achievement.achievement_id, achievement.category,
+                           achievement.points])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO {table} (creation_time, last_update_time, user_id, achievement_id, category, points)
+                VALUES {rows}
+                ON CONFLICT (user_id, achievement_id) DO UPDATE
+                SET category = EXCLUDED.category, points = EXCLUDED.points,
+                    last_update_time = EXCLUDED.last_update_time
+            """.format(table=table, rows=', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(achievements))), values)
+
+
+class UserPageReadManager(models.Manager):
+
+    def add(self, user_id, book_id, pages):
+        """
+        Records the pages as read by the user, returns the pages that were not read before
+        """
+        pages = sorted(set(int(page) for page in pages))
+        if not pages:
+            return []
+        now = timezone.now()
+        values = []
+        for page in pages:
+            values.extend([user_id, int(book_id), page, now])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO {table} (user_id, book_id, page, creation_time)
+                VALUES {rows}
+                ON CONFLICT (user_id, book_id, page) DO NOTHING
+                RETURNING page
+            """.format(table=self.model._meta.db_table, rows=', '.join(['(%s, %s, %s, %s)'] * len(pages))), values)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class UserDailyActivityManager(models.Manager):
+
+    def add(self, user_id, activity_type, book_ids, day):
+        """
+        Records the books of the day, returns the number of books of the day when any of them is new (None otherwise)
+        """
+        book_ids = sorted(set(int(book_id) for book_id in book_ids))
+        if not book_ids:
+            return None
+        values = []
+        for book_id in book_ids:
+            values.extend([user_id, day, activity_type, book_id])
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO {table} (user_id, day, type, book_id)
+                VALUES {rows}
+                ON CONFLICT (user_id, day, type, book_id) DO NOTHING
+                RETURNING book_id
+            """.format(table=self.model._meta.db_table, rows=', '.join(['(%s, %s, %s, %s)'] * len(book_ids))), values)
+            if not cursor.fetchall():
+                return None
+        return self.filter(user_id=user_id, day=day, type=activity_type).count()
 
-    def read(self, user_id, book_id, page):
-        data = self.get_data(user_id)
-        book_pages = data.reads
-        if not book_pages:
-            book_pages = {book_id: [page]}
-            data.page_read_count += 1
-            data.book_read_count += 1
-        elif book_id not in book_pages.keys():
-            book_pages[book_id] = [page]
-            data.page_read_count += 1
-            data.book_read_count += 1
-        elif page not in book_pages[book_id]:
-            book_pages[book_id].append(page)
-            data.page_read_count += 1
-        data.reads = book_pages
-        if not data.daily_read:
-            data.daily_read = {self.today(): [book_id]}
-        elif self.today() in data.daily_read.keys() and book_id not in data.daily_read[self.today()]:
-            data.daily_read[self.today()].append(book_id)
-        elif self.today() not in data.daily_read.keys():
-            data.daily_read[self.today()] = [book_id]
-        if len(data.daily_read[self.today()]) > data.max_daily_read:
-            data.max_daily_read = len(data.daily_read[self.today()])
-        data.save()
+
+class UserStatisticsManager(models.Manager):
+    # the statistic every achievement type is measured by
+    achievement_metrics = {
+        'pages_read_number': 'page_read_count',
+        'books_read_number': 'book_read_count',
+        'daily_books_read_number': 'max_daily_read',
+        'minutes_listened': 'minutes_listened',
+        'books_listen_number': 'book_listened_count',
+        'daily_books_listen_number': 'max_daily_listen',
+        'books_with_most_pages_finished': 'max_book_pages_read',
+        'books_read_finished': 'book_finished_count',
+        'books_with_most_minutes_finished': 'max_book_audio_minutes_listened',
+        'books_listened': 'audio_book_finished_count',
+        'rating_book': 'book_rate_count',
+        'writing_review': 'book_review_count',
+        'writing_note': ('user_note_count', 'book_note_count'),
+        'highlighting_text': 'book_highlight_count',
+        'making_bookmark': 'book_mark_count',
+        'donation': 'donation_count',
+        'share_app': 'app_share_count',
+        'share_book': 'book_share_count',
+        'share_lecture': 'lecture_share_count',
+        'share_highlight': 'highlight_share_count',
+        'consecutive_daily_usage': 'max_consecutive_login_days',
+        'attending_lecture': 'lecture_attendance_count',
+    }
+
+    def read(self, user_id, book_id, *pages):
+        from .models import UserPageRead, UserDailyActivity
+        new_pages = UserPageRead.objects.add(user_id, book_id, pages)
+        increments = {}
+        maximums = {}
+        if new_pages:
+            increments['page_read_count'] = len(new_pages)
+            if UserPageRead.objects.filter(user_id=user_id, book_id=book_id).count() == len(new_pages):
+                increments['book_read_count'] = 1
+        daily_count = UserDailyActivity.objects.add(user_id, 'read', [book_id], self.today())
+        if daily_count:
+            maximums['max_daily_read'] = daily_count
+        if not increments and not maximums:
+            return
+        data = self.change(user_id, increments=increments, maximums=maximums)
 
         # ------------------------- achievement checks ----------------------------------
-        achievement_types = ['pages_read_number', 'books_read_number', 'daily_books_read_number']
-        achievement_settings = Achievement.objects.filter(type__in=achievement_types)
-        pages_read = achievement_settings.get(type='pages_read_number')
-        books_read = achievement_settings.get(type='books_read_number')
-        daily_books_read = achievement_settings.get(type='daily_books_read_number')
-
-        if pages_read:
-            pages_ach = UserAchievement(user_id=user_id, achievement_id=pages_read.id)
-            if data.page_read_count >= pages_read.diamond:
-                pages_ach.category = 'diamond'
-            elif data.page_read_count >= pages_read.gold:
-                pages_ach.category = 'gold'
-            elif data.page_read_count >= pages_read.silver:
-                pages_ach.category = 'silver'
-            elif data.page_read_count >= pages_read.bronze:
-                pages_ach.category = 'bronze'
-            if pages_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=pages_read.id,
-                                                         defaults={'category': pages_ach.category,
-                                                                   'points': data.page_read_count})
-        if books_read:
-            books_ach = UserAchievement(user_id=user_id, achievement_id=books_read.id)
-            if data.book_read_count >= books_read.diamond:
-                books_ach.category = 'diamond'
-            elif data.book_read_count >= books_read.gold:
-                books_ach.category = 'gold'
-            elif data.book_read_count >= books_read.silver:
-                books_ach.category = 'silver'
-            elif data.book_read_count >= books_read.bronze:
-                books_ach.category = 'bronze'
-            if books_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=books_read.id,
-                                                         defaults={'category': books_ach.category,
-                                                                   'points': data.book_read_count})
-        if daily_books_read:
-            daily_books_ach = UserAchievement(user_id=user_id, achievement_id=daily_books_read.id)
-            if data.max_daily_read >= daily_books_read.diamond:
-                daily_books_ach.category = 'diamond'
-            elif data.max_daily_read >= daily_books_read.gold:
-                daily_books_ach.category = 'gold'
-            elif data.max_daily_read >= daily_books_read.silver:
-                daily_books_ach.category = 'silver'
-            elif data.max_daily_read >= daily_books_read.bronze:
-                daily_books_ach.category = 'bronze'
-            if daily_books_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=daily_books_read.id,
-                                                         defaults={'category': daily_books_ach.category,
-                                                                   'points': data.max_daily_read})
-
-    def listen(self, user_id, book_id):
-        data = self.get_data(user_id)
-
-        if not data.daily_listen:
-            data.daily_listen = {self.today(): [book_id]}
-        elif self.today() in data.daily_listen.keys() and book_id not in data.daily_listen[self.today()]:
-            data.daily_listen[self.today()].append(book_id)
-        elif self.today() not in data.daily_listen.keys():
-            data.daily_listen[self.today()] = [book_id]
-        if len(data.daily_listen[self.today()]) > data.max_daily_listen:
-            data.max_daily_listen = len(data.daily_listen[self.today()])
-
-        book_listened = ListenBook.objects.prefetch_related('book__book_media', 'file_progress') \
-            .filter(user_id=user_id, file_progress__progress__gt=0)
-        data.book_listened_count = book_listened.count()
-        total_minutes_listened = book_listened.aggregate(
-            total_minutes=Sum((F('file_progress__progress') * F('file_progress__audio__duration')) / 100,
-                              output_field=FloatField()))
-        data.minutes_listened = total_minutes_listened['total_minutes'] if total_minutes_listened[
-            'total_minutes'] else 0
-        data.save()
+        self.award(data, ['pages_read_number', 'books_read_number', 'daily_books_read_number'])
+
+    def listen(self, user_id, book_ids, minutes=0, books=0):
+        """
+        Moves the listening counters by the changes of the listen rollups (see ListenProgress.objects.record)
+        """
+        from .models import UserDailyActivity
+        daily_count = UserDailyActivity.objects.add(user_id, 'listen', book_ids, self.today())
+        increments = {}
+        if minutes:
+            increments['minutes_listened'] = minutes
+        if books:
+            increments['book_listened_count'] = books
+        if not increments and not daily_count:
+            return
+        data = self.change(user_id, increments=increments,
+                           maximums={'max_daily_listen': daily_count} if daily_count else None)
 
         # ------------------------- achievement checks ----------------------------------
-        achievement_types = ['minutes_listened', 'books_listen_number', 'daily_books_listen_number']
-        achievement_settings = Achievement.objects.filter(type__in=achievement_types)
-        minutes_listened = achievement_settings.get(type='minutes_listened')
-        books_listened = achievement_settings.get(type='books_listen_number')
-        daily_books_listened = achievement_settings.get(type='daily_books_listen_number')
-
-        if minutes_listened:
-            pages_ach = UserAchievement(user_id=user_id, achievement_id=minutes_listened.id)
-            if data.minutes_listened >= minutes_listened.diamond:
-                pages_ach.category = 'diamond'
-            elif data.minutes_listened >= minutes_listened.gold:
-                pages_ach.category = 'gold'
-            elif data.minutes_listened >= minutes_listened.silver:
-                pages_ach.category = 'silver'
-            elif data.minutes_listened >= minutes_listened.bronze:
-                pages_ach.category = 'bronze'
-            if pages_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=minutes_listened.id,
-                                                         defaults={'category': pages_ach.category,
-                                                                   'points': data.minutes_listened})
-        if books_listened:
-            books_ach = UserAchievement(user_id=user_id, achievement_id=books_listened.id)
-            if data.book_listened_count >= books_listened.diamond:
-                books_ach.category = 'diamond'
-            elif data.book_listened_count >= books_listened.gold:
-                books_ach.category = 'gold'
-            elif data.book_listened_count >= books_listened.silver:
-                books_ach.category = 'silver'
-            elif data.book_listened_count >= books_listened.bronze:
-                books_ach.category = 'bronze'
-            if books_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=books_listened.id,
-                                                         defaults={'category': books_ach.category,
-                                                                   'points': data.book_listened_count})
-        if daily_books_listened:
-            daily_books_ach = UserAchievement(user_id=user_id, achievement_id=daily_books_listened.id)
-            if data.max_daily_listen >= daily_books_listened.diamond:
-                daily_books_ach.category = 'diamond'
-            elif data.max_daily_listen >= daily_books_listened.gold:
-                daily_books_ach.category = 'gold'
-            elif data.max_daily_listen >= daily_books_listened.silver:
-                daily_books_ach.category = 'silver'
-            elif data.max_daily_listen >= daily_books_listened.bronze:
-                daily_books_ach.category = 'bronze'
-            if daily_books_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=daily_books_listened.id,
-                                                         defaults={'category': daily_books_ach.category,
-                                                                   'points': data.max_daily_listen})
+        self.award(data, ['minutes_listened', 'books_listen_number', 'daily_books_listen_number'])
 
     def update_finished_read(self, user_id):
-        data = self.get_data(user_id)
         user = User.objects.get(pk=user_id)
         finished_books = user.reads.filter(finished=True)
-        data.book_finished_count = finished_books.count()
-        data.max_book_pages_read = finished_books.order_by('-book__page_count').first().book.page_count
-        data.save()
+        longest = finished_books.select_related('book').order_by('-book__page_count').first()
+        data = self.change(user_id, values={
+            'book_finished_count': finished_books.count(),
+            'max_book_pages_read': longest.book.page_count if longest and longest.book.page_count else 0})
 
         # ------------------------- achievement checks ----------------------------------
-        achievement_types = ['books_with_most_pages_finished', 'books_read_finished']
-        achievement_settings = Achievement.objects.filter(type__in=achievement_types)
-        most_pages_finished = achievement_settings.get(type='books_with_most_pages_finished')
-        finished = achievement_settings.get(type='books_read_finished')
-
-        if most_pages_finished:
-            most_pages_ach = UserAchievement(user_id=user_id, achievement_id=most_pages_finished.id)
-            if data.max_book_pages_read >= most_pages_finished.diamond:
-                most_pages_ach.category = 'diamond'
-            elif data.max_book_pages_read >= most_pages_finished.gold:
-                most_pages_ach.category = 'gold'
-            elif data.max_book_pages_read >= most_pages_finished.silver:
-                most_pages_ach.category = 'silver'
-            elif data.max_book_pages_read >= most_pages_finished.bronze:
-                most_pages_ach.category = 'bronze'
-            if most_pages_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=most_pages_finished.id,
-                                                         defaults={'category': most_pages_ach.category,
-                                                                   'points': data.max_book_pages_read})
-
-        if finished:
-            book_finished_ach = UserAchievement(user_id=user_id, achievement_id=finished.id)
-            if data.book_finished_count >= finished.diamond:
-                book_finished_ach.category = 'diamond'
-            elif data.book_finished_count >= finished.gold:
-                book_finished_ach.category = 'gold'
-            elif data.book_finished_count >= finished.silver:
-                book_finished_ach.category = 'silver'
-            elif data.book_finished_count >= finished.bronze:
-                book_finished_ach.category = 'bronze'
-            if book_finished_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user_id, achievement_id=finished.id,
-                                                         defaults={'category': book_finished_ach.category,
-                                                                   'points': data.book_finished_count})
+        self.award(data, ['books_with_most_pages_finished', 'books_read_finished'])
 
     def update_finished_listen(self, user):
-        data = self.get_data(user.id)
         finished_audio_books = user.listens.filter(finished=True)
-        data.audio_book_finished_count = finished_audio_books.count()
-        data.max_book_audio_minutes_listened = finished_audio_books.annotate(
-            total_minutes=Sum('book__book_media__duration')).order_by('-total_minutes').first().total_minutes
-        data.save()
+        longest = finished_audio_books.annotate(
+            total_minutes=Sum('book__book_media__duration')).order_by('-total_minutes').first()
+        data = self.change(user.id, values={
+            'audio_book_finished_count': finished_audio_books.count(),
+            'max_book_audio_minutes_listened': longest.total_minutes if longest and longest.total_minutes else 0})
 
         # ------------------------- achievement checks ----------------------------------
-        achievement_types = ['books_with_most_minutes_finished', 'books_listened']
-        achievement_settings = Achievement.objects.filter(type__in=achievement_types)
-        most_minutes_finished = achievement_settings.get(type='books_with_most_minutes_finished')
-        finished = achievement_settings.get(type='books_listened')
-
-        if most_minutes_finished:
-            most_minutes_ach = UserAchievement(user_id=user.id, achievement_id=most_minutes_finished.id)
-            if data.max_book_audio_minutes_listened >= most_minutes_finished.diamond:
-                most_minutes_ach.category = 'diamond'
-            elif data.max_book_audio_minutes_listened >= most_minutes_finished.gold:
-                most_minutes_ach.category = 'gold'
-            elif data.max_book_audio_minutes_listened >= most_minutes_finished.silver:
-                most_minutes_ach.category = 'silver'
-            elif data.max_book_audio_minutes_listened >= most_minutes_finished.bronze:
-                most_minutes_ach.category = 'bronze'
-            if most_minutes_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=most_minutes_finished.id,
-                                                         defaults={'category': most_minutes_ach.category,
-                                                                   'points': data.max_book_audio_minutes_listened})
-
-        if finished:
-            book_finished_ach = UserAchievement(user_id=user.id, achievement_id=finished.id)
-            if data.audio_book_finished_count >= finished.diamond:
-                book_finished_ach.category = 'diamond'
-            elif data.audio_book_finished_count >= finished.gold:
-                book_finished_ach.category = 'gold'
-            elif data.audio_book_finished_count >= finished.silver:
-                book_finished_ach.category = 'silver'
-            elif data.audio_book_finished_count >= finished.bronze:
-                book_finished_ach.category = 'bronze'
-            if book_finished_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=finished.id,
-                                                         defaults={'category': book_finished_ach.category,
-                                                                   'points': data.audio_book_finished_count})
+        self.award(data, ['books_with_most_minutes_finished', 'books_listened'], user)
 
     def update_reviews(self, user):
-        data = self.get_data(user.id)
-        count = user.reviews.filter(rating__isnull=False).count()
-        if count > data.book_rate_count:
-            data.book_rate_count = count
-        count = user.reviews.filter(comment__isnull=False).count()
-        if count > data.book_review_count:
-            data.book_review_count = count
-        data.save()
+        data = self.change(user.id, maximums={
+            'book_rate_count': user.reviews.filter(rating__isnull=False).count(),
+            'book_review_count': user.reviews.filter(comment__isnull=False).count()})
 
         # ------------------------- achievement checks ----------------------------------
-        rate_achievement = Achievement.objects.get(type='rating_book')
-        review_achievement = Achievement.objects.get(type='writing_review')
-
-        if rate_achievement:
-            rate_ach = UserAchievement(user_id=user.id, achievement_id=rate_achievement.id)
-            if data.book_rate_count >= rate_achievement.diamond:
-                rate_ach.category = 'diamond'
-            elif data.book_rate_count >= rate_achievement.gold:
-                rate_ach.category = 'gold'
-            elif data.book_rate_count >= rate_achievement.silver:
-                rate_ach.category = 'silver'
-            elif data.book_rate_count >= rate_achievement.bronze:
-                rate_ach.category = 'bronze'
-            if rate_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=rate_achievement.id,
-                                                         defaults={'category': rate_ach.category,
-                                                                   'points': data.book_rate_count})
-        if review_achievement:
-            review_ach = UserAchievement(user_id=user.id, achievement_id=rate_achievement.id)
-            if data.book_review_count >= rate_achievement.diamond:
-                review_ach.category = 'diamond'
-            elif data.book_review_count >= rate_achievement.gold:
-                review_ach.category = 'gold'
-            elif data.book_review_count >= rate_achievement.silver:
-                review_ach.category = 'silver'
-            elif data.book_review_count >= rate_achievement.bronze:
-                review_ach.category = 'bronze'
-            if review_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=rate_achievement.id,
-                                                         defaults={'category': review_ach.category,
-                                                                   'points': data.book_review_count})
+        self.award(data, ['rating_book', 'writing_review'], user)
 
     def update_notes_and_highlights(self, user):
-        data = self.get_data(user.id)
-        count = user.book_notes.filter(note__isnull=False).count()
-        if count > data.book_note_count:
-            data.book_note_count = count
-        count = user.book_notes.filter(note__isnull=True).count()
-        if count > data.book_highlight_count:
-            data.book_highlight_count = count
-        count = user.notes.filter(note__isnull=False).count()
-        if count > data.user_note_count:
-            data.user_note_count = count
-        data.save()
-        total = data.user_note_count + data.book_note_count
+        data = self.change(user.id, maximums={
+            'book_note_count': user.book_notes.filter(note__isnull=False).count(),
+            'book_highlight_count': user.book_notes.filter(note__isnull=True).count(),
+            'user_note_count': user.notes.filter(note__isnull=False).count()})
         # ------------------------- achievement checks ----------------------------------
-        notes_achievement = Achievement.objects.get(type='writing_note')
-        highlight_achievement = Achievement.objects.get(type='highlighting_text')
-
-        if notes_achievement:
-            note_ach = UserAchievement(user_id=user.id, achievement_id=notes_achievement.id)
-            if total >= notes_achievement.diamond:
-                note_ach.category = 'diamond'
-            elif total >= notes_achievement.gold:
-                note_ach.category = 'gold'
-            elif total >= notes_achievement.silver:
-                note_ach.category = 'silver'
-            elif total >= notes_achievement.bronze:
-                note_ach.category = 'bronze'
-            if note_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=notes_achievement.id,
-                                                         defaults={'category': note_ach.category,
-                                                                   'points': total})
-
-        if highlight_achievement:
-            highlight_ach = UserAchievement(user_id=user.id, achievement_id=highlight_achievement.id)
-            if data.book_highlight_count >= highlight_achievement.diamond:
-                highlight_ach.category = 'diamond'
-            elif data.book_highlight_count >= highlight_achievement.gold:
-                highlight_ach.category = 'gold'
-            elif data.book_highlight_count >= highlight_achievement.silver:
-                highlight_ach.category = 'silver'
-            elif data.book_highlight_count >= highlight_achievement.bronze:
-                highlight_ach.category = 'bronze'
-            if highlight_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=highlight_achievement.id,
-                                                         defaults={'category': highlight_ach.category,
-                                                                   'points': data.book_highlight_count})
+        self.award(data, ['writing_note', 'highlighting_text'], user)
 
     def update_bookmarks(self, user):
-        data = self.get_data(user.id)
-        count = user.book_marks.filter(page__isnull=False).count()
-        if count > data.book_mark_count:
-            data.book_mark_count = count
-        data.save()
+        data = self.change(user.id, maximums={'book_mark_count': user.book_marks.filter(page__isnull=False).count()})
         # ------------------------- achievement checks ----------------------------------
-        bookmarks_achievement = Achievement.objects.get(type='making_bookmark')
-
-        if bookmarks_achievement:
-            bookmark_ach = UserAchievement(user_id=user.id, achievement_id=bookmarks_achievement.id)
-            if data.book_mark_count >= bookmarks_achievement.diamond:
-                bookmark_ach.category = 'diamond'
-            elif data.book_mark_count >= bookmarks_achievement.gold:
-                bookmark_ach.category = 'gold'
-            elif data.book_mark_count >= bookmarks_achievement.silver:
-                bookmark_ach.category = 'silver'
-            elif data.book_mark_count >= bookmarks_achievement.bronze:
-                bookmark_ach.category = 'bronze'
-            if bookmark_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=bookmarks_achievement.id,
-                                                         defaults={'category': bookmark_ach.category,
-                                                                   'points': data.book_mark_count})
+        self.award(data, ['making_bookmark'], user)
 
     def donation(self, user):
-        data = self.get_data(user.id)
-        data.donation_count = user.payments.filter(status='success').count()
-        data.save()
+        data = self.change(user.id, values={'donation_count': user.payments.filter(status='success').count()})
 
         # ------------------------- achievement checks ----------------------------------
-        donation_achievement = Achievement.objects.get(type='donation')
-
-        if donation_achievement:
-            donation_ach = UserAchievement(user_id=user.id, achievement_id=donation_achievement.id)
-            if data.donation_count >= donation_achievement.diamond:
-                donation_ach.category = 'diamond'
-            elif data.donation_count >= donation_achievement.gold:
-                donation_ach.category = 'gold'
-            elif data.donation_count >= donation_achievement.silver:
-                donation_ach.category = 'silver'
-            elif data.donation_count >= donation_achievement.bronze:
-                donation_ach.category = 'bronze'
-            if donation_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=donation_achievement.id,
-                                                         defaults={'category': donation_ach.category,
-                                                                   'points': data.donation_count})
+        self.award(data, ['donation'], user)
 
     def share_app(self, user):
-        data = self.get_data(user.id)
-        data.app_share_count += 1
-        data.save()
+        data = self.change(user.id, increments={'app_share_count': 1})
 
         # ------------------------- achievement checks ----------------------------------
-        share_app_achievement = Achievement.objects.get(type='share_app')
-
-        if share_app_achievement:
-            share_app_ach = UserAchievement(user_id=user.id, achievement_id=share_app_achievement.id)
-            if data.app_share_count >= share_app_achievement.diamond:
-                share_app_ach.category = 'diamond'
-            elif data.app_share_count >= share_app_achievement.gold:
-                share_app_ach.category = 'gold'
-            elif data.app_share_count >= share_app_achievement.silver:
-                share_app_ach.category = 'silver'
-            elif data.app_share_count >= share_app_achievement.bronze:
-                share_app_ach.category = 'bronze'
-            if share_app_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=share_app_achievement.id,
-                                                         defaults={'category': share_app_ach.category,
-                                                                   'points': data.app_share_count})
+        self.award(data, ['share_app'], user)
 
     def share_book(self, user):
-        data = self.get_data(user.id)
-        data.book_share_count += 1
-        data.save()
+        data = self.change(user.id, increments={'book_share_count': 1})
 
         # ------------------------- achievement checks ----------------------------------
-        share_achievement = Achievement.objects.get(type='share_book')
-
-        if share_achievement:
-            share_ach = UserAchievement(user_id=user.id, achievement_id=share_achievement.id)
-            if data.book_share_count >= share_achievement.diamond:
-                share_ach.category = 'diamond'
-            elif data.book_share_count >= share_achievement.gold:
-                share_ach.category = 'gold'
-            elif data.book_share_count >= share_achievement.silver:
-                share_ach.category = 'silver'
-            elif data.book_share_count >= share_achievement.bronze:
-                share_ach.category = 'bronze'
-            if share_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=share_achievement.id,
-                                                         defaults={'category': share_ach.category,
-                                                                   'points': data.book_share_count})
+        self.award(data, ['share_book'], user)
 
     def share_lecture(self, user):
-        data = self.get_data(user.id)
-        data.lecture_share_count += 1
-        data.save()
+        data = self.change(user.id, increments={'lecture_share_count': 1})
 
         # ------------------------- achievement checks ----------------------------------
-        share_achievement = Achievement.objects.get(type='share_lecture')
-
-        if share_achievement:
-            share_ach = UserAchievement(user_id=user.id, achievement_id=share_achievement.id)
-            if data.lecture_share_count >= share_achievement.diamond:
-                share_ach.category = 'diamond'
-            elif data.lecture_share_count >= share_achievement.gold:
-                share_ach.category = 'gold'
-            elif data.lecture_share_count >= share_achievement.silver:
-                share_ach.category = 'silver'
-            elif data.lecture_share_count >= share_achievement.bronze:
-                share_ach.category = 'bronze'
-            if share_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=share_achievement.id,
-                                                         defaults={'category': share_ach.category,
-                                                                   'points': data.lecture_share_count})
+        self.award(data, ['share_lecture'], user)
 
     def share_highlight(self, user):
-        data = self.get_data(user.id)
-        data.highlight_share_count += 1
-        data.save()
+        data = self.change(user.id, increments={'highlight_share_count': 1})
 
         # ------------------------- achievement checks ----------------------------------
-        share_achievement = Achievement.objects.get(type='share_highlight')
-
-        if share_achievement:
-            share_ach = UserAchievement(user_id=user.id, achievement_id=share_achievement.id)
-            if data.highlight_share_count >= share_achievement.diamond:
-                share_ach.category = 'diamond'
-            elif data.highlight_share_count >= share_achievement.gold:
-                share_ach.category = 'gold'
-            elif data.highlight_share_count >= share_achievement.silver:
-                share_ach.category = 'silver'
-            elif data.highlight_share_count >= share_achievement.bronze:
-                share_ach.category = 'bronze'
-            if share_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=share_achievement.id,
-                                                         defaults={'category': share_ach.category,
-                                                                   'points': data.highlight_share_count})
-
-    def consecutive_login(self, user):
-        data = self.get_data(user.id)
-
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                WITH pomo_dates AS ( SELECT DISTINCT creation_time :: DATE created_date FROM users_dailylogin WHERE user_id = %s ),
-                pomo_date_groups AS ( SELECT created_date, created_date :: DATE - CAST ( ROW_NUMBER ( ) OVER ( ORDER BY created_date ) AS INT ) AS grp FROM pomo_dates ) SELECT MAX
-                ( created_date ) - MIN ( created_date ) + 1 AS consecutive_login 
-                FROM
-                    pomo_date_groups 
-                GROUP BY
-                    grp 
-                ORDER BY
-                    consecutive_login DESC 
-                    LIMIT 1
-            """, [user.id])
-            row = cursor.fetchone()
-
-        if row and len(row) > 0:
-            data.max_consecutive_login_days = row[0]
-            data.save()
+        self.award(data, ['share_highlight'], user)
+
+    def consecutive_login(self, user, day=None):
+        """
+        Moves the login streak by comparing the day with the last login day: continued from the day before, unchanged
+        on the same day or restarted, the longest streak is raised with it
+        """
+        day = day or self.today()
+        quote = connection.ops.quote_name
+        last, current, longest = [quote(self.get_column(name)) for name in
+                                  ['last_login_date', 'current_streak', 'max_consecutive_login_days']]
+        streak = 'CASE WHEN {last} >= %s THEN {current} WHEN {last} = %s THEN {current} + 1 ELSE 1 END'.format(
+            last=last, current=current)
+        streak_params = [day, day - timedelta(days=1)]
+        data = self.change(user.id, expressions={
+            'current_streak': (streak, streak_params),
+            'max_consecutive_login_days': ('CASE WHEN {streak} > {longest} THEN {streak} ELSE {longest} END'.format(
+                streak=streak, longest=longest), streak_params + streak_params),
+            'last_login_date': ('CASE WHEN {last} >= %s THEN {last} ELSE %s END'.format(last=last), [day, day]),
+        })
 
         # ------------------------- achievement checks ----------------------------------
-        consecutive_login_achievement = Achievement.objects.get(type='consecutive_daily_usage')
-
-        if consecutive_login_achievement:
-            consecutive_login_ach = UserAchievement(user_id=user.id, achievement_id=consecutive_login_achievement.id)
-            if data.max_consecutive_login_days >= consecutive_login_achievement.diamond:
-                consecutive_login_ach.category = 'diamond'
-            elif data.max_consecutive_login_days >= consecutive_login_achievement.gold:
-                consecutive_login_ach.category = 'gold'
-            elif data.max_consecutive_login_days >= consecutive_login_achievement.silver:
-                consecutive_login_ach.category = 'silver'
-            elif data.max_consecutive_login_days >= consecutive_login_achievement.bronze:
-                consecutive_login_ach.category = 'bronze'
-            if consecutive_login_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id,
-                                                         achievement_id=consecutive_login_achievement.id,
-                                                         defaults={'category': consecutive_login_ach.category,
-                                                                   'points': data.max_consecutive_login_days})
+        self.award(data, ['consecutive_daily_usage'], user)
 
     def attend_lecture(self, user):
-        data = self.get_data(user.id)
-        data.lecture_attendance_count += 1
-        data.save()
+        data = self.change(user.id, increments={'lecture_attendance_count': 1})
 
         # ------------------------- achievement checks ----------------------------------
-        attendance_achievement = Achievement.objects.get(type='attending_lecture')
-
-        if attendance_achievement:
-            attendance_ach = UserAchievement(user_id=user.id, achievement_id=attendance_achievement.id)
-            if data.lecture_attendance_count >= attendance_achievement.diamond:
-                attendance_ach.category = 'diamond'
-            elif data.lecture_attendance_count >= attendance_achievement.gold:
-                attendance_ach.category = 'gold'
-            elif data.lecture_attendance_count >= attendance_achievement.silver:
-                attendance_ach.category = 'silver'
-            elif data.lecture_attendance_count >= attendance_achievement.bronze:
-                attendance_ach.category = 'bronze'
-            if attendance_ach.category:
-                UserAchievement.objects.update_or_create(user_id=user.id, achievement_id=attendance_achievement.id,
-                                                         defaults={'category': attendance_ach.category,
-                                                                   'points': data.lecture_attendance_count})
+        self.award(data, ['attending_lecture'], user)
+
+    def get_metric(self, data, achievement_type):
+        fields = self.achievement_metrics.get(achievement_type)
+        if not data or not fields:
+            return 0
+        if isinstance(fields, str):
+            fields = [fields]
+        return int(sum(getattr(data, field) or 0 for field in fields))
+
+    def award(self, data, achievement_types=None, user=None):
+        """
+        Evaluates the achievements of the given types (all of them by default) against the statistics in one pass
+        and writes only the tiers that changed, the user is notified of every new tier
+        """
+        from .models import Achievement, UserAchievement
+        thresholds = Achievement.objects.get_thresholds()
+        awarded = {}
+        for achievement_type in achievement_types or self.achievement_metrics.keys():
+            achievement = thresholds.get(achievement_type)
+            if not achievement:
+                continue
+            points = self.get_metric(data, achievement_type)
+            category = achievement.get_category(points)
+            if category:
+                awarded[achievement.id] = UserAchievement(user_id=data.user_id, achievement=achievement,
+                                                          category=category, points=points)
+        if not awarded:
+            return []
+        current = dict(UserAchievement.objects.filter(user_id=data.user_id, achievement_id__in=awarded.keys())
+                       .values_list('achievement_id', 'category'))
+        changed = [achievement for pk, achievement in awarded.items() if current.get(pk) != achievement.category]
+        if not changed:
+            return []
+        UserAchievement.objects.upsert(changed)
+
+        def notify():
+            from ..users.services import FCMService
+            recipient = user if user else User.objects.select_related('notification_setting').get(pk=data.user_id)
+            for achievement in changed:
+                FCMService.notify_achievement_awarded(recipient, achievement)
+
+        transaction.on_commit(notify)
+        return changed
+
+    def change(self, user_id, increments=None, maximums=None, values=None, expressions=None):
+        """
+        Applies the changes to the statistics row of the user in a single UPDATE .. RETURNING statement and returns
+        the updated statistics, the counters are incremented and the maximums raised by the database so concurrent
+        requests never overwrite each other. An expression is an (sql, params) pair computed from the current row.
+        """
+        quote = connection.ops.quote_name
+        assignments = []
+        params = []
+        for name, (expression, expression_params) in (expressions or {}).items():
+            assignments.append('{0} = {1}'.format(quote(self.get_column(name)), expression))
+            params.extend(expression_params)
+        for name, delta in (increments or {}).items():
+            assignments.append('{0} = {0} + %s'.format(quote(self.get_column(name))))
+            params.append(delta)
+        for name, value in (maximums or {}).items():
+            assignments.append('{0} = CASE WHEN {0} < %s THEN %s ELSE {0} END'.format(quote(self.get_column(name))))
+            params.extend([value, value])
+        for name, value in (values or {}).items():
+            assignments.append('{0} = %s'.format(quote(self.get_column(name))))
+            params.append(value)
+        assignments.append('{0} = %s'.format(quote('last_update_time')))
+        params.append(timezone.now())
+        fields = self.model._meta.concrete_fields
+        sql = 'UPDATE {table} SET {assignments} WHERE {user} = %s RETURNING {columns}'.format(
+            table=quote(self.model._meta.db_table), assignments=', '.join(assignments),
+            user=quote(self.get_column('user')), columns=', '.join(quote(field.column) for field in fields))
+        for attempt in range(2):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params + [user_id])
+                row = cursor.fetchone()
+            if row:
+                return self.model.from_db(self.db, [field.attname for field in fields], row)
+            self.insert_missing(user_id)
+
+    def insert_missing(self, user_id):
+        """
+        Creates the statistics row of the user unless it exists (concurrent requests create a single row)
+        """
+        quote = connection.ops.quote_name
+        data = self.model(user_id=user_id)
+        fields = [field for field in self.model._meta.concrete_fields if not field.primary_key]
+        values = [field.get_db_prep_save(field.pre_save(data, True), connection) for field in fields]
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO {table} ({columns}) VALUES ({values}) ON CONFLICT ({user}) DO NOTHING'.format(
+                table=quote(self.model._meta.db_table), columns=', '.join(quote(field.column) for field in fields),
+                values=', '.join(['%s'] * len(fields)), user=quote(self.get_column('user'))), values)
+
+    def get_column(self, name):
+        return self.model._meta.get_field(name).column
 
     def get_data(self, user_id):
         data = self.model.objects.filter(user_id=user_id).first()
         if not data:
-            data = self.model.objects.create(user_id=user_id)
+            self.insert_missing(user_id)
+            data = self.model.objects.get(user_id=user_id)
         return data
 
     @staticmethod
     def today():
-        return str(datetime.now().date())
+        # the day in TIME_ZONE, as DailyLoginView and backfill_login_streaks count the login days
+        return timezone.localdate()
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Keeps the latest achievement row of every (user, achievement) pair
+    """
+    UserAchievement = apps.get_model('points', 'UserAchievement')
+    duplicates = UserAchievement.objects.values('user_id', 'achievement_id').annotate(count=Count('id')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        rows = UserAchievement.objects.filter(user_id=duplicate['user_id'],
+                                              achievement_id=duplicate['achievement_id']).order_by('-last_update_time',
+                                                                                                   '-id')
+        UserAchievement.objects.filter(pk__in=list(rows.values_list('pk', flat=True)[1:])).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('points', '0013_auto_20200720_1201'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userachievement',
+            unique_together={('user', 'achievement')},
+        ),
+    ]
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_activity(apps, schema_editor):
+    """
+    Moves the pages read and the daily read / listen books out of the json columns of the statistics
+    """
+    UserStatistics = apps.get_model('points', 'UserStatistics')
+    UserPageRead = apps.get_model('points', 'UserPageRead')
+    UserDailyActivity = apps.get_model('points', 'UserDailyActivity')
+    Book = apps.get_model('books', 'Book')
+    book_ids = set(Book.objects.values_list('id', flat=True))
+
+    def get_ids(values):
+        ids = set()
+        for value in values or []:
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                continue
+        return ids & book_ids
+
+    for statistics in UserStatistics.objects.exclude(reads__isnull=True, daily_read__isnull=True,
+                                                     daily_listen__isnull=True).iterator():
+        pages = []
+        for book_id, book_pages in (statistics.reads or {}).items():
+            if not get_ids([book_id]):
+                continue
+            pages.extend(UserPageRead(user_id=statistics.user_id, book_id=int(book_id), page=page)
+                         for page in set(book_pages or []) if isinstance(page, int) and page >= 0)
+        UserPageRead.objects.bulk_create(pages, batch_size=1000, ignore_conflicts=True)
+        activities = []
+        for activity_type, days in [('read', statistics.daily_read), ('listen', statistics.daily_listen)]:
+            for day, day_book_ids in (days or {}).items():
+                activities.extend(UserDailyActivity(user_id=statistics.user_id, day=day, type=activity_type,
+                                                    book_id=book_id) for book_id in get_ids(day_book_ids))
+        UserDailyActivity.objects.bulk_create(activities, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('books', '0038_popularbook'),
+        ('points', '0014_userachievement_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPageRead',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.PositiveIntegerField(verbose_name='Page')),
+                ('creation_time', models.DateTimeField(auto_now_add=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_reads', to='books.Book', verbose_name='Book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_reads', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'unique_together': {('user', 'book', 'page')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('type', models.CharField(choices=[('read', 'Read'), ('listen', 'Listen')], max_length=10, verbose_name='Type')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activities', to='books.Book', verbose_name='Book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activities', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name_plural': 'User daily activities',
+                'unique_together': {('user', 'day', 'type', 'book')},
+            },
+        ),
+        migrations.RunPython(move_activity, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='userstatistics',
+            name='daily_listen',
+        ),
+        migrations.RemoveField(
+            model_name='userstatistics',
+            name='daily_read',
+        ),
+        migrations.RemoveField(
+            model_name='userstatistics',
+            name='reads',
+        ),
+        migrations.AlterField(
+            model_name='userstatistics',
+            name='page_read_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
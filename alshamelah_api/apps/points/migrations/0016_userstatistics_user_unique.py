@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merges the statistics rows of a user into the oldest one, keeping the highest value of every counter
+    """
+    UserStatistics = apps.get_model('points', 'UserStatistics')
+    counters = [field.name for field in UserStatistics._meta.concrete_fields
+                if isinstance(field, (models.PositiveSmallIntegerField, models.PositiveIntegerField))]
+    duplicates = UserStatistics.objects.values('user_id').annotate(count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        rows = list(UserStatistics.objects.filter(user_id=duplicate['user_id']).order_by('id'))
+        kept = rows[0]
+        for counter in counters:
+            setattr(kept, counter, max(getattr(row, counter) or 0 for row in rows))
+        kept.save()
+        UserStatistics.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0015_user_activity_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userstatistics',
+            constraint=models.UniqueConstraint(fields=('user',), name='points_userstatistics_user_unique'),
+        ),
+    ]
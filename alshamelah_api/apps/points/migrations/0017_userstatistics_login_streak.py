@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('points', '0016_userstatistics_user_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstatistics',
+            name='current_streak',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userstatistics',
+            name='last_login_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,7 @@
 import os
 
-from django.contrib.postgres.fields import JSONField
 from django.db import models
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from model_utils import Choices
 
@@ -55,6 +55,9 @@ class PointBadge(BaseModel):
 
 
 class Achievement(BaseModel):
+    from .managers import AchievementManager
+    objects = AchievementManager()
+    TIERS = ['diamond', 'gold', 'silver', 'bronze']
     TYPE_CHOICES = Choices(
         ('pages_read_number', _(u'Reading x number of pages')),
         ('books_read_finished', _(u'Finishing x number of books (Physical books)')),
@@ -107,11 +110,22 @@ class Achievement(BaseModel):
     def __str__(self):
         return '{}: {}'.format(self.TYPE_CHOICES[self.type], self.title)
 
+    def get_category(self, value):
+        """
+        Returns the highest tier reached by the value
+        """
+        for tier in self.TIERS:
+            if value >= getattr(self, tier):
+                return tier
+        return None
+
     class Meta:
         ordering = ['creation_time']
 
 
 class UserAchievement(BaseModel):
+    from .managers import UserAchievementManager
+    objects = UserAchievementManager()
     user = models.ForeignKey('users.User', related_name='achievements', verbose_name=_(u'User'), null=False,
                              on_delete=models.CASCADE)
     achievement = models.ForeignKey(Achievement, related_name='achievements', verbose_name=_(u'Achievement'), null=True,
@@ -138,6 +152,9 @@ class UserAchievement(BaseModel):
     def type(self):
         return self.achievement.type
 
+    class Meta:
+        unique_together = ('user', 'achievement')
+
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
         saved = super(UserAchievement, self).save(force_insert, force_update, using, update_fields)
@@ -150,7 +167,6 @@ class UserStatistics(BaseModel):
     objects = UserStatisticsManager()
     user = models.ForeignKey('users.User', related_name='statistics', verbose_name=_(u'User'), null=False,
                              on_delete=models.CASCADE)
-    reads = JSONField(null=True)  #
     book_note_count = models.PositiveSmallIntegerField(default=0)
     user_note_count = models.PositiveSmallIntegerField(default=0)
     book_highlight_count = models.PositiveSmallIntegerField(default=0)
@@ -167,12 +183,57 @@ class UserStatistics(BaseModel):
     minutes_listened = models.PositiveSmallIntegerField(default=0)
     audio_book_finished_count = models.PositiveSmallIntegerField(default=0)
     book_read_count = models.PositiveSmallIntegerField(default=0) #
-    page_read_count = models.PositiveSmallIntegerField(default=0) #
+    page_read_count = models.PositiveIntegerField(default=0) #
     book_listened_count = models.PositiveSmallIntegerField(default=0)
     max_book_pages_read = models.PositiveSmallIntegerField(default=0) #
     max_book_audio_minutes_listened = models.PositiveSmallIntegerField(default=0)
     max_consecutive_login_days = models.PositiveSmallIntegerField(default=0)
+    # the streak ending on the last login day, kept by UserStatistics.objects.consecutive_login
+    current_streak = models.PositiveSmallIntegerField(default=0)
+    last_login_date = models.DateField(null=True, blank=True)
     max_daily_read = models.PositiveSmallIntegerField(default=0) #
     max_daily_listen = models.PositiveSmallIntegerField(default=0)
-    daily_read = JSONField(null=True) #
-    daily_listen = JSONField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='points_userstatistics_user_unique'),
+        ]
+
+
+class UserPageRead(models.Model):
+    from .managers import UserPageReadManager
+    objects = UserPageReadManager()
+    user = models.ForeignKey('users.User', related_name='page_reads', verbose_name=_(u'User'), null=False,
+                             on_delete=models.CASCADE)
+    book = models.ForeignKey('books.Book', related_name='page_reads', verbose_name=_(u'Book'), null=False,
+                             on_delete=models.CASCADE)
+    page = models.PositiveIntegerField(verbose_name=_(u'Page'))
+    creation_time = models.DateTimeField(auto_now_add=True, null=True)
+
+    class Meta:
+        unique_together = ('user', 'book', 'page')
+
+
+class UserDailyActivity(models.Model):
+    from .managers import UserDailyActivityManager
+    objects = UserDailyActivityManager()
+    TYPE_CHOICES = Choices(
+        ('read', _(u'Read')),
+        ('listen', _(u'Listen')),
+    )
+    user = models.ForeignKey('users.User', related_name='daily_activities', verbose_name=_(u'User'), null=False,
+                             on_delete=models.CASCADE)
+    day = models.DateField(verbose_name=_(u'Day'))
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES, verbose_name=_(u'Type'))
+    book = models.ForeignKey('books.Book', related_name='daily_activities', verbose_name=_(u'Book'), null=False,
+                             on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('user', 'day', 'type', 'book')
+        verbose_name_plural = 'User daily activities'
+
+
+@receiver(models.signals.post_save, sender=Achievement)
+@receiver(models.signals.post_delete, sender=Achievement)
+def clear_achievement_thresholds(sender, instance, **kwargs):
+    Achievement.objects.clear_thresholds()
@@ -0,0 +1,65 @@
+import threading
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import UserStatistics
+from ..books.models import Book, BookPage
+from ..core.factories import create_user
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs parallel connections to a database server')
+@override_settings(JOB_QUEUE_EAGER=1)
+class UserStatisticsConcurrencyTests(TransactionTestCase):
+    threads = 8
+    requests = 10
+
+    def setUp(self):
+        self.user = create_user()
+
+    def run_in_parallel(self, request):
+        """
+        Sends the requests of every thread through its own client and database connection, the barrier lets them start
+        at the same time. request(client, thread, index) returns the response
+        """
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run(thread):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                for index in range(self.requests):
+                    response = request(client, thread, index)
+                    if response.status_code >= 300:
+                        errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=[thread]) for thread in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_parallel_shares_are_all_counted(self):
+        self.run_in_parallel(lambda client, thread, index: client.post('/api/v1/user/share/app/'))
+
+        self.assertEqual(UserStatistics.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(UserStatistics.objects.get(user=self.user).app_share_count, self.threads * self.requests)
+
+    def test_parallel_page_reads_are_all_counted(self):
+        book = Book.objects.create(title='book', approved=True, page_count=self.threads * self.requests)
+        BookPage.objects.build(book, [{'text': 'page %d' % number} for number in range(self.threads * self.requests)])
+
+        # every thread reads its own pages, all of them are new
+        self.run_in_parallel(lambda client, thread, index: client.get(
+            '/api/v1/books/%d/view/' % book.id, {'page': thread * self.requests + index + 1}))
+
+        self.assertEqual(UserStatistics.objects.get(user=self.user).page_read_count, self.threads * self.requests)
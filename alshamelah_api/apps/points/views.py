@@ -3,7 +3,7 @@ from rest_framework import viewsets, mixins, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from .models import UserPoints, UserAchievement, Achievement
+from .models import UserPoints, UserAchievement, Achievement, UserStatistics
 from .serializers import UserPointsSerializer, UserAchievementSerializer, AchievementSerializer
 
 
@@ -23,7 +23,12 @@ class UserPointsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
                 (paper_approved if paper_approved else 0) + \
                 (thesis_approved if thesis_approved else 0) + \
                 (audio_approved if audio_approved else 0)
-        user_achievements = UserAchievement.objects.filter(user_id=request.user.id)
+        user_achievements = list(UserAchievement.objects.select_related('achievement').filter(user_id=request.user.id))
+        # the stored points only change with the tier, the current ones come from the statistics
+        statistics = UserStatistics.objects.filter(user_id=request.user.id).first()
+        for achievement in user_achievements:
+            if statistics and achievement.achievement:
+                achievement.points = UserStatistics.objects.get_metric(statistics, achievement.type)
         achievements = UserAchievementSerializer(user_achievements,
                                                  context={'request': request}, many=True)
         all_achievements = Achievement.objects.all() if not user_achievements else Achievement.objects.all().exclude(
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...services import NotificationDispatcher, FakeFCMTransport
+from ....core.db import check_connections
+
+
+class Command(BaseCommand):
+    help = 'Pushes the pending notifications in batches, runs until stopped unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Notifications claimed per batch')
+        parser.add_argument('--sleep', type=float, default=2, help='Seconds to wait when nothing is pending')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Attempts before a push is marked failed')
+        parser.add_argument('--backoff', type=int, default=30, help='Seconds before the first retry, doubled after')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is pending')
+        parser.add_argument('--fake', action='store_true', help='Record the pushes instead of sending them')
+
+    def handle(self, *args, **options):
+        transport = FakeFCMTransport() if options['fake'] else None
+        dispatcher = NotificationDispatcher(transport, batch_size=options['batch'],
+                                            max_attempts=options['max_attempts'], backoff=options['backoff'])
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                check_connections()
+                count = dispatcher.dispatch()
+                total += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        if isinstance(dispatcher.transport, FakeFCMTransport):
+            for push in dispatcher.transport.sent:
+                self.stdout.write('{title}: {message} -> {count} devices'.format(
+                    title=push['title'], message=push['message'], count=len(push['device_ids'])))
+        self.stdout.write(self.style.SUCCESS('Handled {count} notifications'.format(count=total)))
@@ -1,7 +1,7 @@
 import datetime
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from .enums import OTPStatus, OTPTypes
@@ -103,3 +103,50 @@ class Utilities(object):
             res.append(str(random.randint(0, 9)))
 
         return ''.join(res)
+
+
+class NotificationManager(models.Manager):
+    """
+    The notifications double as the push outbox, request handlers only insert them and the dispatcher claims the
+    pending ones in batches
+    """
+    lease = 300
+    max_backoff = 3600
+
+    def claim(self, batch_size):
+        """
+        Locks a batch of the due pending notifications for the lease period and returns them, other workers skip
+        the locked and leased rows
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            pks = list(self.get_queryset().select_for_update(skip_locked=True)
+                       .filter(push_status='pending')
+                       .filter(models.Q(push_after__isnull=True) | models.Q(push_after__lte=now))
+                       .order_by('id').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return []
+            self.get_queryset().filter(pk__in=pks).update(
+                push_after=now + datetime.timedelta(seconds=self.lease), push_attempts=models.F('push_attempts') + 1)
+        return list(self.get_queryset().select_related('user__notification_setting').filter(pk__in=pks)
+                    .order_by('id'))
+
+    def mark(self, notifications, status):
+        if notifications:
+            self.get_queryset().filter(pk__in=[notification.pk for notification in notifications]) \
+                .update(push_status=status, push_after=None)
+
+    def retry(self, notifications, max_attempts, backoff):
+        """
+        Schedules the notifications again with an exponential backoff, the ones out of attempts are marked failed
+        """
+        failed = [notification for notification in notifications if notification.push_attempts >= max_attempts]
+        self.mark(failed, 'failed')
+        delays = {}
+        for notification in notifications:
+            if notification.push_attempts < max_attempts:
+                delay = min(backoff * 2 ** (notification.push_attempts - 1), self.max_backoff)
+                delays.setdefault(delay, []).append(notification.pk)
+        now = timezone.now()
+        for delay, pks in delays.items():
+            self.get_queryset().filter(pk__in=pks).update(push_after=now + datetime.timedelta(seconds=delay))
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_auto_20200718_1209'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='push_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Push After'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='push_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Push Attempts'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='push_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('coalesced', 'Coalesced'), ('failed', 'Failed'), ('skipped', 'Skipped')], default='skipped', max_length=10, verbose_name='Push Status'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(push_status='pending'), fields=['push_after'], name='users_notification_push_idx'),
+        ),
+    ]
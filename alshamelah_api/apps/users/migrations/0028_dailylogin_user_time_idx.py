@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0027_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailylogin',
+            index=models.Index(fields=['user', 'creation_time'], name='users_dailylogin_user_time_idx'),
+        ),
+    ]
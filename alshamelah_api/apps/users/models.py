@@ -10,7 +10,7 @@ from easy_thumbnails.fields import ThumbnailerImageField
 from model_utils import Choices
 
 from .enums import OTPTypes
-from .managers import EmailOTPManager, PhoneOTPManager, PasswordOTPManager
+from .managers import EmailOTPManager, PhoneOTPManager, PasswordOTPManager, NotificationManager
 
 
 class User(AbstractUser):
@@ -135,6 +135,12 @@ class DailyLogin(models.Model):
     user = models.ForeignKey(User, related_name='logins', verbose_name=_(u'logins'), on_delete=models.CASCADE)
     creation_time = models.DateTimeField(auto_now_add=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'creation_time'], name='users_dailylogin_user_time_idx'),
+        ]
+
+
 class NotificationSetting(models.Model):
     user = models.OneToOneField(User, related_name='notification_setting', verbose_name=_(u'Notification Setting'),
                                 on_delete=models.CASCADE)
@@ -174,9 +180,25 @@ class Notification(models.Model):
     type = models.CharField(choices=TYPE_CHOICES, max_length=20, verbose_name=_(u'Type'))
     message = models.CharField(max_length=1000, verbose_name=_(u'Message'))
     read = models.BooleanField(verbose_name=_(u'Read'), default=False, null=True)
+    PUSH_STATUS_CHOICES = Choices(
+        ('pending', _(u'Pending')),
+        ('sent', _(u'Sent')),
+        ('coalesced', _(u'Coalesced')),
+        ('failed', _(u'Failed')),
+        ('skipped', _(u'Skipped')),
+    )
+    push_status = models.CharField(choices=PUSH_STATUS_CHOICES, max_length=10, default='skipped',
+                                   verbose_name=_(u'Push Status'))
+    push_attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_(u'Push Attempts'))
+    push_after = models.DateTimeField(null=True, blank=True, verbose_name=_(u'Push After'))
+    objects = NotificationManager()
 
     class Meta:
         ordering = ['-read', '-creation_time']
+        indexes = [
+            models.Index(fields=['push_after'], name='users_notification_push_idx',
+                         condition=models.Q(push_status='pending')),
+        ]
 
 
 class CustomNotification(models.Model):
@@ -8,27 +8,6 @@ from .models import Notification, NotificationSetting
 
 class FCMService(object):
 
-    @staticmethod
-    def send(title: str, message: str, device_id=None, device_ids=None):
-        if not device_id and not device_ids:
-            return None
-        result = None
-        push_service = FCMNotification(api_key=settings.FCM_API_KEY)
-
-        # OR initialize with proxies
-
-        # Your api-key can be gotten from:  https://console.firebase.google.com/project/<project-name>/settings/cloudmessaging
-
-        if device_id:
-            result = push_service.notify_single_device(registration_id=device_id, message_title=str(title),
-                                                       message_body=str(message))
-            print(result)
-        elif device_ids:  # Send to multiple devices by passing a list of ids.
-            result = push_service.notify_multiple_devices(registration_ids=device_ids, message_title=str(title),
-                                                          message_body=str(message))
-            print(result)
-        return result
-
     @staticmethod
     def notify_book_approved(user):
         device_id = FCMService._get_device_id(user)
@@ -124,31 +103,22 @@ class FCMService(object):
 
     @staticmethod
     def notify(title: str, message: str, notification_type: str, user=None, user_ids=None, send=True):
-        device_ids = []
-        device_id = None
+        """
+        Records the notification, the ones to push are left pending for the dispatcher
+        """
         if not title or not message:
             return None
         if user:
             device_id = FCMService._get_device_id(user)
-            Notification.objects.create(title=title, message=message, user_id=user.id, type=notification_type)
-        elif user_ids:
-            device_ids = NotificationSetting.objects.filter(user_id__in=user_ids, enabled=True,
-                                                            admin_notifications=True).values_list('device_id',
-                                                                                                  flat=True)
-            Notification.objects.bulk_create(list(
-                [Notification(title=title, message=message, user_id=pk, type=notification_type) for pk in
-                 user_ids]))
-            if not device_ids:
-                return None
-        elif device_id:
-            pass
-        else:
-            return None
-        if send:
-            try:
-                return FCMService.send(title, message, device_id=device_id, device_ids=device_ids)
-            except:
-                pass
+            return Notification.objects.create(title=title, message=message, user_id=user.id, type=notification_type,
+                                               push_status='pending' if send and device_id else 'skipped')
+        if user_ids:
+            push_user_ids = set(NotificationSetting.objects.filter(user_id__in=user_ids, enabled=True,
+                                                                   admin_notifications=True)
+                                .exclude(device_id='').values_list('user_id', flat=True)) if send else set()
+            return Notification.objects.bulk_create(list(
+                [Notification(title=title, message=message, user_id=pk, type=notification_type,
+                              push_status='pending' if pk in push_user_ids else 'skipped') for pk in user_ids]))
         return None
 
     @staticmethod
@@ -157,3 +127,99 @@ class FCMService(object):
                                'notification_setting') and user.notification_setting.device_id and user.notification_setting.enabled:
             return user.notification_setting.device_id
         return None
+
+
+class FCMTransport(object):
+    """
+    Pushes through a single FCM client, its http session keeps the connections to FCM open between batches
+    """
+
+    def __init__(self):
+        self.client = FCMNotification(api_key=settings.FCM_API_KEY)
+
+    def send(self, title, message, device_ids):
+        """
+        Returns the error of every device (None when delivered)
+        """
+        result = self.client.notify_multiple_devices(registration_ids=device_ids, message_title=str(title),
+                                                     message_body=str(message))
+        results = result.get('results', []) if result else []
+        return [results[index].get('error') if index < len(results) else None for index in range(len(device_ids))]
+
+
+class FakeFCMTransport(object):
+    """
+    Records the pushes instead of sending them, the errors map device ids to the error FCM would return
+    """
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    def send(self, title, message, device_ids):
+        self.sent.append({'title': str(title), 'message': str(message), 'device_ids': list(device_ids)})
+        return [self.errors.get(device_id) for device_id in device_ids]
+
+
+class NotificationDispatcher(object):
+    """
+    Drains the pending notifications: the exact duplicates (same user, type, title and message) in a batch are
+    coalesced into the latest one, the identical messages are pushed to all of their devices at once and the temporary
+    failures are retried with an exponential backoff
+    """
+    retry_errors = ['Unavailable', 'InternalServerError', 'DeviceMessageRateExceeded']
+
+    def __init__(self, transport=None, batch_size=100, max_attempts=5, backoff=30):
+        self.transport = transport if transport else NotificationDispatcher.get_transport()
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    @staticmethod
+    def get_transport():
+        return FakeFCMTransport() if settings.FCM_TRANSPORT == 'fake' else FCMTransport()
+
+    def dispatch(self):
+        """
+        Pushes one batch, returns the number of notifications handled
+        """
+        notifications = Notification.objects.claim(self.batch_size)
+        if not notifications:
+            return 0
+        latest = {}
+        for notification in notifications:
+            latest[self.get_coalesce_key(notification)] = notification
+        Notification.objects.mark([notification for notification in notifications
+                                   if latest[self.get_coalesce_key(notification)] is not notification], 'coalesced')
+        skipped = []
+        messages = {}
+        for notification in latest.values():
+            device_id = FCMService._get_device_id(notification.user)
+            if device_id:
+                messages.setdefault((notification.title, notification.message), []).append((device_id, notification))
+            else:
+                skipped.append(notification)
+        Notification.objects.mark(skipped, 'skipped')
+        sent, failed, retry = [], [], []
+        for (title, message), recipients in messages.items():
+            try:
+                errors = self.transport.send(title, message, [device_id for device_id, notification in recipients])
+            except Exception:
+                retry.extend(notification for device_id, notification in recipients)
+                continue
+            for (device_id, notification), error in zip(recipients, errors):
+                if not error:
+                    sent.append(notification)
+                elif error in self.retry_errors:
+                    retry.append(notification)
+                else:
+                    failed.append(notification)
+        Notification.objects.mark(sent, 'sent')
+        Notification.objects.mark(failed, 'failed')
+        Notification.objects.retry(retry, self.max_attempts, self.backoff)
+        return len(notifications)
+
+    @staticmethod
+    def get_coalesce_key(notification):
+        # two achievements or two point awards of the same type are different notifications, only repeats are dropped
+        return notification.user_id, notification.type, notification.title, notification.message
@@ -1 +1,36 @@
-# Create your tests here.
+from django.test import TestCase
+
+from .models import Notification, NotificationSetting
+from .services import NotificationDispatcher, FakeFCMTransport
+from ..core.factories import create_user
+
+
+class NotificationDispatcherTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        NotificationSetting.objects.create(user=self.user, device_id='device')
+        self.transport = FakeFCMTransport()
+
+    def notify(self, title, message, notification_type='achievement_awarded'):
+        return Notification.objects.create(user=self.user, title=title, message=message, type=notification_type,
+                                           push_status='pending')
+
+    def test_different_notifications_of_a_type_are_all_sent(self):
+        first = self.notify('New Achievement', 'Congratulations, you earned Reader (bronze)')
+        second = self.notify('New Achievement', 'Congratulations, you earned Listener (bronze)')
+
+        self.assertEqual(NotificationDispatcher(self.transport).dispatch(), 2)
+
+        self.assertEqual([push['message'] for push in self.transport.sent], [first.message, second.message])
+        self.assertEqual(set(Notification.objects.values_list('push_status', flat=True)), {'sent'})
+
+    def test_exact_duplicates_are_coalesced(self):
+        first = self.notify('Points', 'You earned 10 points', 'points_awarded')
+        second = self.notify('Points', 'You earned 10 points', 'points_awarded')
+
+        NotificationDispatcher(self.transport).dispatch()
+
+        self.assertEqual(len(self.transport.sent), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.push_status, second.push_status), ('coalesced', 'sent'))
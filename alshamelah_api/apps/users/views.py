@@ -22,6 +22,7 @@ from .serializers import UserSerializer, NoteSerializer, NotificationSerializer,
 # Create your views here.
 from ..sms.models import SMS
 from ..points.models import UserStatistics
+from ..core.pagination import CustomPageNumberPagination, CustomLimitOffsetPagination, KeysetCursorPagination
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -209,9 +210,19 @@ class UserNotificationsViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin, v
     permission_classes = [IsAuthenticated]
     serializer_class = NotificationSerializer
 
+    @property
+    def pagination_class(self):
+        if 'cursor' in self.request.query_params:
+            return KeysetCursorPagination
+        if 'offset' in self.request.query_params:
+            return CustomLimitOffsetPagination
+        else:
+            return CustomPageNumberPagination
+
     def get_queryset(self):
         return Notification.objects.filter(user_id=self.request.user.id)
 
+
 class DailyLoginView(views.APIView):
     permission_classes = [IsAuthenticated]
 
@@ -220,7 +231,9 @@ class DailyLoginView(views.APIView):
             return Response(_('Invalid request'),
                             status=status.HTTP_400_BAD_REQUEST)
         user = self.request.user
-        if not DailyLogin.objects.filter(user_id=user.id, creation_time__date=timezone.now().date()).exists():
+        # a range on creation_time (not its date) so the (user, creation_time) index is used
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        if not DailyLogin.objects.filter(user_id=user.id, creation_time__gte=today).exists():
             DailyLogin.objects.create(user_id=user.id)
             UserStatistics.objects.consecutive_login(user)
         return Response(1,status=status.HTTP_201_CREATED)
@@ -0,0 +1,43 @@
+# Gunicorn configuration, used with `gunicorn alshamelah.wsgi:application -c gunicorn.conf.py`
+#
+# GUNICORN_WORKER_CLASS picks the worker profile:
+#   gthread (default)  every worker process serves GUNICORN_THREADS requests at once, a request waiting on postgres,
+#                      FCM, Twilio or MyFatoorah only holds its thread. Every thread keeps its own database connection
+#                      (workers * threads in total, see SQL_CONN_MAX_AGE and docker-compose.pgbouncer.yml)
+#   gevent             cooperative greenlets, needs the gevent and psycogreen packages. Run it with
+#                      SQL_CONN_MAX_AGE=0 (or behind pgbouncer), greenlets do not reuse their connections
+#   sync               one request per worker process
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# the i/o bound workers need fewer processes than the cpu bound sync ones
+workers = int(os.environ.get('GUNICORN_WORKERS', cpu_count * 2 + 1 if worker_class == 'sync' else cpu_count + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# recycle the workers regularly so a leak can not grow without bound, the jitter spreads the restarts
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', None)
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the whole process unless it yields to the gevent loop
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed, database calls block the gevent worker')
+        else:
+            patch_psycopg()